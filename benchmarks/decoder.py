@@ -0,0 +1,123 @@
+"""Compare the compiled event decoders against generic ABI decoding.
+
+    python benchmarks/decoder.py [--number N]
+
+Every case is timed against `interpret`, which decodes each event by walking
+the ABI definitions the way starknet_py's `FunctionCallSerializer` does, and
+also against the serializer itself when starknet_py can be imported. The
+expected decoder outputs are pinned in tests/test_decoder.py. Payloads are
+plain ints so only the decoding itself is measured.
+"""
+import argparse
+import random
+import timeit
+
+from indexer.decoder import (
+    adventurer_update_state_abi,
+    adventurer_update_state_decoder,
+    adventurer_state_abi,
+    bid_abi,
+    item_merchant_update_abi,
+    item_merchant_update_decoder,
+    item_state_abi,
+    mint_adventurer_abi,
+    mint_adventurer_decoder,
+    uint256_abi,
+)
+
+CASES = [
+    ("MintAdventurer", mint_adventurer_decoder, mint_adventurer_abi, [uint256_abi]),
+    (
+        "UpdateAdventurerState",
+        adventurer_update_state_decoder,
+        adventurer_update_state_abi,
+        [uint256_abi, adventurer_state_abi],
+    ),
+    (
+        "ItemMerchantUpdate",
+        item_merchant_update_decoder,
+        item_merchant_update_abi,
+        [item_state_abi, bid_abi],
+    ),
+]
+
+
+def _is_uint256(struct):
+    return [member["name"] for member in struct["members"]] == ["low", "high"]
+
+
+def _take(type_name, values, structs):
+    # the steps of starknet_py's transformers: members are read in order,
+    # offsets are not used
+    if type_name == "felt":
+        return next(values)
+    struct = structs[type_name]
+    if _is_uint256(struct):
+        low, high = next(values), next(values)
+        return (high << 128) + low
+    return {
+        member["name"]: _take(member["type"], values, structs)
+        for member in struct["members"]
+    }
+
+
+def interpret(abi, type_abis):
+    """Return a decoder walking the ABI definitions on every call, like
+    starknet_py's `FunctionCallSerializer.to_python` does."""
+
+    def decode(data):
+        structs = {type_abi["name"]: type_abi for type_abi in type_abis}
+        values = iter(data)
+        result = tuple(
+            _take(output["type"], values, structs) for output in abi["outputs"]
+        )
+        if next(values, None) is not None:
+            raise ValueError("too many values")
+        return result
+
+    return decode
+
+
+def _timing(label, reference, data, compiled, number):
+    seconds = timeit.timeit(lambda: reference(data), number=number)
+    return (
+        f"  {label} {seconds / number * 1e6:8.2f} us/event"
+        f"  speedup {seconds / compiled:5.1f}x"
+    )
+
+
+def serializer_for(abi, type_abis):
+    try:
+        from starknet_py.contract import identifier_manager_from_abi
+        from starknet_py.utils.data_transformer import FunctionCallSerializer
+    except ImportError:
+        return None
+    serializer = FunctionCallSerializer(
+        abi=abi, identifier_manager=identifier_manager_from_abi([abi, *type_abis])
+    )
+    return serializer.to_python
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=100_000)
+    args = parser.parse_args()
+
+    for name, decoder, abi, type_abis in CASES:
+        data = [random.getrandbits(128) for _ in range(decoder.size)]
+        compiled = timeit.timeit(lambda: decoder(data), number=args.number)
+        line = f"{name:24} compiled {compiled / args.number * 1e6:8.2f} us/event"
+
+        generic = interpret(abi, type_abis)
+        assert tuple(decoder(data)) == generic(data), name
+        line += _timing("interpreted", generic, data, compiled, args.number)
+
+        serializer = serializer_for(abi, type_abis)
+        if serializer is not None:
+            assert tuple(decoder(data)) == tuple(serializer(data)), name
+            line += _timing("serializer", serializer, data, compiled, args.number)
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
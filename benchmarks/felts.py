@@ -0,0 +1,59 @@
+"""Compare `felts_to_ints` and `felt_to_bytes` against apibara's felt helpers.
+
+    python benchmarks/felts.py [--number N]
+
+Events carry a repeated `FieldElement` field. Most of their values are small
+game values, the rest are addresses and hashes filling every limb. Reading
+the protobuf elements and their limbs dominates both conversions.
+"""
+import argparse
+import random
+import timeit
+
+from apibara.starknet import felt
+from apibara.starknet.proto.starknet_pb2 import Event
+
+from indexer.utils import felt_to_bytes, felts_to_ints
+
+
+def event_data(size, large):
+    event = Event()
+    for i in range(size):
+        value = random.getrandbits(251) if i < large else random.getrandbits(16)
+        event.data.append(felt.from_int(value))
+    return event.data
+
+
+def best(function, number):
+    return min(timeit.repeat(function, number=number, repeat=5))
+
+
+def report(name, baseline, optimized, number):
+    print(
+        f"{name:28} felt helpers {baseline / number * 1e6:7.2f} us"
+        f"  indexer.utils {optimized / number * 1e6:7.2f} us"
+        f"  speedup {baseline / optimized:4.1f}x"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20_000)
+    args = parser.parse_args()
+
+    for size, large in [(6, 0), (30, 2), (19, 19)]:
+        data = event_data(size, large)
+        assert felts_to_ints(data) == [felt.to_int(f) for f in data]
+        baseline = best(lambda: [felt.to_int(f) for f in data], args.number)
+        optimized = best(lambda: felts_to_ints(data), args.number)
+        report(f"{size} felts, {large} large", baseline, optimized, args.number)
+
+    value = data[0]
+    assert felt_to_bytes(value) == bytes.fromhex(felt.to_hex(value)[2:])
+    baseline = best(lambda: bytes.fromhex(felt.to_hex(value)[2:]), args.number)
+    optimized = best(lambda: felt_to_bytes(value), args.number)
+    report("tx hash to bytes", baseline, optimized, args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_right
+
+from apibara.starknet.proto.starknet_pb2 import Block
+
+# every frame is a big-endian length followed by one serialized `Block`
+_frame_header = struct.Struct(">I")
+# the `.idx` file next to an archive holds one (block number, offset) per frame
+_index_entry = struct.Struct(">QQ")
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+class BlockWriter:
+    """Append raw `Block` messages to an archive and its offset index.
+
+    Blocks must come in increasing block number order, after the last block
+    already in the archive, if any.
+    """
+
+    def __init__(self, path):
+        self.last_block = None
+        if os.path.exists(path):
+            with BlockArchive(path) as archive:
+                self.last_block = archive.last_block
+                # the index may be missing or behind, append to a complete one
+                with open(index_path(path), "wb") as f:
+                    for entry in zip(archive.numbers, archive.offsets):
+                        f.write(_index_entry.pack(*entry))
+        self._file = open(path, "ab")
+        self._index = open(index_path(path), "ab")
+
+    def write(self, raw, block_number):
+        if self.last_block is not None and block_number <= self.last_block:
+            raise ValueError(
+                f"block {block_number} is not after the last archived block"
+                f" {self.last_block}"
+            )
+        self.last_block = block_number
+        self._index.write(_index_entry.pack(block_number, self._file.tell()))
+        self._file.write(_frame_header.pack(len(raw)))
+        self._file.write(raw)
+
+    def close(self):
+        self._file.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BlockArchive:
+    """Memory-mapped, read-only view of an archive.
+
+    Frames are located through the offset index, which is rebuilt from the
+    frames themselves when it is missing or behind the archive.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.numbers = array("Q")
+        self.offsets = array("Q")
+        with open(path, "rb") as f:
+            self.size = os.fstat(f.fileno()).st_size
+            self._mmap = (
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+            )
+        self._load_index()
+
+    @property
+    def first_block(self):
+        return self.numbers[0] if self.numbers else None
+
+    @property
+    def last_block(self):
+        return self.numbers[-1] if self.numbers else None
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def blocks(self, after=None, until=None):
+        """Yield the block number and raw message of the frames in (`after`, `until`]."""
+        view = memoryview(self._mmap)
+        start = 0 if after is None else bisect_right(self.numbers, after)
+        stop = len(self.numbers) if until is None else bisect_right(self.numbers, until)
+        for i in range(start, stop):
+            offset = self.offsets[i] + _frame_header.size
+            (size,) = _frame_header.unpack_from(view, self.offsets[i])
+            yield self.numbers[i], view[offset : offset + size]
+
+    def close(self):
+        if not self.size:
+            return
+        try:
+            self._mmap.close()
+        except BufferError:
+            # frames still referenced by the caller, unmapped with the last one
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _load_index(self):
+        try:
+            with open(index_path(self.path), "rb") as f:
+                entries = f.read()
+        except FileNotFoundError:
+            entries = b""
+        for number, offset in _index_entry.iter_unpack(
+            entries[: len(entries) - len(entries) % _index_entry.size]
+        ):
+            if offset >= self.size:
+                break
+            self.numbers.append(number)
+            self.offsets.append(offset)
+
+        # frames written after the index, or an archive without one
+        offset = 0
+        if self.offsets:
+            (size,) = _frame_header.unpack_from(self._mmap, self.offsets[-1])
+            offset = self.offsets[-1] + _frame_header.size + size
+            if offset > self.size:
+                raise ValueError(f"truncated frame in {self.path}")
+        while offset < self.size:
+            if offset + _frame_header.size > self.size:
+                raise ValueError(f"truncated frame header in {self.path}")
+            (size,) = _frame_header.unpack_from(self._mmap, offset)
+            end = offset + _frame_header.size + size
+            if end > self.size:
+                raise ValueError(f"truncated frame in {self.path}")
+            block = Block.FromString(self._mmap[offset + _frame_header.size : end])
+            self.numbers.append(block.header.block_number)
+            self.offsets.append(offset)
+            offset = end
@@ -0,0 +1,140 @@
+import asyncio
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from apibara.indexer import Info
+from apibara.indexer.storage import IndexerStorage
+from apibara.starknet.cursor import starknet_cursor
+
+from indexer.archive import BlockArchive
+from indexer.log import logger
+from indexer.storage import OpLog, invalidate_after
+from indexer.utils import felt_to_bytes
+
+# blocks handed to a worker at a time
+CHUNK_SIZE = 500
+
+
+def build_blocks(indexer_class, config, path, after, until):
+    """Worker: return the op logs of the archived blocks in (`after`, `until`]."""
+    return asyncio.run(_build_blocks(indexer_class(config), path, after, until))
+
+
+async def _build_blocks(indexer, path, after, until):
+    indexer.initial_configuration()
+    built = []
+    with BlockArchive(path) as archive:
+        for block_number, raw in archive.blocks(after=after, until=until):
+            block = indexer.decode_data(raw)
+            ops = OpLog()
+            await indexer.handle_events(ops, block)
+            built.append(
+                (
+                    block_number,
+                    felt_to_bytes(block.header.block_hash),
+                    block.header.timestamp.seconds,
+                    ops,
+                )
+            )
+    return built
+
+
+async def built_blocks(indexer, path, after, workers, chunk_size=CHUNK_SIZE):
+    """Yield the archived blocks after `after` with their op logs, in block order.
+
+    Chunks of blocks are built by `workers` processes, a few chunks ahead of
+    the one being yielded.
+    """
+    with BlockArchive(path) as archive:
+        numbers = [number for number in archive.numbers if number > after]
+    chunks = iter(
+        [
+            (numbers[i] - 1, numbers[min(i + chunk_size, len(numbers)) - 1])
+            for i in range(0, len(numbers), chunk_size)
+        ]
+    )
+
+    loop = asyncio.get_running_loop()
+    # spawned, the parent holds Mongo connections and a running event loop
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context) as executor:
+
+        def submit(chunk):
+            return loop.run_in_executor(
+                executor,
+                build_blocks,
+                type(indexer),
+                indexer.config,
+                path,
+                *chunk,
+            )
+
+        pending = deque(submit(chunk) for chunk in islice(chunks, workers * 2))
+        while pending:
+            built = await pending.popleft()
+            chunk = next(chunks, None)
+            if chunk is not None:
+                pending.append(submit(chunk))
+            for block in built:
+                yield block
+
+
+async def backfill_from_archive(
+    indexer, path, mongo_url, ctx=None, restart=False, workers=1
+):
+    """Index the blocks of the archive at `path` the runner has not stored yet.
+
+    Blocks are stored with the same cursor bookkeeping as `IndexerRunner`,
+    so the runner resumes from the last archived block. With more than one
+    worker, events are decoded and turned into writes in worker processes
+    and only the writes are applied here, in block order.
+    """
+    storage = IndexerStorage(mongo_url, indexer.indexer_id())
+    if restart:
+        storage.drop_database()
+    configuration = indexer.initial_configuration()
+    if storage.update_with_stored_configuration(configuration):
+        # invalidate old pending data, if any
+        invalidate_after(storage, configuration.starting_cursor)
+    indexer.cache.clear()
+    after = configuration.starting_cursor.order_key
+
+    with BlockArchive(path) as archive:
+        last_block = archive.last_block
+    logger.info(
+        "backfilling from archive",
+        extra={
+            "fields": {
+                "archive": path,
+                "from": after,
+                "to": last_block,
+                "workers": workers,
+            }
+        },
+    )
+
+    if workers > 1:
+        async for block_number, block_hash, timestamp, ops in built_blocks(
+            indexer, path, after, workers
+        ):
+            cursor = starknet_cursor(block_number, block_hash)
+            with storage.create_storage_for_data(cursor) as block_storage:
+                info = Info(
+                    context=ctx, storage=block_storage, cursor=cursor, end_cursor=cursor
+                )
+                await indexer.handle_ops(info, block_number, timestamp, ops)
+        return
+
+    with BlockArchive(path) as archive:
+        for block_number, raw in archive.blocks(after=after):
+            block = indexer.decode_data(raw)
+            cursor = starknet_cursor(
+                block_number, felt_to_bytes(block.header.block_hash)
+            )
+            with storage.create_storage_for_data(cursor) as block_storage:
+                info = Info(
+                    context=ctx, storage=block_storage, cursor=cursor, end_cursor=cursor
+                )
+                await indexer.handle_data(info, block)
@@ -0,0 +1,75 @@
+from collections import OrderedDict
+
+
+class EntityCache:
+    """Bounded LRU cache of the current version of hot entities.
+
+    Entries are keyed by `(collection, field, value)` for the lookup fields
+    in `KEYS`. A document is reachable under each key field it has. Key
+    fields are not changed once set, but some are only set later, like the
+    `id` of a market item when it is claimed, and the document is reachable
+    under that key from the next `put`. Every entry remembers the
+    block that produced it, so a chain reorganisation can drop everything
+    newer than the block it rolls back to.
+    """
+
+    KEYS = {
+        "adventurers": ("id",),
+        "beasts": ("id",),
+        "items": ("id", "marketId"),
+        "heists": ("thiefId",),
+        "leaderboard": ("adventurerId",),
+        "adventurerStats": ("adventurerId",),
+    }
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def key_for(self, collection, filter):
+        if len(filter) != 1:
+            return None
+        ((field, value),) = filter.items()
+        if value is None or field not in self.KEYS.get(collection, ()):
+            return None
+        return (collection, field, value)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, collection, doc, block_number):
+        for field in self.KEYS.get(collection, ()):
+            value = doc.get(field)
+            if value is None:
+                continue
+            key = (collection, field, value)
+            self._entries[key] = (block_number, doc)
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def discard(self, collection, doc, doc_id):
+        for field in self.KEYS.get(collection, ()):
+            key = (collection, field, doc.get(field))
+            entry = self._entries.get(key)
+            if entry is not None and entry[1]["_id"] == doc_id:
+                del self._entries[key]
+
+    def invalidate(self, block_number):
+        """Drop every entry produced after `block_number`."""
+        stale = [
+            key for key, (block, _) in self._entries.items() if block > block_number
+        ]
+        for key in stale:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
@@ -1,8 +1,7 @@
-from starknet_py.contract import identifier_manager_from_abi
-from starknet_py.utils.data_transformer import FunctionCallSerializer
-from apibara.starknet import felt
+from collections import namedtuple
 
-from typing import Iterator
+
+from indexer.utils import felts_to_ints
 
 ## TYPES
 uint256_abi = {
@@ -351,234 +350,204 @@ item_merchant_update_abi = {
 }
 
 
+## DECODER COMPILER
+
+
+def _field_source(type_name, offset, structs):
+    """Return the expression reading `type_name` at `offset` and its size."""
+    if type_name == "felt":
+        return f"d[{offset}]", 1
+    if type_name == "Uint256":
+        return f"d[{offset}] + (d[{offset + 1}] << 128)", 2
+    struct = structs[type_name]
+    members = []
+    for member in struct["members"]:
+        source, _ = _field_source(member["type"], offset + member["offset"], structs)
+        members.append(f"{member['name']!r}: {source}")
+    return "{" + ", ".join(members) + "}", struct["size"]
+
+
+def compile_decoder(event_abi, *type_abis):
+    """Compile `event_abi` into a function decoding a list of ints into a record.
+
+    Field offsets are resolved once, here, and the generated function reads
+    every value with a constant index. Results match starknet_py's
+    `FunctionCallSerializer.to_python`: `Uint256` becomes an int and other
+    structs become dicts.
+    """
+    structs = {abi["name"]: abi for abi in type_abis}
+    fields = []
+    offset = 0
+    for output in event_abi["outputs"]:
+        source, size = _field_source(output["type"], offset, structs)
+        fields.append(source)
+        offset += size
+    name = event_abi["name"]
+    record = namedtuple(name, [output["name"] for output in event_abi["outputs"]])
+    source = (
+        "def decode(d):\n"
+        f"    if len(d) != {offset}:\n"
+        f"        raise ValueError(f'{name} expects {offset} felts, got {{len(d)}}')\n"
+        f"    return record({', '.join(fields)})\n"
+    )
+    namespace = {"record": record}
+    exec(compile(source, f"<{name} decoder>", "exec"), namespace)
+    decode = namespace["decode"]
+    decode.record = record
+    decode.size = offset
+    return decode
+
+
 ## ADVENTURER DECODERS
 
-mint_adventurer_decoder = FunctionCallSerializer(
-    abi=mint_adventurer_abi,
-    identifier_manager=identifier_manager_from_abi([mint_adventurer_abi, uint256_abi]),
-)
+mint_adventurer_decoder = compile_decoder(mint_adventurer_abi, uint256_abi)
 
-adventurer_update_state_decoder = FunctionCallSerializer(
-    abi=adventurer_update_state_abi,
-    identifier_manager=identifier_manager_from_abi(
-        [adventurer_update_state_abi, uint256_abi, adventurer_state_abi]
-    ),
+adventurer_update_state_decoder = compile_decoder(
+    adventurer_update_state_abi, uint256_abi, adventurer_state_abi
 )
 
-adventurer_level_up_decoder = FunctionCallSerializer(
-    abi=adventurer_level_up_abi,
-    identifier_manager=identifier_manager_from_abi(
-        [adventurer_level_up_abi, uint256_abi]
-    ),
-)
+adventurer_level_up_decoder = compile_decoder(adventurer_level_up_abi, uint256_abi)
 
-discovery_decoder = FunctionCallSerializer(
-    abi=discovery_abi,
-    identifier_manager=identifier_manager_from_abi([discovery_abi, uint256_abi]),
-)
+discovery_decoder = compile_decoder(discovery_abi, uint256_abi)
 
-update_thief_state_decoder = FunctionCallSerializer(
-    abi=update_thief_state_abi,
-    identifier_manager=identifier_manager_from_abi(
-        [update_thief_state_abi, thief_state_abi]
-    ),
+update_thief_state_decoder = compile_decoder(
+    update_thief_state_abi, uint256_abi, thief_state_abi
 )
 
 
 def decode_mint_adventurer_event(data):
-    return mint_adventurer_decoder.to_python([felt.to_int(d) for d in data])
+    return mint_adventurer_decoder(felts_to_ints(data))
 
 
 def decode_update_adventurer_state_event(data):
-    return adventurer_update_state_decoder.to_python([felt.to_int(d) for d in data])
+    return adventurer_update_state_decoder(felts_to_ints(data))
 
 
 def decode_adventurer_level_up_event(data):
-    return adventurer_level_up_decoder.to_python([felt.to_int(d) for d in data])
+    return adventurer_level_up_decoder(felts_to_ints(data))
 
 
 def decode_discovery_event(data):
-    return discovery_decoder.to_python([felt.to_int(d) for d in data])
+    return discovery_decoder(felts_to_ints(data))
 
 
 def decode_update_thief_state_event(data):
-    return update_thief_state_decoder.to_python([felt.to_int(d) for d in data])
+    return update_thief_state_decoder(felts_to_ints(data))
 
 
 ## BEAST DECODERS
 
-create_beast_decoder = FunctionCallSerializer(
-    abi=create_beast_abi,
-    identifier_manager=identifier_manager_from_abi(
-        [create_beast_abi, uint256_abi, beast_state_abi]
-    ),
-)
+create_beast_decoder = compile_decoder(create_beast_abi, uint256_abi, beast_state_abi)
 
-beast_update_state_decoder = FunctionCallSerializer(
-    abi=beast_update_state_abi,
-    identifier_manager=identifier_manager_from_abi(
-        [beast_update_state_abi, uint256_abi, beast_state_abi]
-    ),
+beast_update_state_decoder = compile_decoder(
+    beast_update_state_abi, uint256_abi, beast_state_abi
 )
 
-beast_level_up_decoder = FunctionCallSerializer(
-    abi=beast_level_up_abi,
-    identifier_manager=identifier_manager_from_abi([beast_level_up_abi, uint256_abi]),
-)
+beast_level_up_decoder = compile_decoder(beast_level_up_abi, uint256_abi)
 
-beast_attacked_decoder = FunctionCallSerializer(
-    abi=beast_attacked_abi,
-    identifier_manager=identifier_manager_from_abi([beast_attacked_abi, uint256_abi]),
-)
+beast_attacked_decoder = compile_decoder(beast_attacked_abi, uint256_abi)
 
-adventurer_attacked_decoder = FunctionCallSerializer(
-    abi=adventurer_attacked_abi,
-    identifier_manager=identifier_manager_from_abi(
-        [adventurer_attacked_abi, uint256_abi]
-    ),
-)
+adventurer_attacked_decoder = compile_decoder(adventurer_attacked_abi, uint256_abi)
 
-fled_beast_decoder = FunctionCallSerializer(
-    abi=fled_beast_abi,
-    identifier_manager=identifier_manager_from_abi([fled_beast_abi, uint256_abi]),
-)
+fled_beast_decoder = compile_decoder(fled_beast_abi, uint256_abi)
 
-adventurer_ambushed_decoder = FunctionCallSerializer(
-    abi=adventurer_ambushed_abi,
-    identifier_manager=identifier_manager_from_abi(
-        [adventurer_ambushed_abi, uint256_abi]
-    ),
-)
+adventurer_ambushed_decoder = compile_decoder(adventurer_ambushed_abi, uint256_abi)
 
-update_gold_balance_decoder = FunctionCallSerializer(
-    abi=update_gold_balance_abi,
-    identifier_manager=identifier_manager_from_abi(
-        [update_gold_balance_abi, uint256_abi]
-    ),
-)
+update_gold_balance_decoder = compile_decoder(update_gold_balance_abi, uint256_abi)
 
 
 def decode_create_beast_event(data):
-    return create_beast_decoder.to_python([felt.to_int(d) for d in data])
+    return create_beast_decoder(felts_to_ints(data))
 
 
 def decode_beast_state_event(data):
-    return beast_update_state_decoder.to_python([felt.to_int(d) for d in data])
+    return beast_update_state_decoder(felts_to_ints(data))
 
 
 def decode_beast_level_up_event(data):
-    return beast_level_up_decoder.to_python([felt.to_int(d) for d in data])
+    return beast_level_up_decoder(felts_to_ints(data))
 
 
 def decode_beast_attacked_event(data):
-    return beast_attacked_decoder.to_python([felt.to_int(d) for d in data])
+    return beast_attacked_decoder(felts_to_ints(data))
 
 
 def decode_adventurer_attacked_event(data):
-    return adventurer_attacked_decoder.to_python([felt.to_int(d) for d in data])
+    return adventurer_attacked_decoder(felts_to_ints(data))
 
 
 def decode_fled_beast_event(data):
-    return fled_beast_decoder.to_python([felt.to_int(d) for d in data])
+    return fled_beast_decoder(felts_to_ints(data))
 
 
 def decode_adventurer_ambushed_event(data):
-    return adventurer_attacked_decoder.to_python([felt.to_int(d) for d in data])
+    return adventurer_ambushed_decoder(felts_to_ints(data))
 
 
 def decode_update_gold_event(data):
-    return update_gold_balance_decoder.to_python([felt.to_int(d) for d in data])
+    return update_gold_balance_decoder(felts_to_ints(data))
 
 
 ## LOOT DECODERS
 
-mint_item_decoder = FunctionCallSerializer(
-    abi=mint_item_abi,
-    identifier_manager=identifier_manager_from_abi([mint_item_abi, uint256_abi]),
+item_update_state_decoder = compile_decoder(
+    item_update_state_abi, uint256_abi, item_state_abi
 )
 
-item_update_state_decoder = FunctionCallSerializer(
-    abi=item_update_state_abi,
-    identifier_manager=identifier_manager_from_abi(
-        [item_update_state_abi, uint256_abi, item_state_abi]
-    ),
-)
+item_xp_increase_decoder = compile_decoder(item_xp_increase_abi, uint256_abi)
 
-item_xp_increase_decoder = FunctionCallSerializer(
-    abi=item_xp_increase_abi,
-    identifier_manager=identifier_manager_from_abi([item_xp_increase_abi, uint256_abi]),
+item_greatness_increase_decoder = compile_decoder(
+    item_greatness_increase_abi, uint256_abi
 )
 
-item_greatness_increase_decoder = FunctionCallSerializer(
-    abi=item_greatness_increase_abi,
-    identifier_manager=identifier_manager_from_abi(
-        [item_greatness_increase_abi, uint256_abi]
-    ),
+item_prefixes_assigned_decoder = compile_decoder(
+    item_prefixes_assigned_abi, uint256_abi
 )
 
-item_prefixes_assigned_decoder = FunctionCallSerializer(
-    abi=item_prefixes_assigned_abi,
-    identifier_manager=identifier_manager_from_abi(
-        [item_prefixes_assigned_abi, uint256_abi]
-    ),
-)
+item_suffix_assigned_decoder = compile_decoder(item_suffix_assigned_abi, uint256_abi)
 
-item_suffix_assigned_decoder = FunctionCallSerializer(
-    abi=item_suffix_assigned_abi,
-    identifier_manager=identifier_manager_from_abi(
-        [item_suffix_assigned_abi, uint256_abi]
-    ),
-)
+mint_daily_items_decoder = compile_decoder(mint_daily_items_abi)
 
-mint_daily_items_decoder = FunctionCallSerializer(
-    abi=mint_daily_items_abi,
-    identifier_manager=identifier_manager_from_abi([mint_daily_items_abi]),
-)
+claim_item_decoder = compile_decoder(claim_item_abi, uint256_abi)
 
-claim_item_decoder = FunctionCallSerializer(
-    abi=claim_item_abi,
-    identifier_manager=identifier_manager_from_abi([claim_item_abi, uint256_abi]),
+item_merchant_update_decoder = compile_decoder(
+    item_merchant_update_abi, item_state_abi, bid_abi
 )
 
-item_merchant_update_decoder = FunctionCallSerializer(
-    abi=item_merchant_update_abi,
-    identifier_manager=identifier_manager_from_abi(
-        [item_merchant_update_abi, item_state_abi, bid_abi]
-    ),
-)
+mint_item_decoder = compile_decoder(mint_item_abi, uint256_abi)
 
 
 def decode_item_state_event(data):
-    return item_update_state_decoder.to_python([felt.to_int(d) for d in data])
+    return item_update_state_decoder(felts_to_ints(data))
 
 
 def decode_item_xp_increase_event(data):
-    return item_xp_increase_decoder.to_python([felt.to_int(d) for d in data])
+    return item_xp_increase_decoder(felts_to_ints(data))
 
 
 def decode_item_greatness_increase_event(data):
-    return item_greatness_increase_decoder.to_python([felt.to_int(d) for d in data])
+    return item_greatness_increase_decoder(felts_to_ints(data))
 
 
 def decode_item_prefixes_assigned_event(data):
-    return item_prefixes_assigned_decoder.to_python([felt.to_int(d) for d in data])
+    return item_prefixes_assigned_decoder(felts_to_ints(data))
 
 
 def decode_item_suffix_assigned_event(data):
-    return item_suffix_assigned_decoder.to_python([felt.to_int(d) for d in data])
+    return item_suffix_assigned_decoder(felts_to_ints(data))
 
 
 def decode_mint_daily_items_event(data):
-    return mint_daily_items_decoder.to_python([felt.to_int(d) for d in data])
+    return mint_daily_items_decoder(felts_to_ints(data))
 
 
 def decode_claim_item_event(data):
-    return claim_item_decoder.to_python([felt.to_int(d) for d in data])
+    return claim_item_decoder(felts_to_ints(data))
 
 
 def decode_item_merchant_update_event(data):
-    return item_merchant_update_decoder.to_python([felt.to_int(d) for d in data])
+    return item_merchant_update_decoder(felts_to_ints(data))
 
 
 def decode_mint_item_event(data):
-    return mint_item_decoder.to_python([felt.to_int(d) for d in data])
+    return mint_item_decoder(felts_to_ints(data))
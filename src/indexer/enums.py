@@ -0,0 +1,42 @@
+class EnumTable:
+    """Code table of one game enum with every lookup precomputed.
+
+    Values are stored as 32-byte big-endian felts, so both directions are
+    keyed on that encoding as well as on the int code and the name.
+    """
+
+    def __init__(self, names):
+        self.names = dict(names)
+        self.codes = {}
+        for code, name in self.names.items():
+            # first code wins, like a scan over the table would
+            self.codes.setdefault(name, code)
+        self.encoded = {
+            name: code.to_bytes(32, "big") for name, code in self.codes.items()
+        }
+        self.decoded = {code.to_bytes(32, "big"): name for code, name in names.items()}
+
+    def parse(self, value):
+        encoded = self.encoded.get(value)
+        if encoded is None:
+            raise ValueError(f"invalid value {value}")
+        return encoded
+
+    def serialize(self, value):
+        name = self.decoded.get(value)
+        if name is None:
+            return self.names.get(int.from_bytes(value, "big"))
+        return name
+
+
+class EnumRegistry:
+    """Build an `EnumTable` for every code table of a `Config`.
+
+    Tables are reachable under their `Config` attribute name, for example
+    `registry.ORDERS`.
+    """
+
+    def __init__(self, config):
+        for attr, table in vars(config).items():
+            if isinstance(table, dict) and all(isinstance(k, int) for k in table):
+                setattr(self, attr, EnumTable(table))
@@ -1,19 +1,38 @@
 import asyncio
+import base64
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, NewType, Optional, Dict
+from typing import AsyncGenerator, Generic, List, NewType, Optional, Dict, TypeVar
 import socket
 import ssl
 
+import bson
 import strawberry
 import aiohttp_cors
 from aiohttp import web
 from pymongo import MongoClient
 from strawberry.aiohttp.views import GraphQLView
+from strawberry.dataloader import DataLoader
+from strawberry.extensions import ParserCache, ValidationCache
+from strawberry.types.nodes import SelectedField
 from indexer.indexer import LootSurvivorIndexer
-from indexer.utils import felt_to_str, str_to_felt, get_key_by_value
+from indexer.utils import felt_to_str, str_to_felt
 from indexer.config import Config
+from indexer.enums import EnumRegistry
+from indexer.indexes import (
+    ADVENTURER_STATS_FIELDS,
+    DEFAULT_SORT,
+    LEADERBOARD_FIELDS,
+    LEADERBOARD_INDEX,
+    LEADERBOARD_SORT,
+)
+from indexer.persisted_queries import PersistedQueries, PersistedQueryHTTPHandler
+from indexer.response_cache import CachingHTTPHandler, ResponseCache, watch_head
+from indexer.subscriptions import create_feeds, watch_changes
 
 config = Config()
+enums = EnumRegistry(config)
 
 
 def parse_hex(value):
@@ -44,167 +63,53 @@ def serialize_string(value):
     return felt_to_str(felt).replace("\u0000", "")
 
 
-def parse_order(value):
-    felt = get_key_by_value(value, config.ORDERS)
-    return felt.to_bytes(32, "big")
-
-
-def serialize_order(value):
-    felt = int.from_bytes(value, "big")
-    return config.ORDERS.get(felt)
-
-
-def parse_race(value):
-    felt = get_key_by_value(value, config.RACES)
-    return felt.to_bytes(32, "big")
-
-
-def serialize_race(value):
-    felt = int.from_bytes(value, "big")
-    return config.RACES.get(felt)
-
-
-def parse_beast(value):
-    felt = get_key_by_value(value, config.BEASTS)
-    return felt.to_bytes(32, "big")
-
-
-def serialize_beast(value):
-    felt = int.from_bytes(value, "big")
-    return config.BEASTS.get(felt)
-
-
-def parse_discovery(value):
-    felt = get_key_by_value(value, config.DISCOVERY_TYPES)
-    return felt.to_bytes(32, "big")
-
-
-def serialize_discovery(value):
-    felt = int.from_bytes(value, "big")
-    return config.DISCOVERY_TYPES.get(felt)
-
-
-def parse_sub_discovery(value):
-    felt = get_key_by_value(value, config.SUB_DISCOVERY_TYPES)
-    return felt.to_bytes(32, "big")
-
-
-def serialize_sub_discovery(value):
-    felt = int.from_bytes(value, "big")
-    return config.SUB_DISCOVERY_TYPES.get(felt)
-
-
-def parse_obstacle(value):
-    felt = get_key_by_value(value, config.OBSTACLES)
-    return felt.to_bytes(32, "big")
-
-
-def serialize_obstacle(value):
-    felt = int.from_bytes(value, "big")
-    return config.OBSTACLES.get(felt)
-
-
-def parse_attacker(value):
-    felt = get_key_by_value(value, config.ATTACKERS)
-    return felt.to_bytes(32, "big")
-
-
-def serialize_attacker(value):
-    felt = int.from_bytes(value, "big")
-    return config.ATTACKERS.get(felt)
-
-
-def parse_item(value):
-    felt = get_key_by_value(value, config.ITEMS)
-    return felt.to_bytes(32, "big")
-
-
-def serialize_item(value):
-    felt = int.from_bytes(value, "big")
-    return config.ITEMS.get(felt)
-
-
-def parse_material(value):
-    felt = get_key_by_value(value, config.MATERIALS)
-    return felt.to_bytes(32, "big")
-
-
-def serialize_material(value):
-    felt = int.from_bytes(value, "big")
-    return config.MATERIALS.get(felt)
-
-
-def parse_item_type(value):
-    felt = get_key_by_value(value, config.ITEM_TYPES)
-    return felt.to_bytes(32, "big")
-
-
-def serialize_item_type(value):
-    felt = int.from_bytes(value, "big")
-    return config.ITEM_TYPES.get(felt)
-
-
-def parse_name_prefixes(value):
-    felt = get_key_by_value(value, config.ITEM_NAME_PREFIXES)
-    return felt.to_bytes(32, "big")
-
-
-def serialize_name_prefixes(value):
-    felt = int.from_bytes(value, "big")
-    if felt == 0:
-        return None
-    else:
-        return config.ITEM_NAME_PREFIXES.get(felt)
-
-
-def parse_name_suffixes(value):
-    felt = get_key_by_value(value, config.ITEM_NAME_SUFFIXES)
-    return felt.to_bytes(32, "big")
-
-
-def serialize_name_suffixes(value):
-    felt = int.from_bytes(value, "big")
-    return config.ITEM_NAME_SUFFIXES.get(felt)
-
+parse_order = enums.ORDERS.parse
+serialize_order = enums.ORDERS.serialize
 
-def parse_suffixes(value):
-    felt = get_key_by_value(value, config.ITEM_SUFFIXES)
-    return felt.to_bytes(32, "big")
+parse_race = enums.RACES.parse
+serialize_race = enums.RACES.serialize
 
+parse_beast = enums.BEASTS.parse
+serialize_beast = enums.BEASTS.serialize
 
-def serialize_suffixes(value):
-    felt = int.from_bytes(value, "big")
-    return config.ITEM_SUFFIXES.get(felt)
+parse_discovery = enums.DISCOVERY_TYPES.parse
+serialize_discovery = enums.DISCOVERY_TYPES.serialize
 
+parse_sub_discovery = enums.SUB_DISCOVERY_TYPES.parse
+serialize_sub_discovery = enums.SUB_DISCOVERY_TYPES.serialize
 
-def parse_status(value):
-    felt = get_key_by_value(value, config.STATUS)
-    return felt.to_bytes(32, "big")
+parse_obstacle = enums.OBSTACLES.parse
+serialize_obstacle = enums.OBSTACLES.serialize
 
+parse_attacker = enums.ATTACKERS.parse
+serialize_attacker = enums.ATTACKERS.serialize
 
-def serialize_status(value):
-    felt = int.from_bytes(value, "big")
-    return config.STATUS.get(felt)
+parse_item = enums.ITEMS.parse
+serialize_item = enums.ITEMS.serialize
 
+parse_material = enums.MATERIALS.parse
+serialize_material = enums.MATERIALS.serialize
 
-def parse_slot(value):
-    felt = get_key_by_value(value, config.SLOTS)
-    return felt.to_bytes(32, "big")
+parse_item_type = enums.ITEM_TYPES.parse
+serialize_item_type = enums.ITEM_TYPES.serialize
 
+parse_name_prefixes = enums.ITEM_NAME_PREFIXES.parse
+serialize_name_prefixes = enums.ITEM_NAME_PREFIXES.serialize
 
-def serialize_slot(value):
-    felt = int.from_bytes(value, "big")
-    return config.SLOTS.get(felt)
+parse_name_suffixes = enums.ITEM_NAME_SUFFIXES.parse
+serialize_name_suffixes = enums.ITEM_NAME_SUFFIXES.serialize
 
+parse_suffixes = enums.ITEM_SUFFIXES.parse
+serialize_suffixes = enums.ITEM_SUFFIXES.serialize
 
-def parse_adventurer(value):
-    felt = get_key_by_value(value, config.ATTACKERS)
-    return felt.to_bytes(32, "big")
+parse_status = enums.STATUS.parse
+serialize_status = enums.STATUS.serialize
 
+parse_slot = enums.SLOTS.parse
+serialize_slot = enums.SLOTS.serialize
 
-def serialize_adventurer(value):
-    felt = int.from_bytes(value, "big")
-    return config.ATTACKERS.get(felt)
+parse_adventurer = enums.ATTACKERS.parse
+serialize_adventurer = enums.ATTACKERS.serialize
 
 
 HexValue = strawberry.scalar(
@@ -771,7 +676,7 @@ class ItemsOrderByInput:
     marketId: Optional[OrderByInput] = None
     owner: Optional[OrderByInput] = None
     ownerAdventurerId: Optional[OrderByInput] = None
-    claimedTime: Optional[datetime] = None
+    claimedTime: Optional[OrderByInput] = None
     item: Optional[OrderByInput] = None
     slot: Optional[OrderByInput] = None
     type: Optional[OrderByInput] = None
@@ -799,6 +704,10 @@ class MarketOrderByInput:
     timestamp: Optional[OrderByInput] = None
 
 
+# documents returned by a list field of a type when no limit is given
+RELATED_LIMIT = 100
+
+
 @strawberry.type
 class Adventurer:
     id: Optional[FeltValue]
@@ -834,41 +743,87 @@ class Adventurer:
     gold: Optional[FeltValue]
     lastUpdated: Optional[datetime]
 
+    @strawberry.field
+    async def items(self, info, limit: Optional[int] = RELATED_LIMIT) -> List["Item"]:
+        return await load_related_list(info, "adventurer_items", self.id, limit)
+
+    @strawberry.field
+    async def battles(
+        self, info, limit: Optional[int] = RELATED_LIMIT
+    ) -> List["Battle"]:
+        return await load_related_list(info, "adventurer_battles", self.id, limit)
+
+    @strawberry.field
+    async def discoveries(
+        self, info, limit: Optional[int] = RELATED_LIMIT
+    ) -> List["Discovery"]:
+        return await load_related_list(info, "adventurer_discoveries", self.id, limit)
+
+    @strawberry.field
+    async def stats(self, info) -> Optional["AdventurerStats"]:
+        return await load_related(info, "adventurer_stats", self.id)
+
+    @classmethod
+    def from_mongo(cls, data):
+        return cls(
+            id=data.get("id"),
+            owner=data.get("owner"),
+            race=data.get("race"),
+            homeRealm=data.get("homeRealm"),
+            birthdate=data.get("birthdate"),
+            name=data.get("name"),
+            order=data.get("order"),
+            imageHash1=data.get("imageHash1"),
+            imageHash2=data.get("imageHash2"),
+            health=data.get("health"),
+            level=data.get("level"),
+            strength=data.get("strength"),
+            dexterity=data.get("dexterity"),
+            vitality=data.get("vitality"),
+            intelligence=data.get("intelligence"),
+            wisdom=data.get("wisdom"),
+            charisma=data.get("charisma"),
+            luck=data.get("luck"),
+            xp=data.get("xp"),
+            weaponId=data.get("weaponId"),
+            chestId=data.get("chestId"),
+            headId=data.get("headId"),
+            waistId=data.get("waistId"),
+            feetId=data.get("feetId"),
+            handsId=data.get("handsId"),
+            neckId=data.get("neckId"),
+            ringId=data.get("ringId"),
+            status=data.get("status"),
+            beastId=data.get("beast"),
+            upgrading=data.get("upgrading"),
+            gold=data.get("gold"),
+            lastUpdated=data.get("lastUpdated"),
+        )
+
+
+@strawberry.type
+class AdventurerStats:
+    adventurerId: Optional[FeltValue]
+    battles: FeltValue
+    damageDealt: FeltValue
+    damageTaken: FeltValue
+    beastsSlain: FeltValue
+    timesFled: FeltValue
+    timesAmbushed: FeltValue
+    goldEarned: FeltValue
+    xpEarned: FeltValue
+    lastUpdated: Optional[datetime]
+
     @classmethod
     def from_mongo(cls, data):
+        # totals are stored as numbers, the felt scalar serializes any size
         return cls(
-            id=data["id"],
-            owner=data["owner"],
-            race=data["race"],
-            homeRealm=data["homeRealm"],
-            birthdate=data["birthdate"],
-            name=data["name"],
-            order=data["order"],
-            imageHash1=data["imageHash1"],
-            imageHash2=data["imageHash2"],
-            health=data["health"],
-            level=data["level"],
-            strength=data["strength"],
-            dexterity=data["dexterity"],
-            vitality=data["vitality"],
-            intelligence=data["intelligence"],
-            wisdom=data["wisdom"],
-            charisma=data["charisma"],
-            luck=data["luck"],
-            xp=data["xp"],
-            weaponId=data["weaponId"],
-            chestId=data["chestId"],
-            headId=data["headId"],
-            waistId=data["waistId"],
-            feetId=data["feetId"],
-            handsId=data["handsId"],
-            neckId=data["neckId"],
-            ringId=data["ringId"],
-            status=data["status"],
-            beastId=data["beast"],
-            upgrading=data["upgrading"],
-            gold=data["gold"],
-            lastUpdated=data["lastUpdated"],
+            adventurerId=data.get("adventurerId"),
+            lastUpdated=data.get("lastUpdated"),
+            **{
+                field: parse_felt(data.get(field, 0))
+                for field in ADVENTURER_STATS_FIELDS
+            },
         )
 
 
@@ -885,13 +840,13 @@ class Discovery:
     @classmethod
     def from_mongo(cls, data):
         return cls(
-            adventurerId=data["adventurerId"],
-            discoveryType=data["discoveryType"],
-            subDiscoveryType=data["subDiscoveryType"],
-            entityId=data["entityId"],
-            outputAmount=data["outputAmount"],
-            discoveryTime=data["discoveryTime"],
-            txHash=data["txHash"],
+            adventurerId=data.get("adventurerId"),
+            discoveryType=data.get("discoveryType"),
+            subDiscoveryType=data.get("subDiscoveryType"),
+            entityId=data.get("entityId"),
+            outputAmount=data.get("outputAmount"),
+            discoveryTime=data.get("discoveryTime"),
+            txHash=data.get("txHash"),
         )
 
 
@@ -921,19 +876,19 @@ class Beast:
     @classmethod
     def from_mongo(cls, data):
         return cls(
-            id=data["id"],
-            adventurerId=data["adventurerId"],
-            beast=data["beast"],
-            attackType=data["attackType"],
-            armorType=data["armorType"],
-            rank=data["rank"],
-            prefix1=data["prefix1"],
-            prefix2=data["prefix2"],
-            health=data["health"],
-            xp=data["xp"],
-            level=data["level"],
-            slainOnDate=data["slainOnDate"],
-            lastUpdated=data["lastUpdated"],
+            id=data.get("id"),
+            adventurerId=data.get("adventurerId"),
+            beast=data.get("beast"),
+            attackType=data.get("attackType"),
+            armorType=data.get("armorType"),
+            rank=data.get("rank"),
+            prefix1=data.get("prefix1"),
+            prefix2=data.get("prefix2"),
+            health=data.get("health"),
+            xp=data.get("xp"),
+            level=data.get("level"),
+            slainOnDate=data.get("slainOnDate"),
+            lastUpdated=data.get("lastUpdated"),
         )
 
 
@@ -951,20 +906,24 @@ class Battle:
     goldEarned: Optional[FeltValue]
     txHash: Optional[HexValue]
 
+    @strawberry.field
+    async def beast(self, info) -> Optional["Beast"]:
+        return await load_related(info, "beast", self.beastId)
+
     @classmethod
     def from_mongo(cls, data):
         return cls(
-            adventurerId=data["adventurerId"],
-            beastId=data["beastId"],
-            timestamp=data["timestamp"],
-            attacker=data["attacker"],
-            fled=data["fled"],
-            ambushed=data["ambushed"],
-            damage=data["damage"],
-            targetHealth=data["targetHealth"],
-            xpEarned=data["xpEarned"],
-            goldEarned=data["goldEarned"],
-            txHash=data["txHash"],
+            adventurerId=data.get("adventurerId"),
+            beastId=data.get("beastId"),
+            timestamp=data.get("timestamp"),
+            attacker=data.get("attacker"),
+            fled=data.get("fled"),
+            ambushed=data.get("ambushed"),
+            damage=data.get("damage"),
+            targetHealth=data.get("targetHealth"),
+            xpEarned=data.get("xpEarned"),
+            goldEarned=data.get("goldEarned"),
+            txHash=data.get("txHash"),
         )
 
 
@@ -994,32 +953,36 @@ class Item:
     status: Optional[StatusValue]
     lastUpdated: Optional[datetime]
 
+    @strawberry.field
+    async def equippedAdventurer(self, info) -> Optional["Adventurer"]:
+        return await load_related(info, "adventurer", self.equippedAdventurerId)
+
     @classmethod
     def from_mongo(cls, data):
         return cls(
-            id=data["id"],
-            marketId=data["marketId"],
-            owner=data["owner"],
-            ownerAdventurerId=data["ownerAdventurerId"],
-            claimedTime=data["claimedTime"],
-            item=data["item"],
-            slot=data["slot"],
-            type=data["type"],
-            material=data["material"],
-            rank=data["rank"],
-            prefix1=data["prefix1"],
-            prefix2=data["prefix2"],
-            suffix=data["suffix"],
-            greatness=data["greatness"],
-            createdBlock=data["createdBlock"],
-            xp=data["xp"],
-            equippedAdventurerId=data["equippedAdventurerId"],
-            bag=data["bag"],
-            price=data["price"],
-            expiry=data["expiry"],
-            bidder=data["bidder"],
-            status=data["status"],
-            lastUpdated=data["lastUpdated"],
+            id=data.get("id"),
+            marketId=data.get("marketId"),
+            owner=data.get("owner"),
+            ownerAdventurerId=data.get("ownerAdventurerId"),
+            claimedTime=data.get("claimedTime"),
+            item=data.get("item"),
+            slot=data.get("slot"),
+            type=data.get("type"),
+            material=data.get("material"),
+            rank=data.get("rank"),
+            prefix1=data.get("prefix1"),
+            prefix2=data.get("prefix2"),
+            suffix=data.get("suffix"),
+            greatness=data.get("greatness"),
+            createdBlock=data.get("createdBlock"),
+            xp=data.get("xp"),
+            equippedAdventurerId=data.get("equippedAdventurerId"),
+            bag=data.get("bag"),
+            price=data.get("price"),
+            expiry=data.get("expiry"),
+            bidder=data.get("bidder"),
+            status=data.get("status"),
+            lastUpdated=data.get("lastUpdated"),
         )
 
 
@@ -1032,12 +995,58 @@ class Market:
     @classmethod
     def from_mongo(cls, data):
         return cls(
-            caller=data["caller"],
-            itemsNumber=data["itemsNumber"],
-            timestamp=data["timestamp"],
+            caller=data.get("caller"),
+            itemsNumber=data.get("itemsNumber"),
+            timestamp=data.get("timestamp"),
+        )
+
+
+@strawberry.type
+class LeaderboardEntry:
+    rank: int
+    adventurerId: Optional[FeltValue]
+    xp: FeltValue
+    level: FeltValue
+    gold: FeltValue
+
+    @strawberry.field
+    async def adventurer(self, info) -> Optional[Adventurer]:
+        return await load_related(info, "adventurer", self.adventurerId)
+
+    @classmethod
+    def from_mongo(cls, data, rank):
+        return cls(
+            rank=rank,
+            adventurerId=data.get("adventurerId"),
+            xp=parse_felt(data.get("xp")),
+            level=parse_felt(data.get("level")),
+            gold=parse_felt(data.get("gold")),
         )
 
 
+T = TypeVar("T")
+
+
+@strawberry.type
+class PageInfo:
+    hasNextPage: bool
+    hasPreviousPage: bool
+    startCursor: Optional[str]
+    endCursor: Optional[str]
+
+
+@strawberry.type
+class Edge(Generic[T]):
+    node: T
+    cursor: str
+
+
+@strawberry.type
+class Connection(Generic[T]):
+    edges: List[Edge[T]]
+    pageInfo: PageInfo
+
+
 def get_str_filters(where: StringFilter) -> List[Dict]:
     filter = {}
     if where.eq:
@@ -1140,15 +1149,284 @@ def process_filters(obj, prefix=None):
     return filters
 
 
-def get_adventurers(
-    info,
-    where: Optional[AdventurersFilter] = {},
-    limit: Optional[int] = 10,
-    skip: Optional[int] = 0,
-    orderBy: Optional[AdventurersOrderByInput] = {},
-) -> List[Adventurer]:
+async def fetch(executor, cursor):
+    """Iterate a pymongo cursor on `executor` and return the documents.
+
+    pymongo blocks, so the query runs on a thread to keep the event loop
+    serving other requests.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, list, cursor)
+
+
+async def find(info, collection, filter, skip, limit, sort, projection=None):
     db = info.context["db"]
+    cursor = db[collection].find(filter, projection).skip(skip).limit(limit).sort(sort)
+    return await fetch(info.context["executor"], cursor)
+
+
+# document fields read by the GraphQL fields not stored under their own name
+ADVENTURER_FIELDS = {
+    "beastId": ("beast",),
+    "items": ("id",),
+    "battles": ("id",),
+    "discoveries": ("id",),
+    "stats": ("id",),
+}
+BATTLE_FIELDS = {"beast": ("beastId",)}
+ITEM_FIELDS = {"equippedAdventurer": ("equippedAdventurerId",)}
+
+
+def iter_selected_fields(selections):
+    for selection in selections:
+        if isinstance(selection, SelectedField):
+            yield selection
+        else:
+            # fragment spreads and inline fragments
+            yield from iter_selected_fields(selection.selections)
+
+
+def node_selections(info):
+    """Return the selections made on the nodes of a connection field."""
+    selections = []
+    for edges in iter_selected_fields(info.selected_fields[0].selections):
+        if edges.name == "edges":
+            for node in iter_selected_fields(edges.selections):
+                if node.name == "node":
+                    selections.extend(node.selections)
+    return selections
+
+
+def get_projection(selections, fields=None, sort=()):
+    """Build a Mongo projection reading only the fields the query selected.
+
+    `fields` maps the GraphQL fields that are not stored under their own name
+    to the document fields they read.
+    """
+    fields = fields or {}
+    projection = {"_id": 1}
+    for selected in iter_selected_fields(selections):
+        for field in fields.get(selected.name, (selected.name,)):
+            projection[field] = 1
+    for key, _ in sort:
+        projection[key] = 1
+    return projection
+
+
+def related_loader(db, executor, collection, field, from_mongo, many=True):
+    """Batch the lookups of `collection` documents by `field` into one query.
+
+    Loads one document or `None` per key, otherwise, when `many`, the
+    latest `limit` documents for each `(key, limit)`, in default sort
+    order. The documents beyond `limit` are dropped by Mongo.
+    """
+    sort = {DEFAULT_SORT[collection]: -1, "_id": -1}
+
+    async def load_one(keys):
+        cursor = (
+            db[collection]
+            .find({field: {"$in": list(set(keys))}, "_chain.valid_to": None})
+            .sort(list(sort.items()))
+        )
+        found = {}
+        for doc in await fetch(executor, cursor):
+            found.setdefault(doc[field], from_mongo(doc))
+        return [found.get(key) for key in keys]
+
+    async def load_many(keys):
+        found = {}
+        for limit in {limit for _, limit in keys}:
+            values = list({key for key, key_limit in keys if key_limit == limit})
+            cursor = db[collection].aggregate(
+                [
+                    {"$match": {field: {"$in": values}, "_chain.valid_to": None}},
+                    {
+                        "$group": {
+                            "_id": f"${field}",
+                            "docs": {
+                                "$topN": {
+                                    "n": limit,
+                                    "sortBy": sort,
+                                    "output": "$$ROOT",
+                                }
+                            },
+                        }
+                    },
+                ]
+            )
+            for group in await fetch(executor, cursor):
+                found[(group["_id"], limit)] = [
+                    from_mongo(doc) for doc in group["docs"]
+                ]
+        return [found.get(key, []) for key in keys]
+
+    return DataLoader(load_fn=load_many if many else load_one)
+
+
+def create_loaders(db, executor):
+    return {
+        "adventurer": related_loader(
+            db, executor, "adventurers", "id", Adventurer.from_mongo, many=False
+        ),
+        "beast": related_loader(
+            db, executor, "beasts", "id", Beast.from_mongo, many=False
+        ),
+        "adventurer_items": related_loader(
+            db, executor, "items", "ownerAdventurerId", Item.from_mongo
+        ),
+        "adventurer_battles": related_loader(
+            db, executor, "battles", "adventurerId", Battle.from_mongo
+        ),
+        "adventurer_discoveries": related_loader(
+            db, executor, "discoveries", "adventurerId", Discovery.from_mongo
+        ),
+        "adventurer_stats": related_loader(
+            db,
+            executor,
+            "adventurerStats",
+            "adventurerId",
+            AdventurerStats.from_mongo,
+            many=False,
+        ),
+    }
+
+
+async def load_related(info, loader, key, default=None):
+    if key is None:
+        return default
+    return await info.context["loaders"][loader].load(key)
+
+
+async def load_related_list(info, loader, key, limit):
+    if key is None or (limit is not None and limit < 1):
+        return []
+    limit = RELATED_LIMIT if limit is None else limit
+    return await info.context["loaders"][loader].load((key, limit))
+
+
+def get_sort(orderBy, default):
+    """Build a compound sort from the `orderBy` inputs, in the order given.
+
+    Each input object sets a single field, since the order of the fields
+    inside one object is lost, so sorting on several fields takes a list:
+    `orderBy: [{level: {desc: true}}, {xp: {desc: true}}]`. Without one,
+    sort on `default` descending, which has an index.
+    """
+    sort = []
+    for order in orderBy or []:
+        keys = [key for key, value in order.__dict__.items() if value is not None]
+        if len(keys) > 1:
+            raise ValueError(
+                f"orderBy objects take a single field, got {', '.join(keys)};"
+                " pass a list of objects to sort on several fields"
+            )
+        for key in keys:
+            value = getattr(order, key)
+            if any(key == k for k, _ in sort):
+                continue
+            if value.asc:
+                sort.append((key, 1))
+            elif value.desc:
+                sort.append((key, -1))
+    return sort or [(default, -1)]
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(bson.encode({"v": values})).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return bson.decode(base64.urlsafe_b64decode(cursor))["v"]
+    except Exception:
+        raise ValueError(f"invalid cursor {cursor}")
+
+
+def after_value(key, value, direction):
+    # null sorts before every other value and is not matched by $gt or $lt
+    if value is None:
+        return {key: {"$ne": None}} if direction == 1 else None
+    if direction == 1:
+        return {key: {"$gt": value}}
+    return {"$or": [{key: {"$lt": value}}, {key: None}]}
+
+
+def keyset_filter(sort, values):
+    """Match the documents that come after `values` in `sort` order."""
+    clauses = []
+    for i, ((key, direction), value) in enumerate(zip(sort, values)):
+        after = after_value(key, value, direction)
+        if after is None:
+            continue
+        clause = {k: v for (k, _), v in zip(sort[:i], values[:i])}
+        clause.update(after)
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+async def find_page(
+    info, collection, filter, sort, limit, after, before, from_mongo, fields=None
+):
+    """Fetch one page after (or before) a cursor, reading at most `limit + 1`
+    documents in `sort` order, with `_id` breaking ties.
+
+    Paging backwards, one more document is probed in `sort` order to tell
+    whether a next page exists.
+    """
+    backwards = before is not None
+    cursor = before if backwards else after
+    forward = sort + [("_id", sort[-1][1])]
+    sort = forward
+    if backwards:
+        sort = [(key, -direction) for key, direction in forward]
+    page_filter = filter
+    if cursor is not None:
+        page_filter = {"$and": [filter, keyset_filter(sort, decode_cursor(cursor))]}
+
+    projection = get_projection(node_selections(info), fields, sort)
+    docs = await find(info, collection, page_filter, 0, limit + 1, sort, projection)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+
+    has_next = has_more
+    if backwards:
+        docs.reverse()
+        if docs:
+            values = [docs[-1].get(key) for key, _ in forward]
+            next_filter = keyset_filter(forward, values)
+        else:
+            # nothing before the cursor, the document at the cursor is next
+            values = decode_cursor(before)
+            next_filter = {
+                "$or": [
+                    keyset_filter(forward, values),
+                    {key: value for (key, _), value in zip(forward, values)},
+                ]
+            }
+        next_docs = await find(
+            info, collection, {"$and": [filter, next_filter]}, 0, 1, forward, {"_id": 1}
+        )
+        has_next = bool(next_docs)
 
+    edges = [
+        Edge(
+            node=from_mongo(doc),
+            cursor=encode_cursor([doc.get(key) for key, _ in sort]),
+        )
+        for doc in docs
+    ]
+    return Connection(
+        edges=edges,
+        pageInfo=PageInfo(
+            hasNextPage=has_next,
+            hasPreviousPage=has_more if backwards else after is not None,
+            startCursor=edges[0].cursor if edges else None,
+            endCursor=edges[-1].cursor if edges else None,
+        ),
+    )
+
+
+def get_adventurers_filter(where: Optional[AdventurersFilter]):
     filter = {"_chain.valid_to": None}
 
     if where:
@@ -1169,37 +1447,48 @@ def get_adventurers(
             elif isinstance(value, BooleanFilter):
                 filter[key] = get_bool_filters(value)
 
-    sort_options = {k: v for k, v in orderBy.__dict__.items() if v is not None}
-
-    sort_var = "updated_at"
-    sort_dir = -1
+    return filter
 
-    for key, value in sort_options.items():
-        if value.asc:
-            sort_var = key
-            sort_dir = 1
-            break
-        if value.desc:
-            sort_var = key
-            sort_dir = -1
-            break
 
-    query = (
-        db["adventurers"].find(filter).skip(skip).limit(limit).sort(sort_var, sort_dir)
-    )
+async def get_adventurers(
+    info,
+    where: Optional[AdventurersFilter] = {},
+    limit: Optional[int] = 10,
+    skip: Optional[int] = 0,
+    orderBy: Optional[List[AdventurersOrderByInput]] = None,
+) -> List[Adventurer]:
+    filter = get_adventurers_filter(where)
+    sort = get_sort(orderBy, DEFAULT_SORT["adventurers"])
+    projection = get_projection(info.selected_fields[0].selections, ADVENTURER_FIELDS)
+    query = await find(info, "adventurers", filter, skip, limit, sort, projection)
 
     return [Adventurer.from_mongo(t) for t in query]
 
 
-def get_discoveries(
+async def get_adventurers_connection(
     info,
-    where: Optional[DiscoveriesFilter] = {},
+    where: Optional[AdventurersFilter] = {},
     limit: Optional[int] = 10,
-    skip: Optional[int] = 0,
-    orderBy: Optional[DiscoveriesOrderByInput] = {},
-) -> List[Discovery]:
-    db = info.context["db"]
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    orderBy: Optional[List[AdventurersOrderByInput]] = None,
+) -> Connection[Adventurer]:
+    filter = get_adventurers_filter(where)
+    sort = get_sort(orderBy, DEFAULT_SORT["adventurers"])
+    return await find_page(
+        info,
+        "adventurers",
+        filter,
+        sort,
+        limit,
+        after,
+        before,
+        Adventurer.from_mongo,
+        ADVENTURER_FIELDS,
+    )
 
+
+def get_discoveries_filter(where: Optional[DiscoveriesFilter]):
     filter = {"_chain.valid_to": None}
 
     if where:
@@ -1218,37 +1507,47 @@ def get_discoveries(
             elif isinstance(value, FeltValueFilter):
                 filter[key] = get_felt_filters(value)
 
-    sort_options = {k: v for k, v in orderBy.__dict__.items() if v is not None}
-
-    sort_var = "updated_at"
-    sort_dir = -1
+    return filter
 
-    for key, value in sort_options.items():
-        if value.asc:
-            sort_var = key
-            sort_dir = 1
-            break
-        if value.desc:
-            sort_var = key
-            sort_dir = -1
-            break
 
-    query = (
-        db["discoveries"].find(filter).skip(skip).limit(limit).sort(sort_var, sort_dir)
-    )
+async def get_discoveries(
+    info,
+    where: Optional[DiscoveriesFilter] = {},
+    limit: Optional[int] = 10,
+    skip: Optional[int] = 0,
+    orderBy: Optional[List[DiscoveriesOrderByInput]] = None,
+) -> List[Discovery]:
+    filter = get_discoveries_filter(where)
+    sort = get_sort(orderBy, DEFAULT_SORT["discoveries"])
+    projection = get_projection(info.selected_fields[0].selections)
+    query = await find(info, "discoveries", filter, skip, limit, sort, projection)
 
     return [Discovery.from_mongo(t) for t in query]
 
 
-def get_beasts(
+async def get_discoveries_connection(
     info,
-    where: Optional[BeastsFilter] = {},
+    where: Optional[DiscoveriesFilter] = {},
     limit: Optional[int] = 10,
-    skip: Optional[int] = 0,
-    orderBy: Optional[BeastsOrderByInput] = {},
-) -> List[Beast]:
-    db = info.context["db"]
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    orderBy: Optional[List[DiscoveriesOrderByInput]] = None,
+) -> Connection[Discovery]:
+    filter = get_discoveries_filter(where)
+    sort = get_sort(orderBy, DEFAULT_SORT["discoveries"])
+    return await find_page(
+        info,
+        "discoveries",
+        filter,
+        sort,
+        limit,
+        after,
+        before,
+        Discovery.from_mongo,
+    )
+
 
+def get_beasts_filter(where: Optional[BeastsFilter]):
     filter = {"_chain.valid_to": None}
 
     if where:
@@ -1268,35 +1567,47 @@ def get_beasts(
             elif isinstance(value, FeltValueFilter):
                 filter[key] = get_felt_filters(value)
 
-    sort_options = {k: v for k, v in orderBy.__dict__.items() if v is not None}
-
-    sort_var = "updated_at"
-    sort_dir = -1
+    return filter
 
-    for key, value in sort_options.items():
-        if value.asc:
-            sort_var = key
-            sort_dir = 1
-            break
-        if value.desc:
-            sort_var = key
-            sort_dir = -1
-            break
 
-    query = db["beasts"].find(filter).skip(skip).limit(limit).sort(sort_var, sort_dir)
+async def get_beasts(
+    info,
+    where: Optional[BeastsFilter] = {},
+    limit: Optional[int] = 10,
+    skip: Optional[int] = 0,
+    orderBy: Optional[List[BeastsOrderByInput]] = None,
+) -> List[Beast]:
+    filter = get_beasts_filter(where)
+    sort = get_sort(orderBy, DEFAULT_SORT["beasts"])
+    projection = get_projection(info.selected_fields[0].selections)
+    query = await find(info, "beasts", filter, skip, limit, sort, projection)
 
     return [Beast.from_mongo(t) for t in query]
 
 
-def get_battles(
+async def get_beasts_connection(
     info,
-    where: Optional[BattlesFilter] = {},
+    where: Optional[BeastsFilter] = {},
     limit: Optional[int] = 10,
-    skip: Optional[int] = 0,
-    orderBy: Optional[BattlesOrderByInput] = {},
-) -> List[Beast]:
-    db = info.context["db"]
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    orderBy: Optional[List[BeastsOrderByInput]] = None,
+) -> Connection[Beast]:
+    filter = get_beasts_filter(where)
+    sort = get_sort(orderBy, DEFAULT_SORT["beasts"])
+    return await find_page(
+        info,
+        "beasts",
+        filter,
+        sort,
+        limit,
+        after,
+        before,
+        Beast.from_mongo,
+    )
+
 
+def get_battles_filter(where: Optional[BattlesFilter]):
     filter = {"_chain.valid_to": None}
 
     if where:
@@ -1313,35 +1624,48 @@ def get_battles(
             elif isinstance(value, BooleanFilter):
                 filter[key] = get_bool_filters(value)
 
-    sort_options = {k: v for k, v in orderBy.__dict__.items() if v is not None}
-
-    sort_var = "updated_at"
-    sort_dir = -1
+    return filter
 
-    for key, value in sort_options.items():
-        if value.asc:
-            sort_var = key
-            sort_dir = 1
-            break
-        if value.desc:
-            sort_var = key
-            sort_dir = -1
-            break
 
-    query = db["battles"].find(filter).skip(skip).limit(limit).sort(sort_var, sort_dir)
+async def get_battles(
+    info,
+    where: Optional[BattlesFilter] = {},
+    limit: Optional[int] = 10,
+    skip: Optional[int] = 0,
+    orderBy: Optional[List[BattlesOrderByInput]] = None,
+) -> List[Beast]:
+    filter = get_battles_filter(where)
+    sort = get_sort(orderBy, DEFAULT_SORT["battles"])
+    projection = get_projection(info.selected_fields[0].selections, BATTLE_FIELDS)
+    query = await find(info, "battles", filter, skip, limit, sort, projection)
 
     return [Battle.from_mongo(t) for t in query]
 
 
-def get_items(
+async def get_battles_connection(
     info,
-    where: Optional[ItemsFilter] = {},
+    where: Optional[BattlesFilter] = {},
     limit: Optional[int] = 10,
-    skip: Optional[int] = 0,
-    orderBy: Optional[ItemsOrderByInput] = {},
-) -> List[Item]:
-    db = info.context["db"]
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    orderBy: Optional[List[BattlesOrderByInput]] = None,
+) -> Connection[Battle]:
+    filter = get_battles_filter(where)
+    sort = get_sort(orderBy, DEFAULT_SORT["battles"])
+    return await find_page(
+        info,
+        "battles",
+        filter,
+        sort,
+        limit,
+        after,
+        before,
+        Battle.from_mongo,
+        BATTLE_FIELDS,
+    )
+
 
+def get_items_filter(where: Optional[ItemsFilter]):
     filter = {"_chain.valid_to": None}
 
     if where:
@@ -1366,34 +1690,40 @@ def get_items(
             elif isinstance(value, FeltValueFilter):
                 filter[key] = get_felt_filters(value)
 
-    sort_options = {k: v for k, v in orderBy.__dict__.items() if v is not None}
+    return filter
 
-    sort_var = "updated_at"
-    sort_dir = -1
 
-    for key, value in sort_options.items():
-        if value.asc:
-            sort_var = key
-            sort_dir = 1
-            break
-        if value.desc:
-            sort_var = key
-            sort_dir = -1
-            break
-    query = db["items"].find(filter).skip(skip).limit(limit).sort(sort_var, sort_dir)
+async def get_items(
+    info,
+    where: Optional[ItemsFilter] = {},
+    limit: Optional[int] = 10,
+    skip: Optional[int] = 0,
+    orderBy: Optional[List[ItemsOrderByInput]] = None,
+) -> List[Item]:
+    filter = get_items_filter(where)
+    sort = get_sort(orderBy, DEFAULT_SORT["items"])
+    projection = get_projection(info.selected_fields[0].selections, ITEM_FIELDS)
+    query = await find(info, "items", filter, skip, limit, sort, projection)
 
     return [Item.from_mongo(t) for t in query]
 
 
-def get_market(
+async def get_items_connection(
     info,
-    where: Optional[MarketFilter] = {},
+    where: Optional[ItemsFilter] = {},
     limit: Optional[int] = 10,
-    skip: Optional[int] = 0,
-    orderBy: Optional[MarketOrderByInput] = {},
-) -> List[Item]:
-    db = info.context["db"]
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    orderBy: Optional[List[ItemsOrderByInput]] = None,
+) -> Connection[Item]:
+    filter = get_items_filter(where)
+    sort = get_sort(orderBy, DEFAULT_SORT["items"])
+    return await find_page(
+        info, "items", filter, sort, limit, after, before, Item.from_mongo, ITEM_FIELDS
+    )
 
+
+def get_market_filter(where: Optional[MarketFilter]):
     filter = {"_chain.valid_to": None}
 
     if where:
@@ -1408,25 +1738,119 @@ def get_market(
             elif isinstance(value, FeltValueFilter):
                 filter[key] = get_felt_filters(value)
 
-    sort_options = {k: v for k, v in orderBy.__dict__.items() if v is not None}
+    return filter
 
-    sort_var = "updated_at"
-    sort_dir = -1
 
-    for key, value in sort_options.items():
-        if value.asc:
-            sort_var = key
-            sort_dir = 1
-            break
-        if value.desc:
-            sort_var = key
-            sort_dir = -1
-            break
-    query = db["market"].find(filter).skip(skip).limit(limit).sort(sort_var, sort_dir)
+async def get_market(
+    info,
+    where: Optional[MarketFilter] = {},
+    limit: Optional[int] = 10,
+    skip: Optional[int] = 0,
+    orderBy: Optional[List[MarketOrderByInput]] = None,
+) -> List[Item]:
+    filter = get_market_filter(where)
+    sort = get_sort(orderBy, DEFAULT_SORT["market"])
+    projection = get_projection(info.selected_fields[0].selections)
+    query = await find(info, "market", filter, skip, limit, sort, projection)
 
     return [Market.from_mongo(t) for t in query]
 
 
+async def get_market_connection(
+    info,
+    where: Optional[MarketFilter] = {},
+    limit: Optional[int] = 10,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    orderBy: Optional[List[MarketOrderByInput]] = None,
+) -> Connection[Market]:
+    filter = get_market_filter(where)
+    sort = get_sort(orderBy, DEFAULT_SORT["market"])
+    return await find_page(
+        info,
+        "market",
+        filter,
+        sort,
+        limit,
+        after,
+        before,
+        Market.from_mongo,
+    )
+
+
+def leaderboard_filter(operator, xp, adventurer_id):
+    """Match the current entries before (`$gt`) or after (`$lt`) an entry."""
+    return {
+        "current": True,
+        "$or": [
+            {"xp": {operator: xp}},
+            {"xp": xp, "adventurerId": {operator: adventurer_id}},
+        ],
+    }
+
+
+async def get_leaderboard(
+    info, limit: Optional[int] = 10, after: Optional[str] = None
+) -> Connection[LeaderboardEntry]:
+    """Page through the adventurers by xp, ranks are counted on each read.
+
+    Stored ranks would have to be renumbered for every entry passed by an
+    adventurer gaining xp. Current entries are selected on their `current`
+    flag, not on `_chain.valid_to: None`, so both the page and the count
+    are answered from the leaderboard index without reading documents.
+    """
+    db = info.context["db"]
+    executor = info.context["executor"]
+    filter = {"current": True}
+    if after is not None:
+        values = decode_cursor(after)
+        if (
+            not isinstance(values, list)
+            or len(values) != 2
+            or not isinstance(values[0], int)
+            or not isinstance(values[1], bytes)
+        ):
+            raise ValueError(f"invalid cursor {after}")
+        filter = leaderboard_filter("$lt", *values)
+    projection = {"_id": 0, "adventurerId": 1, **dict.fromkeys(LEADERBOARD_FIELDS, 1)}
+    cursor = (
+        db["leaderboard"]
+        .find(filter, projection)
+        .sort(LEADERBOARD_SORT)
+        .hint(LEADERBOARD_INDEX)
+        .limit(limit + 1)
+    )
+    docs = await fetch(executor, cursor)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+
+    rank = 1
+    if after is not None and docs:
+        ahead = leaderboard_filter("$gt", docs[0]["xp"], docs[0]["adventurerId"])
+        loop = asyncio.get_running_loop()
+        rank += await loop.run_in_executor(
+            executor,
+            partial(db["leaderboard"].count_documents, ahead, hint=LEADERBOARD_INDEX),
+        )
+
+    edges = [
+        Edge(
+            node=LeaderboardEntry.from_mongo(doc, rank + i),
+            cursor=encode_cursor([doc["xp"], doc["adventurerId"]]),
+        )
+        for i, doc in enumerate(docs)
+    ]
+    return Connection(
+        edges=edges,
+        pageInfo=PageInfo(
+            hasNextPage=has_more,
+            hasPreviousPage=after is not None,
+            startCursor=edges[0].cursor if edges else None,
+            endCursor=edges[-1].cursor if edges else None,
+        ),
+    )
+
+
 @strawberry.type
 class Query:
     adventurers: List[Adventurer] = strawberry.field(resolver=get_adventurers)
@@ -1435,28 +1859,156 @@ class Query:
     battles: List[Battle] = strawberry.field(resolver=get_battles)
     items: List[Item] = strawberry.field(resolver=get_items)
     market: List[Market] = strawberry.field(resolver=get_market)
+    adventurersConnection: Connection[Adventurer] = strawberry.field(
+        resolver=get_adventurers_connection
+    )
+    discoveriesConnection: Connection[Discovery] = strawberry.field(
+        resolver=get_discoveries_connection
+    )
+    beastsConnection: Connection[Beast] = strawberry.field(
+        resolver=get_beasts_connection
+    )
+    battlesConnection: Connection[Battle] = strawberry.field(
+        resolver=get_battles_connection
+    )
+    itemsConnection: Connection[Item] = strawberry.field(resolver=get_items_connection)
+    marketConnection: Connection[Market] = strawberry.field(
+        resolver=get_market_connection
+    )
+    leaderboard: Connection[LeaderboardEntry] = strawberry.field(
+        resolver=get_leaderboard
+    )
+
+
+async def subscribe(info, collection, key, from_mongo):
+    context = info.context
+    async for doc in context["feeds"][collection].listen(key):
+        # every update is resolved like a request of its own
+        context["loaders"] = create_loaders(context["db"], context["executor"])
+        yield from_mongo(doc)
+
+
+async def adventurer_updated(info, id: FeltValue) -> AsyncGenerator[Adventurer, None]:
+    async for adventurer in subscribe(info, "adventurers", id, Adventurer.from_mongo):
+        yield adventurer
+
+
+async def battles_for(info, adventurerId: FeltValue) -> AsyncGenerator[Battle, None]:
+    async for battle in subscribe(info, "battles", adventurerId, Battle.from_mongo):
+        yield battle
+
+
+async def market_updated(info) -> AsyncGenerator[Item, None]:
+    async for item in subscribe(info, "items", None, Item.from_mongo):
+        yield item
+
+
+@strawberry.type
+class Subscription:
+    adventurerUpdated: Adventurer = strawberry.subscription(resolver=adventurer_updated)
+    battlesFor: Battle = strawberry.subscription(resolver=battles_for)
+    marketUpdated: Item = strawberry.subscription(resolver=market_updated)
+
+
+class IndexerHTTPHandler(CachingHTTPHandler, PersistedQueryHTTPHandler):
+    pass
 
 
 class IndexerGraphQLView(GraphQLView):
-    def __init__(self, db, **kwargs):
+    def __init__(
+        self,
+        db,
+        executor,
+        persisted_queries,
+        cache=None,
+        network=None,
+        feeds=None,
+        **kwargs,
+    ):
         super().__init__(**kwargs)
         self._db = db
+        self._executor = executor
+        self._feeds = feeds
+        self.http_handler_class = partial(
+            IndexerHTTPHandler,
+            cache=cache,
+            network=network,
+            persisted_queries=persisted_queries,
+        )
 
-    async def get_context(self, _request, _response):
-        return {"db": self._db}
-
-
-async def run_graphql_api(mongo_goerli=None, mongo_devnet=None, port="8080"):
-    mongo_goerli = MongoClient(mongo_goerli)
-    mongo_devnet = MongoClient(mongo_devnet)
+    async def process_result(self, request, result):
+        request["graphql_errors"] = bool(result.errors)
+        return await super().process_result(request, result)
+
+    async def get_context(self, request, response):
+        # loaders cache by key, so they must not outlive the request
+        return {
+            "db": self._db,
+            "executor": self._executor,
+            "feeds": self._feeds,
+            "loaders": create_loaders(self._db, self._executor),
+        }
+
+
+async def run_graphql_api(
+    mongo_goerli=None,
+    mongo_devnet=None,
+    port="8080",
+    max_workers=16,
+    max_pool_size=100,
+    response_cache_size=64 * 1024 * 1024,
+    head_poll_interval=1.0,
+    query_cache_size=1000,
+):
+    mongo_goerli = MongoClient(mongo_goerli, maxPoolSize=max_pool_size)
+    mongo_devnet = MongoClient(mongo_devnet, maxPoolSize=max_pool_size)
     db_name_goerli = "loot-survivor-indexer-goerli".replace("-", "_")
     db_name_devnet = "loot-survivor-indexer-devnet".replace("-", "_")
     db_goerli = mongo_goerli[db_name_goerli]
     db_devnet = mongo_devnet[db_name_devnet]
 
-    schema = strawberry.Schema(query=Query)
-    view_goerli = IndexerGraphQLView(db_goerli, schema=schema)
-    view_devnet = IndexerGraphQLView(db_devnet, schema=schema)
+    # bounds the number of queries running against Mongo at once
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    cache = ResponseCache(response_cache_size)
+    feeds = {}
+    for network, db in (("goerli", db_goerli), ("devnet", db_devnet)):
+        asyncio.create_task(
+            watch_head(cache, network, db, executor, interval=head_poll_interval)
+        )
+        # one watcher per network, whatever the number of subscribers
+        feeds[network] = create_feeds()
+        asyncio.create_task(
+            watch_changes(feeds[network], db, executor, interval=head_poll_interval)
+        )
+
+    schema = strawberry.Schema(
+        query=Query,
+        subscription=Subscription,
+        extensions=[
+            ParserCache(maxsize=query_cache_size),
+            ValidationCache(maxsize=query_cache_size),
+        ],
+    )
+    persisted_queries = PersistedQueries(query_cache_size)
+    view_goerli = IndexerGraphQLView(
+        db_goerli,
+        executor,
+        persisted_queries,
+        cache=cache,
+        network="goerli",
+        feeds=feeds["goerli"],
+        schema=schema,
+    )
+    view_devnet = IndexerGraphQLView(
+        db_devnet,
+        executor,
+        persisted_queries,
+        cache=cache,
+        network="devnet",
+        feeds=feeds["devnet"],
+        schema=schema,
+    )
 
     app = web.Application()
     # app.router.add_route("*", "/graphql", view)
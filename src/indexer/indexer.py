@@ -1,8 +1,10 @@
 import os
-import logging
+import time
+from collections import Counter
 from datetime import datetime
+from types import MappingProxyType
 
-from apibara.indexer import IndexerRunner, IndexerRunnerConfiguration, Info
+from apibara.indexer import IndexerRunnerConfiguration, Info
 from apibara.indexer.indexer import IndexerConfiguration
 from apibara.protocol.proto.stream_pb2 import Cursor, DataFinality
 from apibara.starknet import EventFilter, Filter, StarkNetIndexer, felt
@@ -11,7 +13,6 @@ from apibara.starknet.proto.starknet_pb2 import Block
 from starknet_py.contract import ContractFunction
 from apibara.starknet.proto.types_pb2 import FieldElement
 
-from typing import List
 
 from indexer.config import Config
 from indexer.decoder import (
@@ -38,13 +39,19 @@ from indexer.utils import (
     check_exists_int,
     check_exists_timestamp,
     encode_int_as_bytes,
+    felt_to_bytes,
 )
-
-# Print apibara logs
-root_logger = logging.getLogger("apibara")
-# change to `logging.DEBUG` to print more information
-root_logger.setLevel(logging.INFO)
-root_logger.addHandler(logging.StreamHandler())
+from indexer.backfill import backfill_from_archive
+from indexer.cache import EntityCache
+from indexer.indexes import (
+    ADVENTURER_STATS_FIELDS,
+    LEADERBOARD_FIELDS,
+    ensure_indexes,
+)
+from indexer.log import log_event, logger
+from indexer.metrics import IndexerMetrics, start_metrics_server
+from indexer.runner import ChainIndexerRunner
+from indexer.storage import BlockWriteBuffer, MongoChainStore, OpLog
 
 
 def encode_str_as_bytes(value):
@@ -52,14 +59,15 @@ def encode_str_as_bytes(value):
     return felt.to_bytes(32, "big")
 
 
-def encode_hex_as_bytes(value):
-    return bytes.fromhex(value.replace("0x", ""))
-
-
 class LootSurvivorIndexer(StarkNetIndexer):
-    def __init__(self, config):
+    def __init__(self, config, cache_size=10_000, metrics=None):
         super().__init__()
         self.config = config
+        self.cache = EntityCache(cache_size)
+        self.metrics = IndexerMetrics() if metrics is None else metrics
+        self.handlers = MappingProxyType({})
+        self.unknown_events = Counter()
+        self.indexes_ready = False
 
     def indexer_id(self) -> str:
         return f"loot-survivor-indexer-{self.config.network}"
@@ -67,47 +75,74 @@ class LootSurvivorIndexer(StarkNetIndexer):
     def initial_configuration(self) -> Filter:
         # Return initial configuration of the indexer.
         filter = Filter().with_header(weak=True)
-        self.event_map = dict()
+        handlers = dict()
 
-        def add_filter(contract, event):
+        def add_filter(contract, event, decoder, handler):
+            address = felt.from_hex(contract)
             selector = ContractFunction.get_selector(event)
-            self.event_map[selector] = event
+            handlers[(felt_to_bytes(address), selector.to_bytes(32, "big"))] = (
+                decoder,
+                handler,
+            )
             filter.add_event(
                 EventFilter()
-                .with_from_address(felt.from_hex(contract))
+                .with_from_address(address)
                 .with_keys([felt.from_int(selector)])
             )
 
-        # beast contract
+        # adventurer contract
         for adventurer_event in [
-            "MintAdventurer",
-            "UpdateAdventurerState",
-            "Discovery",
-            "UpdatedThiefState",
+            ("MintAdventurer", decode_mint_adventurer_event, self.mint_adventurer),
+            (
+                "UpdateAdventurerState",
+                decode_update_adventurer_state_event,
+                self.update_adventurer_state,
+            ),
+            ("Discovery", decode_discovery_event, self.discovery),
+            (
+                "UpdatedThiefState",
+                decode_update_thief_state_event,
+                self.update_thief,
+            ),
         ]:
-            add_filter(self.config.ADVENTURER_CONTRACT, adventurer_event)
+            add_filter(self.config.ADVENTURER_CONTRACT, *adventurer_event)
 
         # beast contract
         for beast_event in [
-            "CreateBeast",
-            "UpdateBeastState",
-            "BeastAttacked",
-            "AdventurerAttacked",
-            "UpdateGoldBalance",
-            "FledBeast",
-            "AdventurerAmbushed",
+            ("CreateBeast", decode_create_beast_event, self.create_beast),
+            ("UpdateBeastState", decode_beast_state_event, self.update_beast_state),
+            ("BeastAttacked", decode_beast_attacked_event, self.beast_attacked),
+            (
+                "AdventurerAttacked",
+                decode_adventurer_attacked_event,
+                self.adventurer_attacked,
+            ),
+            ("UpdateGoldBalance", decode_update_gold_event, self.update_gold),
+            ("FledBeast", decode_fled_beast_event, self.fled_beast),
+            (
+                "AdventurerAmbushed",
+                decode_adventurer_ambushed_event,
+                self.adventurer_ambushed,
+            ),
         ]:
-            add_filter(self.config.BEAST_CONTRACT, beast_event)
+            add_filter(self.config.BEAST_CONTRACT, *beast_event)
 
         # loot contract
         for loot_event in [
-            "MintItem",
-            "UpdateItemState",
-            "MintDailyItems",
-            "ClaimItem",
-            "ItemMerchantUpdate",
+            ("MintItem", decode_mint_item_event, self.mint_item),
+            ("UpdateItemState", decode_item_state_event, self.update_item_state),
+            ("MintDailyItems", decode_mint_daily_items_event, self.mint_daily_items),
+            ("ClaimItem", decode_claim_item_event, self.claim_item),
+            (
+                "ItemMerchantUpdate",
+                decode_item_merchant_update_event,
+                self.update_merchant_item,
+            ),
         ]:
-            add_filter(self.config.LOOT_CONTRACT, loot_event)
+            add_filter(self.config.LOOT_CONTRACT, *loot_event)
+
+        # (from_address, selector) -> (decoder, handler)
+        self.handlers = MappingProxyType(handlers)
 
         if self.config.network == "devnet":
             finality = DataFinality.DATA_STATUS_ACCEPTED
@@ -120,65 +155,156 @@ class LootSurvivorIndexer(StarkNetIndexer):
             finality=finality,
         )
 
+    def create_store(self, info: Info):
+        """Return the store the writes of the block in `info` are flushed to."""
+        if not self.indexes_ready:
+            # created here, after the runner has dropped the database on restart
+            ensure_indexes(info.storage._db)
+            self.indexes_ready = True
+        return MongoChainStore.from_storage(info.storage, metrics=self.metrics)
+
     async def handle_data(self, info: Info, data: Block):
+        block_start = time.perf_counter()
+        logger.info(
+            "indexing block",
+            extra={
+                "fields": {
+                    "block": data.header.block_number,
+                    "events": len(data.events),
+                }
+            },
+        )
+        writes = BlockWriteBuffer(self.create_store(info), cache=self.cache)
+        await self.handle_events(writes, data)
+        await writes.flush()
+        self.block_indexed(
+            data.header.block_number, data.header.timestamp.seconds, block_start
+        )
+
+    async def handle_events(self, writes, data: Block):
+        """Run the handlers of every event of `data`, writing to `writes`."""
+        metrics = self.metrics
         block_time = data.header.timestamp.ToDatetime()
-        print(f"Indexing block {data.header.block_number}")
-        # Handle one block of data
+        handlers = self.handlers
         for event_with_tx in data.events:
             event = event_with_tx.event
-            event_name = self.event_map[felt.to_int(event.keys[0])]
-            await {
-                "MintAdventurer": self.mint_adventurer,
-                "UpdateAdventurerState": self.update_adventurer_state,
-                "Discovery": self.discovery,
-                "UpdatedThiefState": self.update_thief,
-                "CreateBeast": self.create_beast,
-                "UpdateBeastState": self.update_beast_state,
-                "BeastAttacked": self.beast_attacked,
-                "AdventurerAttacked": self.adventurer_attacked,
-                "FledBeast": self.fled_beast,
-                "AvdenturerAmbushed": self.adventurer_ambushed,
-                "UpdateGoldBalance": self.update_gold,
-                "MintItem": self.mint_item,
-                "UpdateItemState": self.update_item_state,
-                "MintDailyItems": self.mint_daily_items,
-                "ClaimItem": self.claim_item,
-                "ItemMerchantUpdate": self.update_merchant_item,
-            }[event_name](
-                info,
+            key = (felt_to_bytes(event.from_address), felt_to_bytes(event.keys[0]))
+            handler = handlers.get(key)
+            if handler is None:
+                self.unknown_events[key] += 1
+                metrics.unknown_events.inc()
+                continue
+            decode, handle = handler
+            name = handle.__name__
+            start = time.perf_counter()
+            record = decode(event.data)
+            decoded = time.perf_counter()
+            await handle(
+                writes,
                 block_time,
                 event.from_address,
-                felt.to_hex(event_with_tx.transaction.meta.hash),
-                event.data,
+                # stored as 32 big-endian bytes, like the hex string decoded before
+                felt_to_bytes(event_with_tx.transaction.meta.hash),
+                record,
             )
+            metrics.decode_seconds.observe(decoded - start, name)
+            metrics.handler_seconds.observe(time.perf_counter() - decoded, name)
+            metrics.events.inc(name)
+
+    async def handle_ops(self, info: Info, block_number, timestamp, ops: OpLog):
+        """Apply the writes recorded for a block in another process."""
+        block_start = time.perf_counter()
+        writes = BlockWriteBuffer(self.create_store(info), cache=self.cache)
+        await ops.replay(writes)
+        await writes.flush()
+        self.block_indexed(block_number, timestamp, block_start)
+
+    async def handle_batch(self, info: Info, blocks):
+        """Index accepted `blocks` with a single flush, as of the last one.
+
+        Entities changed by several blocks get one version, valid from the
+        last block of the batch.
+        """
+        block_start = time.perf_counter()
+        writes = BlockWriteBuffer(self.create_store(info), cache=self.cache)
+        for data in blocks:
+            await self.handle_events(writes, data)
+        await writes.flush()
+        last = blocks[-1].header
+        self.block_indexed(
+            last.block_number, last.timestamp.seconds, block_start, count=len(blocks)
+        )
+
+    def block_indexed(self, block_number, timestamp, block_start, count=1):
+        metrics = self.metrics
+        metrics.blocks.inc(amount=count)
+        metrics.block_seconds.observe(time.perf_counter() - block_start)
+        metrics.set_block(block_number, timestamp)
+
+    async def update_leaderboard(
+        self, writes: BlockWriteBuffer, adventurer_id, block_time, **fields
+    ):
+        """Keep the `leaderboard` entry of an adventurer in step with its state.
+
+        Values are stored as numbers, unlike the adventurer documents, so the
+        leaderboard sorts and pages on them from a single index.
+        """
+        await writes.upsert_one(
+            "leaderboard",
+            {"adventurerId": encode_int_as_bytes(adventurer_id)},
+            {
+                "$set": {**fields, "lastUpdated": block_time},
+                "$setOnInsert": {
+                    field: 0 for field in LEADERBOARD_FIELDS if field not in fields
+                },
+            },
+        )
+
+    async def update_stats(
+        self, writes: BlockWriteBuffer, adventurer_id, block_time, **counters
+    ):
+        """Add `counters` to the `adventurerStats` of an adventurer.
+
+        A battle is counted when it ends: the beast is slain, the adventurer
+        flees or is killed. Every increment makes a new version, so a chain
+        reorganisation rolls the totals back with the battles they count.
+        """
+        await writes.upsert_one(
+            "adventurerStats",
+            {"adventurerId": encode_int_as_bytes(adventurer_id)},
+            {
+                "$inc": counters,
+                "$set": {"lastUpdated": block_time},
+                "$setOnInsert": dict.fromkeys(ADVENTURER_STATS_FIELDS, 0),
+            },
+        )
 
     async def mint_adventurer(
         self,
-        info: Info,
+        writes: BlockWriteBuffer,
         block_time: datetime,
         _: FieldElement,
-        tx_hash: str,
-        data,
+        tx_hash: bytes,
+        ma,
     ):
-        ma = decode_mint_adventurer_event(data)
         mint_adventurer_doc = {
             "id": check_exists_int(ma.adventurer_id),
             "owner": check_exists_int(ma.owner),
             "gold": check_exists_int(20),
             "lastUpdated": block_time,
         }
-        await info.storage.insert_one("adventurers", mint_adventurer_doc)
-        print("- [mint adventurer]", ma.adventurer_id, "->", hex(ma.owner))
+        await writes.insert_one("adventurers", mint_adventurer_doc)
+        await self.update_leaderboard(writes, ma.adventurer_id, block_time, gold=20)
+        log_event("mint adventurer", adventurer_id=ma.adventurer_id, owner=ma.owner)
 
     async def update_adventurer_state(
         self,
-        info: Info,
+        writes: BlockWriteBuffer,
         block_time: datetime,
         _: FieldElement,
-        tx_hash: str,
-        data,
+        tx_hash: bytes,
+        ua,
     ):
-        ua = decode_update_adventurer_state_event(data)
         update_adventurer_doc = {
             "id": check_exists_int(ua.adventurer_id),
             "race": check_exists_int(ua.adventurer_state["Race"]),
@@ -211,32 +337,40 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "upgrading": encode_int_as_bytes(ua.adventurer_state["Upgrading"]),
             "lastUpdated": block_time,
         }
-        await info.storage.find_one_and_update(
+        await writes.find_one_and_update(
             "adventurers",
             {
                 "id": encode_int_as_bytes(ua.adventurer_id),
             },
             {"$set": update_adventurer_doc},
         )
-        print(
-            "- [update adventurer state]", ua.adventurer_id, "->", ua.adventurer_state
+        await self.update_leaderboard(
+            writes,
+            ua.adventurer_id,
+            block_time,
+            xp=ua.adventurer_state["XP"],
+            level=ua.adventurer_state["Level"],
+        )
+        log_event(
+            "update adventurer state",
+            adventurer_id=ua.adventurer_id,
+            state=ua.adventurer_state,
         )
 
     async def discovery(
         self,
-        info: Info,
+        writes: BlockWriteBuffer,
         block_time: datetime,
         _: FieldElement,
-        tx_hash: str,
-        data: List[FieldElement],
+        tx_hash: bytes,
+        d,
     ):
-        d = decode_discovery_event(data)
         if d.discovery_type == 1:
             sub_discovery_type = d.sub_discovery_type + 16
         else:
             sub_discovery_type = d.sub_discovery_type
         discovery_doc = {
-            "txHash": encode_hex_as_bytes(tx_hash),
+            "txHash": tx_hash,
             "adventurerId": check_exists_int(d.adventurer_id),
             "discoveryType": encode_int_as_bytes(d.discovery_type),
             "subDiscoveryType": check_exists_int(sub_discovery_type),
@@ -244,56 +378,46 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "outputAmount": encode_int_as_bytes(d.output_amount),
             "discoveryTime": block_time,
         }
-        await info.storage.insert_one("discoveries", discovery_doc)
-        print("- [discovery]", d.adventurer_id, "->", d.discovery_type)
+        await writes.insert_one("discoveries", discovery_doc)
+        log_event(
+            "discovery", adventurer_id=d.adventurer_id, discovery_type=d.discovery_type
+        )
 
     async def update_thief(
         self,
-        info: Info,
+        writes: BlockWriteBuffer,
         block_time: datetime,
         _: FieldElement,
-        tx_hash: FieldElement,
-        data: List[FieldElement],
+        tx_hash: bytes,
+        ut,
     ):
-        ut = decode_update_thief_state_event(data)
         heist_doc = {
             "thiefId": check_exists_int(ut.thief_state["AdventurerId"]),
             "startTime": check_exists_int(ut.thief_state["StartTime"]),
             "gold": check_exists_int(ut.thief_state["Gold"]),
             "lastUpdated": block_time,
         }
-        thief_state = await info.storage.find_one(
+        await writes.upsert_one(
             "heists",
             {
-                "beastId": encode_int_as_bytes(ut.thief_state["AdventurerId"]),
+                "thiefId": encode_int_as_bytes(ut.thief_state["AdventurerId"]),
             },
+            {"$set": heist_doc},
+        )
+        log_event(
+            "update thief",
+            adventurer_id=ut.thief_state["AdventurerId"],
+            state=ut.thief_state,
         )
-        if thief_state:
-            await info.storage.find_one_and_update(
-                "heists",
-                {
-                    "thiefId": encode_int_as_bytes(ut.thief_state["AdventurerId"]),
-                },
-                {
-                    "$set": heist_doc,
-                },
-            )
-        else:
-            await info.storage.insert_one(
-                "heists",
-                heist_doc,
-            )
-        print("- [update thief]", ut.thief_state["AdventurerId"], "->", ut.thief_state)
 
     async def create_beast(
         self,
-        info: Info,
+        writes: BlockWriteBuffer,
         block_time: datetime,
         _: FieldElement,
-        tx_hash: FieldElement,
-        data: List[FieldElement],
+        tx_hash: bytes,
+        cb,
     ):
-        cb = decode_create_beast_event(data)
         beast_doc = {
             "id": check_exists_int(cb.beast_token_id),
             "adventurerId": check_exists_int(cb.beast_state["Adventurer"]),
@@ -310,18 +434,17 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "slainOnDate": datetime.fromtimestamp(cb.beast_state["SlainOnDate"]),
             "lastUpdated": block_time,
         }
-        await info.storage.insert_one("beasts", beast_doc)
-        print("- [create beast]", cb.beast_token_id, "->", cb.beast_state)
+        await writes.insert_one("beasts", beast_doc)
+        log_event("create beast", beast_id=cb.beast_token_id, state=cb.beast_state)
 
     async def update_beast_state(
         self,
-        info: Info,
+        writes: BlockWriteBuffer,
         block_time: datetime,
         _: FieldElement,
-        tx_hash: FieldElement,
-        data: List[FieldElement],
+        tx_hash: bytes,
+        ub,
     ):
-        ub = decode_beast_state_event(data)
         update_beast_doc = {
             "id": check_exists_int(ub.beast_token_id),
             "adventurerId": check_exists_int(ub.beast_state["Adventurer"]),
@@ -337,40 +460,27 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "slainOnDate": datetime.fromtimestamp(ub.beast_state["SlainOnDate"]),
             "lastUpdated": block_time,
         }
-        beast_state = await info.storage.find_one(
+        await writes.upsert_one(
             "beasts",
             {
                 "id": encode_int_as_bytes(ub.beast_token_id),
             },
+            {"$set": update_beast_doc},
+        )
+        log_event(
+            "update beast state", beast_id=ub.beast_token_id, state=ub.beast_state
         )
-        if beast_state:
-            await info.storage.find_one_and_update(
-                "beasts",
-                {
-                    "id": encode_int_as_bytes(ub.beast_token_id),
-                },
-                {
-                    "$set": update_beast_doc,
-                },
-            )
-        else:
-            await info.storage.insert_one(
-                "beasts",
-                update_beast_doc,
-            )
-        print("- [update beast state]", ub.beast_token_id, "->", ub.beast_state)
 
     async def beast_attacked(
         self,
-        info: Info,
+        writes: BlockWriteBuffer,
         block_time: datetime,
         _: FieldElement,
-        tx_hash: str,
-        data: List[FieldElement],
+        tx_hash: bytes,
+        ba,
     ):
-        ba = decode_beast_attacked_event(data)
         attacked_beast_doc = {
-            "txHash": encode_hex_as_bytes(tx_hash),
+            "txHash": tx_hash,
             "beastId": check_exists_int(ba.beast_token_id),
             "adventurerId": check_exists_int(ba.adventurer_token_id),
             "attacker": encode_int_as_bytes(1),
@@ -382,27 +492,34 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "goldEarned": encode_int_as_bytes(ba.gold_reward),
             "timestamp": block_time,
         }
-        await info.storage.insert_one("battles", attacked_beast_doc)
-        print(
-            "- [beast attacked]",
-            ba.beast_token_id,
-            "->",
+        await writes.insert_one("battles", attacked_beast_doc)
+        await self.update_stats(
+            writes,
             ba.adventurer_token_id,
-            "-",
-            attacked_beast_doc,
+            block_time,
+            battles=1 if ba.beast_health == 0 else 0,
+            damageDealt=ba.damage,
+            beastsSlain=1 if ba.beast_health == 0 else 0,
+            goldEarned=ba.gold_reward,
+            xpEarned=ba.xp_gained,
+        )
+        log_event(
+            "beast attacked",
+            beast_id=ba.beast_token_id,
+            adventurer_id=ba.adventurer_token_id,
+            battle=attacked_beast_doc,
         )
 
     async def adventurer_attacked(
         self,
-        info: Info,
+        writes: BlockWriteBuffer,
         block_time: datetime,
         _: FieldElement,
-        tx_hash: FieldElement,
-        data: List[FieldElement],
+        tx_hash: bytes,
+        aa,
     ):
-        aa = decode_adventurer_attacked_event(data)
         attacked_adventurer_doc = {
-            "txHash": encode_hex_as_bytes(tx_hash),
+            "txHash": tx_hash,
             "beastId": check_exists_int(aa.beast_token_id),
             "adventurerId": check_exists_int(aa.adventurer_token_id),
             "attacker": check_exists_int(2),
@@ -414,30 +531,36 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "goldEarned": encode_int_as_bytes(aa.gold_reward),
             "timestamp": block_time,
         }
-        await info.storage.insert_one(
+        await writes.insert_one(
             "battles",
             attacked_adventurer_doc,
         )
-        print(
-            "- [adventurer attacked]",
+        await self.update_stats(
+            writes,
             aa.adventurer_token_id,
-            "->",
-            aa.beast_token_id,
-            "-",
-            attacked_adventurer_doc,
+            block_time,
+            battles=1 if aa.adventurer_health == 0 else 0,
+            damageTaken=aa.damage,
+            goldEarned=aa.gold_reward,
+            xpEarned=aa.xp_gained,
+        )
+        log_event(
+            "adventurer attacked",
+            adventurer_id=aa.adventurer_token_id,
+            beast_id=aa.beast_token_id,
+            battle=attacked_adventurer_doc,
         )
 
     async def fled_beast(
         self,
-        info: Info,
+        writes: BlockWriteBuffer,
         block_time: datetime,
         _: FieldElement,
-        tx_hash: FieldElement,
-        data: List[FieldElement],
+        tx_hash: bytes,
+        fb,
     ):
-        fb = decode_fled_beast_event(data)
         fled_beast_doc = {
-            "txHash": encode_hex_as_bytes(tx_hash),
+            "txHash": tx_hash,
             "beastId": check_exists_int(fb.beast_token_id),
             "adventurerId": check_exists_int(fb.adventurer_token_id),
             "attacker": check_exists_int(1),
@@ -449,30 +572,30 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "goldEarned": encode_int_as_bytes(0),
             "timestamp": block_time,
         }
-        await info.storage.insert_one(
+        await writes.insert_one(
             "battles",
             fled_beast_doc,
         )
-        print(
-            "- [adventurer fled beast]",
-            fb.adventurer_token_id,
-            "->",
-            fb.beast_token_id,
-            "-",
-            fled_beast_doc,
+        await self.update_stats(
+            writes, fb.adventurer_token_id, block_time, battles=1, timesFled=1
+        )
+        log_event(
+            "adventurer fled beast",
+            adventurer_id=fb.adventurer_token_id,
+            beast_id=fb.beast_token_id,
+            battle=fled_beast_doc,
         )
 
     async def adventurer_ambushed(
         self,
-        info: Info,
+        writes: BlockWriteBuffer,
         block_time: datetime,
         _: FieldElement,
-        tx_hash: FieldElement,
-        data: List[FieldElement],
+        tx_hash: bytes,
+        aa,
     ):
-        aa = decode_adventurer_ambushed_event(data)
         adventurer_ambushed_doc = {
-            "txHash": encode_hex_as_bytes(tx_hash),
+            "txHash": tx_hash,
             "beastId": check_exists_int(aa.beast_token_id),
             "adventurerId": check_exists_int(aa.adventurer_token_id),
             "attacker": check_exists_int(2),
@@ -484,63 +607,58 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "goldEarned": encode_int_as_bytes(0),
             "timestamp": block_time,
         }
-        await info.storage.insert_one(
+        await writes.insert_one(
             "battles",
             adventurer_ambushed_doc,
         )
-        print(
-            "- [adventurer ambushed]",
+        await self.update_stats(
+            writes,
             aa.adventurer_token_id,
-            "->",
-            aa.beast_token_id,
-            "-",
-            adventurer_ambushed_doc,
+            block_time,
+            battles=1 if aa.adventurer_health == 0 else 0,
+            damageTaken=aa.damage,
+            timesAmbushed=1,
+        )
+        log_event(
+            "adventurer ambushed",
+            adventurer_id=aa.adventurer_token_id,
+            beast_id=aa.beast_token_id,
+            battle=adventurer_ambushed_doc,
         )
 
     async def update_gold(
         self,
-        info: Info,
+        writes: BlockWriteBuffer,
         block_time: datetime,
         _: FieldElement,
-        tx_hash: str,
-        data: List[FieldElement],
+        tx_hash: bytes,
+        ug,
     ):
-        ug = decode_update_gold_event(data)
         update_gold_doc = {
             "id": check_exists_int(ug.adventurer_token_id),
             "gold": check_exists_int(ug.balance),
             "lastUpdated": block_time,
         }
-        adventurer = await info.storage.find_one(
+        await writes.upsert_one(
             "adventurers",
             {
                 "id": check_exists_int(ug.adventurer_token_id),
             },
+            {"$set": update_gold_doc},
         )
-        if adventurer:
-            await info.storage.find_one_and_update(
-                "adventurers",
-                {
-                    "id": check_exists_int(ug.adventurer_token_id),
-                },
-                {"$set": update_gold_doc},
-            )
-        else:
-            await info.storage.insert_one(
-                "adventurers",
-                update_gold_doc,
-            )
-        print("- [update gold]", ug.adventurer_token_id, "->", ug.balance, "gold")
+        await self.update_leaderboard(
+            writes, ug.adventurer_token_id, block_time, gold=ug.balance
+        )
+        log_event("update gold", adventurer_id=ug.adventurer_token_id, gold=ug.balance)
 
     async def mint_item(
         self,
-        info: Info,
+        writes: BlockWriteBuffer,
         block_time: datetime,
         _: FieldElement,
-        tx_hash: str,
-        data: List[FieldElement],
+        tx_hash: bytes,
+        mi,
     ):
-        mi = decode_mint_item_event(data)
         update_item_doc = {
             "id": check_exists_int(mi.item_token_id),
             "owner": check_exists_int(mi.to),
@@ -548,9 +666,6 @@ class LootSurvivorIndexer(StarkNetIndexer):
         }
         insert_item_doc = {
             "marketId": None,
-            "id": check_exists_int(mi.item_token_id),
-            "owner": check_exists_int(mi.to),
-            "ownerAdventurerId": check_exists_int(mi.adventurer_token_id),
             "item": None,
             "slot": None,
             "type": None,
@@ -571,36 +686,23 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "claimedTime": None,
             "lastUpdated": block_time,
         }
-        item_state = await info.storage.find_one(
+        await writes.upsert_one(
             "items",
             {
                 "id": check_exists_int(mi.item_token_id),
             },
+            {"$set": update_item_doc, "$setOnInsert": insert_item_doc},
         )
-        if item_state:
-            await info.storage.find_one_and_update(
-                "items",
-                {
-                    "id": check_exists_int(mi.item_token_id),
-                },
-                {"$set": update_item_doc},
-            )
-        else:
-            await info.storage.insert_one(
-                "items",
-                insert_item_doc,
-            )
-        print("- [mint item]", mi.item_token_id, "->", update_item_doc)
+        log_event("mint item", item_id=mi.item_token_id, item=update_item_doc)
 
     async def update_item_state(
         self,
-        info: Info,
+        writes: BlockWriteBuffer,
         block_time: datetime,
         _: FieldElement,
-        tx_hash: str,
-        data: List[FieldElement],
+        tx_hash: bytes,
+        ui,
     ):
-        ui = decode_item_state_event(data)
         update_item_doc = {
             "id": check_exists_int(ui.item_token_id),
             "item": check_exists_int(ui.item["Id"]),
@@ -620,76 +722,47 @@ class LootSurvivorIndexer(StarkNetIndexer):
         }
         insert_item_doc = {
             "marketId": None,
-            "id": check_exists_int(ui.item_token_id),
             "owner": None,
             "ownerAdventurerId": None,
-            "item": check_exists_int(ui.item["Id"]),
-            "slot": check_exists_int(ui.item["Slot"]),
-            "type": check_exists_int(ui.item["Type"]),
-            "material": check_exists_int(ui.item["Material"]),
-            "rank": check_exists_int(ui.item["Rank"]),
-            "prefix1": check_exists_int(ui.item["Prefix_1"]),
-            "prefix2": check_exists_int(ui.item["Prefix_2"]),
-            "suffix": check_exists_int(ui.item["Suffix"]),
-            "greatness": check_exists_int(ui.item["Greatness"]),
-            "createdBlock": check_exists_int(ui.item["CreatedBlock"]),
-            "xp": encode_int_as_bytes(ui.item["XP"]),
-            "equippedAdventurerId": check_exists_int(ui.item["Adventurer"]),
-            "bag": check_exists_int(ui.item["Bag"]),
             "price": None,
             "expiry": None,
             "bidder": None,
             "status": None,
             "claimedTime": None,
-            "lastUpdated": block_time,
         }
-        item_state = await info.storage.find_one(
+        await writes.upsert_one(
             "items",
             {
                 "id": check_exists_int(ui.item_token_id),
             },
+            {"$set": update_item_doc, "$setOnInsert": insert_item_doc},
         )
-        if item_state:
-            await info.storage.find_one_and_update(
-                "items",
-                {
-                    "id": check_exists_int(ui.item_token_id),
-                },
-                {"$set": update_item_doc},
-            )
-        else:
-            await info.storage.insert_one(
-                "items",
-                insert_item_doc,
-            )
-        print("- [update item state]", ui.item_token_id, "->", update_item_doc)
+        log_event("update item state", item_id=ui.item_token_id, item=update_item_doc)
 
     async def mint_daily_items(
         self,
-        info: Info,
+        writes: BlockWriteBuffer,
         block_time: datetime,
         _: FieldElement,
-        tx_hash: str,
-        data: List[FieldElement],
+        tx_hash: bytes,
+        mdi,
     ):
-        mdi = decode_mint_daily_items_event(data)
         mint_daily_items_doc = {
             "caller": check_exists_int(mdi.caller),
             "itemsNumber": check_exists_int(mdi.items_number),
             "timestamp": block_time,
         }
-        await info.storage.insert_one("market", mint_daily_items_doc)
-        print("- [mint daily items]", mdi.caller, "->", mdi.items_number)
+        await writes.insert_one("market", mint_daily_items_doc)
+        log_event("mint daily items", caller=mdi.caller, items_number=mdi.items_number)
 
     async def claim_item(
         self,
-        info: Info,
+        writes: BlockWriteBuffer,
         block_time: datetime,
         _: FieldElement,
-        tx_hash: str,
-        data: List[FieldElement],
+        tx_hash: bytes,
+        ci,
     ):
-        ci = decode_claim_item_event(data)
         claim_item_doc = {
             "marketId": check_exists_int(ci.market_token_id),
             "id": check_exists_int(ci.item_token_id),
@@ -698,7 +771,7 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "claimedTime": block_time,
             "status": encode_int_as_bytes(0),
         }
-        await info.storage.find_one_and_update(
+        await writes.find_one_and_update(
             "items",
             {
                 "marketId": check_exists_int(ci.market_token_id),
@@ -708,20 +781,19 @@ class LootSurvivorIndexer(StarkNetIndexer):
             },
         )
         # Here we implement a fix for minting a mart item
-        await info.storage.delete_one(
+        await writes.delete_one(
             "items", {"id": check_exists_int(ci.item_token_id), "marketId": None}
         )
-        print("- [claim item]", ci.market_token_id, "->", ci.item_token_id)
+        log_event("claim item", market_id=ci.market_token_id, item_id=ci.item_token_id)
 
     async def update_merchant_item(
         self,
-        info: Info,
+        writes: BlockWriteBuffer,
         block_time: datetime,
         _: FieldElement,
-        tx_hash: str,
-        data: List[FieldElement],
+        tx_hash: bytes,
+        um,
     ):
-        um = decode_item_merchant_update_event(data)
         update_merchant_doc = {
             "marketId": check_exists_int(um.market_item_id),
             "item": check_exists_int(um.item["Id"]),
@@ -744,55 +816,39 @@ class LootSurvivorIndexer(StarkNetIndexer):
             "lastUpdated": block_time,
         }
         insert_merchant_doc = {
-            "marketId": check_exists_int(um.market_item_id),
             "id": None,
             "owner": None,
             "ownerAdventurerId": None,
             "claimedTime": None,
-            "item": check_exists_int(um.item["Id"]),
-            "slot": check_exists_int(um.item["Slot"]),
-            "type": check_exists_int(um.item["Type"]),
-            "material": check_exists_int(um.item["Material"]),
-            "rank": check_exists_int(um.item["Rank"]),
-            "prefix1": check_exists_int(um.item["Prefix_1"]),
-            "prefix2": check_exists_int(um.item["Prefix_2"]),
-            "suffix": check_exists_int(um.item["Suffix"]),
-            "greatness": check_exists_int(um.item["Greatness"]),
-            "createdBlock": check_exists_int(um.item["CreatedBlock"]),
-            "xp": encode_int_as_bytes(um.item["XP"]),
-            "equippedAdventurerId": check_exists_int(um.item["Adventurer"]),
-            "bag": check_exists_int(um.item["Bag"]),
-            "price": check_exists_int(um.bid["price"]),
-            "expiry": check_exists_timestamp(um.bid["expiry"]),
-            "bidder": check_exists_int(um.bid["bidder"]),
-            "status": encode_int_as_bytes(um.bid["status"]),
-            "lastUpdated": block_time,
         }
-        market_item = await info.storage.find_one(
+        await writes.upsert_one(
             "items",
             {
                 "marketId": check_exists_int(um.market_item_id),
             },
+            {"$set": update_merchant_doc, "$setOnInsert": insert_merchant_doc},
         )
-        if market_item:
-            await info.storage.find_one_and_update(
-                "items",
-                {
-                    "marketId": check_exists_int(um.market_item_id),
-                },
-                {
-                    "$set": update_merchant_doc,
-                },
-            )
-        else:
-            await info.storage.insert_one(
-                "items",
-                insert_merchant_doc,
-            )
-        print("- [update merchant item]", um.market_item_id, "->", um.bid)
+        log_event("update merchant item", market_id=um.market_item_id, bid=um.bid)
+
+    async def handle_pending_data(self, info: Info, data: Block):
+        # pending writes are rolled back before the next block, keep them out
+        # of the entity cache
+        logger.info(
+            "indexing pending block",
+            extra={
+                "fields": {
+                    "block": data.header.block_number,
+                    "events": len(data.events),
+                }
+            },
+        )
+        writes = BlockWriteBuffer(self.create_store(info))
+        await self.handle_events(writes, data)
+        await writes.flush()
 
-    async def handle_invalidate(self, _info: Info, _cursor: Cursor):
-        raise ValueError("data must be finalized")
+    async def handle_invalidate(self, info: Info, cursor: Cursor):
+        # the documents are rolled back by the runner, through apibara's storage
+        self.cache.invalidate(cursor.order_key)
 
 
 async def run_indexer(
@@ -805,18 +861,27 @@ async def run_indexer(
     beast=None,
     loot=None,
     start_block=None,
+    cache_size=10_000,
+    metrics_port=None,
+    archive=None,
+    backfill_workers=1,
+    catch_up_batch=1,
+    head_lag=60.0,
 ):
     AUTH_TOKEN = os.environ.get("AUTH_TOKEN")
     if server_url == "localhost:7171" or server_url == "apibara:7171":
         stream_ssl = False
-    runner = IndexerRunner(
+    runner = ChainIndexerRunner(
         config=IndexerRunnerConfiguration(
             stream_url=server_url,
             stream_ssl=stream_ssl,
             storage_url=mongo_url,
             token=AUTH_TOKEN,
         ),
-        reset_state=restart,
+        # with an archive the database is reset before the backfill
+        reset_state=restart and archive is None,
+        catch_up_batch=catch_up_batch,
+        head_lag=head_lag,
     )
 
     config = Config(network, adventurer, beast, loot, start_block)
@@ -826,4 +891,19 @@ async def run_indexer(
         ctx = {"network": "starknet-devnet"}
     else:
         ctx = {"network": "starknet-testnet"}
-    await runner.run(LootSurvivorIndexer(config), ctx=ctx)
+    metrics = IndexerMetrics()
+    if metrics_port is not None:
+        await start_metrics_server(metrics, port=metrics_port)
+
+    indexer = LootSurvivorIndexer(config, cache_size=cache_size, metrics=metrics)
+    if archive is not None:
+        await backfill_from_archive(
+            indexer,
+            archive,
+            mongo_url,
+            ctx,
+            restart=restart,
+            workers=backfill_workers,
+        )
+
+    await runner.run(indexer, ctx=ctx)
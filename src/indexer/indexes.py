@@ -0,0 +1,88 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+# Every lookup only wants the current version of a document, so each index
+# ends with `_chain.valid_to` to keep older versions out of the scan.
+INDEXES = {
+    "adventurers": [("id",), ("owner",)],
+    "beasts": [("id",), ("adventurerId",)],
+    "items": [("id",), ("marketId",), ("ownerAdventurerId",), ("owner",)],
+    "heists": [("thiefId",)],
+    "battles": [("adventurerId",), ("beastId",)],
+    "discoveries": [("adventurerId",)],
+    # only looked up through its default sort
+    "market": [],
+    # `current` finds the versions to flag again after an invalidation
+    "leaderboard": [("adventurerId",), ("current",)],
+    "adventurerStats": [("adventurerId",)],
+}
+
+# sort used by the GraphQL list queries when no orderBy is given
+DEFAULT_SORT = {
+    "adventurers": "lastUpdated",
+    "beasts": "lastUpdated",
+    "items": "lastUpdated",
+    "battles": "timestamp",
+    "discoveries": "discoveryTime",
+    "market": "timestamp",
+    "adventurerStats": "lastUpdated",
+}
+
+# numeric fields of the leaderboard entries, besides `adventurerId`
+LEADERBOARD_FIELDS = ("xp", "level", "gold")
+
+# counters of the `adventurerStats` documents
+ADVENTURER_STATS_FIELDS = (
+    "battles",
+    "damageDealt",
+    "damageTaken",
+    "beastsSlain",
+    "timesFled",
+    "timesAmbushed",
+    "goldEarned",
+    "xpEarned",
+)
+
+# leaderboard order, adventurer ids are unique among current versions
+LEADERBOARD_SORT = [("xp", DESCENDING), ("adventurerId", DESCENDING)]
+
+# holds every field the leaderboard query reads, so pages come from the index
+LEADERBOARD_INDEX = (
+    [("current", ASCENDING)]
+    + LEADERBOARD_SORT
+    + [("level", ASCENDING), ("gold", ASCENDING)]
+)
+
+COVERING_INDEXES = {"leaderboard": [LEADERBOARD_INDEX]}
+
+
+def index_models(fields_list, sort_key=None):
+    models = [
+        IndexModel([(field, ASCENDING) for field in fields + ("_chain.valid_to",)])
+        for fields in fields_list
+    ]
+    if sort_key is not None:
+        # current versions in default sort order, `_id` breaks ties for paging
+        models.append(
+            IndexModel(
+                [
+                    ("_chain.valid_to", ASCENDING),
+                    (sort_key, DESCENDING),
+                    ("_id", DESCENDING),
+                ]
+            )
+        )
+    # used by apibara's invalidation: the versions closed after the new head
+    # are reopened, the ones inserted after it are deleted
+    models.append(
+        IndexModel([("_chain.valid_to", ASCENDING), ("_chain.valid_from", ASCENDING)])
+    )
+    models.append(IndexModel([("_chain.valid_from", ASCENDING)]))
+    return models
+
+
+def ensure_indexes(db):
+    """Create the indexes of every indexer collection, existing ones are kept."""
+    for collection, fields_list in INDEXES.items():
+        models = index_models(fields_list, DEFAULT_SORT.get(collection))
+        models.extend(IndexModel(keys) for keys in COVERING_INDEXES.get(collection, []))
+        db[collection].create_indexes(models)
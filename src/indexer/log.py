@@ -0,0 +1,89 @@
+import atexit
+import json
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+logger = logging.getLogger("indexer")
+
+
+def _json_default(value):
+    # felts are stored as 32-byte big-endian values
+    if isinstance(value, bytes):
+        return "0x" + value.hex()
+    return str(value)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=_json_default)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class EventLogger:
+    """Log one in every `sample` indexed events, with their fields attached.
+
+    Skipped events return before a log record is built, so a high sampling
+    ratio keeps logging off the ingestion loop.
+    """
+
+    def __init__(self, logger, sample=1):
+        self.logger = logger
+        self.sample = sample
+        self._count = 0
+
+    def __call__(self, event, **fields):
+        self._count += 1
+        if self._count < self.sample:
+            return
+        self._count = 0
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(event, extra={"fields": fields})
+
+
+log_event = EventLogger(logging.getLogger("indexer.events"))
+
+
+def setup_logging(level="INFO", json_format=False, sample=1):
+    """Send the indexer and apibara logs to stderr through a background thread.
+
+    Loggers only put records on a queue, the listener thread formats and
+    writes them.
+    """
+    handler = logging.StreamHandler()
+    if json_format:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(
+            TextFormatter("%(asctime)s %(levelname)s %(name)s %(message)s")
+        )
+
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    for name in ("indexer", "apibara"):
+        named = logging.getLogger(name)
+        named.setLevel(level)
+        named.addHandler(QueueHandler(records))
+        named.propagate = False
+
+    log_event.sample = max(sample, 1)
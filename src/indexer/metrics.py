@@ -0,0 +1,242 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from aiohttp import web
+
+# seconds, from a cached lookup up to a slow block
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield self.name + _format_labels(self.labels, labels), value
+
+
+class Gauge:
+    """Gauge set by the indexer, or read from `function` at scrape time."""
+
+    type = "gauge"
+
+    def __init__(self, name, help, labels=(), function=None):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.function = function
+        self._values = {}
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+    def samples(self):
+        if self.function is not None:
+            value = self.function()
+            if value is not None:
+                yield self.name, value
+            return
+        for labels, value in self._values.items():
+            yield self.name + _format_labels(self.labels, labels), value
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # labels -> [per bucket counts, with a last +Inf bucket], sum
+        self._values = {}
+
+    def observe(self, value, *labels):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def totals(self):
+        """Yield the labels, count and sum of every observed series."""
+        for labels, (counts, total) in self._values.items():
+            yield labels, sum(counts), total
+
+    def samples(self):
+        bounds = self.buckets + (float("inf"),)
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield (
+                    self.name + "_bucket" + _format_labels(self.labels, labels, le),
+                    cumulative,
+                )
+            suffix = _format_labels(self.labels, labels)
+            yield self.name + "_sum" + suffix, total
+            yield self.name + "_count" + suffix, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, value in metric.samples():
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class IndexerMetrics:
+    """Counters and latency histograms of each indexing stage."""
+
+    def __init__(self):
+        self.block_time = None
+        self.registry = registry = Registry()
+        self.blocks = registry.register(
+            Counter("indexer_blocks_total", "Blocks indexed.")
+        )
+        self.events = registry.register(
+            Counter("indexer_events_total", "Events indexed.", ("event",))
+        )
+        self.unknown_events = registry.register(
+            Counter(
+                "indexer_unknown_events_total",
+                "Events received without a registered handler.",
+            )
+        )
+        self.decode_seconds = registry.register(
+            Histogram(
+                "indexer_decode_duration_seconds",
+                "Time spent decoding event data.",
+                ("event",),
+            )
+        )
+        self.handler_seconds = registry.register(
+            Histogram(
+                "indexer_handler_duration_seconds",
+                "Time spent building documents from an event, storage reads included.",
+                ("event",),
+            )
+        )
+        self.storage_seconds = registry.register(
+            Histogram(
+                "indexer_storage_duration_seconds",
+                "Time spent in MongoDB calls.",
+                ("operation", "collection"),
+            )
+        )
+        self.block_seconds = registry.register(
+            Histogram(
+                "indexer_block_duration_seconds",
+                "Time spent indexing a block, flush included.",
+            )
+        )
+        self.block_number = registry.register(
+            Gauge("indexer_block_number", "Number of the last indexed block.")
+        )
+        self.block_timestamp = registry.register(
+            Gauge(
+                "indexer_block_timestamp_seconds",
+                "Timestamp of the last indexed block.",
+            )
+        )
+        registry.register(
+            Gauge(
+                "indexer_head_lag_seconds",
+                "Age of the last indexed block, keeps growing while the indexer stalls.",
+                function=self.lag,
+            )
+        )
+
+    def lag(self):
+        if self.block_time is None:
+            return None
+        return max(time.time() - self.block_time, 0.0)
+
+    def set_block(self, block_number, block_time):
+        self.block_time = block_time
+        self.block_number.set(block_number)
+        self.block_timestamp.set(block_time)
+
+
+async def start_metrics_server(metrics, host="0.0.0.0", port=9100):
+    """Serve `metrics` on `/metrics`, return the runner to clean it up."""
+
+    async def handle_metrics(request):
+        return web.Response(
+            body=metrics.registry.render().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
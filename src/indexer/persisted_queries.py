@@ -0,0 +1,74 @@
+import hashlib
+from collections import OrderedDict
+
+from aiohttp import web
+from strawberry.aiohttp.handlers import HTTPHandler
+from strawberry.http import parse_request_data
+
+# error responses of the Apollo automatic persisted queries protocol
+NOT_FOUND = {
+    "errors": [
+        {
+            "message": "PersistedQueryNotFound",
+            "extensions": {"code": "PERSISTED_QUERY_NOT_FOUND"},
+        }
+    ]
+}
+HASH_MISMATCH = {
+    "errors": [
+        {
+            "message": "provided sha does not match query",
+            "extensions": {"code": "PERSISTED_QUERY_HASH_MISMATCH"},
+        }
+    ]
+}
+
+
+class PersistedQueries:
+    """LRU store of query documents by their sha256 hash."""
+
+    def __init__(self, size):
+        self.size = size
+        self._queries = OrderedDict()
+
+    def get(self, sha256_hash):
+        query = self._queries.get(sha256_hash)
+        if query is not None:
+            self._queries.move_to_end(sha256_hash)
+        return query
+
+    def register(self, sha256_hash, query):
+        """Store `query` under `sha256_hash`, return False if the hash is wrong."""
+        if hashlib.sha256(query.encode()).hexdigest() != sha256_hash:
+            return False
+        self._queries[sha256_hash] = query
+        self._queries.move_to_end(sha256_hash)
+        while len(self._queries) > self.size:
+            self._queries.popitem(last=False)
+        return True
+
+
+class PersistedQueryHTTPHandler(HTTPHandler):
+    """Accept POST requests that send a query hash instead of the query."""
+
+    def __init__(self, *args, persisted_queries, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.persisted_queries = persisted_queries
+
+    async def post(self, request):
+        data = await self.parse_body(request)
+        persisted = (data.get("extensions") or {}).get("persistedQuery")
+        if persisted is not None:
+            sha256_hash = persisted.get("sha256Hash")
+            query = data.get("query")
+            if query is None:
+                query = self.persisted_queries.get(sha256_hash)
+                if query is None:
+                    return web.json_response(NOT_FOUND)
+                data["query"] = query
+            elif not self.persisted_queries.register(sha256_hash, query):
+                return web.json_response(HASH_MISMATCH, status=400)
+
+        return await self.execute_request(
+            request=request, request_data=parse_request_data(data), method="POST"
+        )
@@ -0,0 +1,130 @@
+import time
+
+from apibara.indexer import Info
+from apibara.indexer.runner import DEFAULT_CLIENT_OPTIONS
+from apibara.protocol import StreamService, credentials_with_auth_token
+from apibara.protocol.proto.stream_pb2 import Cursor, DataFinality
+from apibara.starknet.cursor import starknet_cursor
+from grpc import ssl_channel_credentials
+from grpc.aio import insecure_channel, secure_channel
+
+from indexer.archive import BlockArchive, BlockWriter
+from indexer.indexer import LootSurvivorIndexer
+from indexer.indexes import ensure_indexes
+from indexer.storage import MemoryChainStore, MongoChainStore
+
+
+def stream_channel(server_url, stream_ssl=True, token=None):
+    if not stream_ssl:
+        return insecure_channel(server_url, options=DEFAULT_CLIENT_OPTIONS)
+    return secure_channel(
+        server_url,
+        credentials_with_auth_token(token, ssl_channel_credentials()),
+        options=DEFAULT_CLIENT_OPTIONS,
+    )
+
+
+async def record_blocks(path, indexer, channel, end_block=None):
+    """Append the accepted blocks matching the filter of `indexer` to `path`.
+
+    Recording resumes after the last block already in the archive and stops
+    at `end_block`, or at the chain head when the stream has nothing left to
+    send. Returns the number of blocks recorded.
+    """
+    config = indexer.initial_configuration()
+    client, stream = StreamService(channel).stream_data()
+    recorded = 0
+    with BlockWriter(path) as writer:
+        cursor = config.starting_cursor
+        if writer.last_block is not None:
+            cursor = starknet_cursor(writer.last_block)
+        await client.configure(
+            filter=config.filter.encode(),
+            finality=DataFinality.DATA_STATUS_ACCEPTED,
+            cursor=cursor,
+            batch_size=1,
+        )
+        async for message in stream:
+            kind = message.WhichOneof("message")
+            if kind == "heartbeat":
+                break
+            if kind != "data":
+                continue
+            block_number = message.data.end_cursor.order_key
+            if end_block is not None and block_number > end_block:
+                break
+            # batches hold a single block
+            for raw in message.data.data:
+                writer.write(raw, block_number)
+                recorded += 1
+            if end_block is not None and block_number >= end_block:
+                break
+    await channel.close()
+    return recorded
+
+
+class ReplayIndexer(LootSurvivorIndexer):
+    """Indexer flushing to `store_for(block_number)` instead of apibara's storage."""
+
+    def __init__(self, config, store_for, **kwargs):
+        super().__init__(config, **kwargs)
+        self.store_for = store_for
+
+    def create_store(self, info):
+        return self.store_for(info.end_cursor.order_key)
+
+
+def memory_stores():
+    return MemoryChainStore().at_block
+
+
+def mongo_stores(db, metrics=None):
+    ensure_indexes(db)
+    return lambda block_number: MongoChainStore(db, block_number, metrics=metrics)
+
+
+async def replay_blocks(path, indexer, context=None):
+    """Feed the blocks recorded at `path` through `indexer.handle_data`.
+
+    Returns the elapsed time in seconds, parsing of the blocks included.
+    """
+    indexer.initial_configuration()
+    start = time.perf_counter()
+    with BlockArchive(path) as archive:
+        for block_number, raw in archive.blocks():
+            cursor = Cursor(order_key=block_number)
+            info = Info(context=context, storage=None, cursor=cursor, end_cursor=cursor)
+            await indexer.handle_data(info, indexer.decode_data(raw))
+    return time.perf_counter() - start
+
+
+def format_report(metrics, elapsed):
+    """Return throughput and per-handler timings gathered in `metrics`."""
+    blocks = sum(count for _, count, _ in metrics.block_seconds.totals())
+    handlers = sorted(
+        metrics.handler_seconds.totals(), key=lambda series: series[2], reverse=True
+    )
+    decoding = {labels: total for labels, _, total in metrics.decode_seconds.totals()}
+    events = sum(count for _, count, _ in handlers)
+    lines = [
+        f"{blocks} blocks, {events} events in {elapsed:.2f}s: "
+        f"{blocks / elapsed:.1f} blocks/s, {events / elapsed:.1f} events/s",
+        "",
+        f"{'handler':26} {'events':>8} {'us/event':>9} {'decode us':>9} {'total s':>8}",
+    ]
+    for labels, count, total in handlers:
+        lines.append(
+            f"{labels[0]:26} {count:8} {total / count * 1e6:9.1f}"
+            f" {decoding.get(labels, 0.0) / count * 1e6:9.1f} {total:8.3f}"
+        )
+    storage = sorted(metrics.storage_seconds.totals())
+    if storage:
+        lines.extend(
+            ["", f"{'storage':26} {'calls':>8} {'us/call':>9} {'':>9} {'total s':>8}"]
+        )
+        for (operation, collection), count, total in storage:
+            lines.append(
+                f"{operation + ' ' + collection:26} {count:8}"
+                f" {total / count * 1e6:9.1f} {'':>9} {total:8.3f}"
+            )
+    return "\n".join(lines)
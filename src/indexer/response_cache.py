@@ -0,0 +1,124 @@
+import asyncio
+import json
+from collections import OrderedDict
+from functools import lru_cache
+
+from aiohttp import web
+from graphql import GraphQLError, parse, print_ast
+from strawberry.aiohttp.handlers import HTTPHandler
+
+
+@lru_cache(maxsize=1024)
+def normalize_query(query):
+    """Return `query` printed from its AST, so formatting does not split keys."""
+    try:
+        return print_ast(parse(query))
+    except GraphQLError:
+        return None
+
+
+class ResponseCache:
+    """LRU cache of GraphQL response bodies, valid until the next indexed block.
+
+    Entries are kept per network and dropped as soon as the head of that
+    network's indexer moves. The total size of the cached bodies is bounded
+    by `max_bytes`.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._heads = {}
+        self._entries = OrderedDict()
+
+    def key_for(self, network, request_data):
+        if network not in self._heads or not request_data.query:
+            return None
+        query = normalize_query(request_data.query)
+        if query is None:
+            return None
+        variables = json.dumps(request_data.variables, sort_keys=True, default=str)
+        # the head the response is computed at, see `put`
+        head = self._heads[network]
+        return (network, head, query, variables, request_data.operation_name)
+
+    def get(self, key):
+        text = self._entries.get(key)
+        if text is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return text
+
+    def put(self, key, text):
+        # a block was indexed while the response was computed, it may be stale
+        if len(text) > self.max_bytes or self._heads.get(key[0]) != key[1]:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self._entries[key] = text
+        self.size += len(text)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def set_head(self, network, head):
+        if self._heads.get(network) == head:
+            return
+        self._heads[network] = head
+        for key in [key for key in self._entries if key[0] == network]:
+            self.size -= len(self._entries.pop(key))
+
+
+async def watch_head(cache, network, db, executor, interval=1.0):
+    """Poll the cursor the indexer stores after each block and report it to `cache`.
+
+    The count of pending blocks is part of the head, so cached responses are
+    also dropped when a pending block is written.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        state = await loop.run_in_executor(
+            executor, lambda: db["_apibara"].find_one({}, {"cursor": 1, "pending": 1})
+        )
+        if state is not None and state.get("cursor") is not None:
+            cursor = state["cursor"]
+            # pending blocks change the documents without moving the cursor
+            cache.set_head(
+                network,
+                (cursor["order_key"], cursor.get("unique_key"), state.get("pending")),
+            )
+        await asyncio.sleep(interval)
+
+
+class CachingHTTPHandler(HTTPHandler):
+    """Serve repeated queries from a `ResponseCache`, tagging responses with `X-Cache`."""
+
+    def __init__(self, *args, cache=None, network=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = cache
+        self.network = network
+
+    async def execute_request(self, request, request_data, method):
+        if self.cache is None:
+            return await super().execute_request(request, request_data, method)
+        key = self.cache.key_for(self.network, request_data)
+        if key is not None:
+            text = self.cache.get(key)
+            if text is not None:
+                return web.Response(
+                    text=text,
+                    content_type="application/json",
+                    headers={"X-Cache": "HIT"},
+                )
+
+        response = await super().execute_request(request, request_data, method)
+        # set by the view's `process_result`, error responses are not cached
+        if key is not None and not request.get("graphql_errors", True):
+            self.cache.put(key, response.text)
+        response.headers["X-Cache"] = "MISS"
+        return response
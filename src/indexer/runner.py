@@ -0,0 +1,163 @@
+import time
+
+from apibara.indexer import IndexerRunner, Info
+from apibara.protocol import StreamService
+from apibara.protocol.proto.stream_pb2 import DataFinality
+
+from indexer.log import logger
+from indexer.storage import invalidate_after, mark_pending
+
+
+class ChainIndexerRunner(IndexerRunner):
+    """`IndexerRunner` that follows pending blocks and chain reorganisations.
+
+    apibara's runner tells messages apart with `message.data is not None`,
+    which is always true for protobuf messages, so invalidations reach the
+    indexer as empty data and move the stored cursor back to zero. It also
+    stores the cursor of pending blocks, which are rolled back later. Here
+    messages are dispatched on their `oneof` field, pending blocks are
+    written without moving the cursor, only counted next to it, and
+    invalidations roll the storage back before `handle_invalidate`.
+
+    With `catch_up_batch` above one, the runner first streams accepted
+    blocks and commits them `catch_up_batch` at a time through
+    `handle_batch`. Once a block is less than `head_lag` seconds old, or
+    the stream has nothing left to send, it switches to the finality of the
+    indexer configuration and commits every block on its own.
+
+    Filter updates from the handlers are not supported.
+    """
+
+    def __init__(self, *, catch_up_batch=1, head_lag=60.0, **kwargs):
+        super().__init__(**kwargs)
+        self.catch_up_batch = catch_up_batch
+        self.head_lag = head_lag
+
+    async def _connect_and_stream(self, indexer, ctx):
+        channel = self._channel()
+        client, stream = StreamService(channel).stream_data()
+        storage = self._indexer_storage
+
+        config = indexer.initial_configuration()
+        if storage.update_with_stored_configuration(config):
+            # invalidate old pending data, if any
+            invalidate_after(storage, config.starting_cursor)
+        # writes of a block that failed before its cursor was stored are gone
+        indexer.cache.clear()
+
+        catching_up = self.catch_up_batch > 1
+        finality = config.finality
+        if catching_up:
+            finality = DataFinality.DATA_STATUS_ACCEPTED
+        await client.configure(
+            filter=config.filter.encode(),
+            finality=finality,
+            cursor=config.starting_cursor,
+            batch_size=1,
+        )
+
+        # cursor of the last accepted block, pending writes are newer
+        accepted_cursor = config.starting_cursor
+        pending_received = False
+        # accepted blocks not committed yet, while catching up
+        batch = []
+        async for message in stream:
+            self._retry_count = 0
+            kind = message.WhichOneof("message")
+
+            if kind == "data" and catching_up:
+                data = message.data
+                for raw in data.data:
+                    batch.append(
+                        (data.cursor, data.end_cursor, indexer.decode_data(raw))
+                    )
+                accepted_cursor = data.end_cursor
+                at_head = (
+                    bool(batch)
+                    and time.time() - batch[-1][2].header.timestamp.seconds
+                    <= self.head_lag
+                )
+                if len(batch) >= self.catch_up_batch or at_head:
+                    await self._commit_batch(indexer, ctx, batch)
+                if at_head:
+                    catching_up = False
+                    await self._follow_head(client, config, accepted_cursor)
+
+            elif kind == "data":
+                data = message.data
+                if pending_received:
+                    invalidate_after(storage, accepted_cursor)
+
+                pending_received = data.finality == DataFinality.DATA_STATUS_PENDING
+                if pending_received:
+                    create_storage = storage.create_storage_for_pending
+                else:
+                    create_storage = storage.create_storage_for_data
+
+                with create_storage(data.end_cursor) as block_storage:
+                    for raw in data.data:
+                        info = Info(
+                            context=ctx,
+                            storage=block_storage,
+                            cursor=data.cursor,
+                            end_cursor=data.end_cursor,
+                        )
+                        block = indexer.decode_data(raw)
+                        if pending_received:
+                            await indexer.handle_pending_data(info, block)
+                        else:
+                            await indexer.handle_data(info, block)
+
+                if pending_received:
+                    mark_pending(storage)
+                else:
+                    accepted_cursor = data.end_cursor
+
+            elif kind == "heartbeat" and catching_up:
+                # nothing left to stream, the head is reached
+                if batch:
+                    await self._commit_batch(indexer, ctx, batch)
+                catching_up = False
+                await self._follow_head(client, config, accepted_cursor)
+
+            elif kind == "invalidate":
+                if batch:
+                    await self._commit_batch(indexer, ctx, batch)
+                cursor = message.invalidate.cursor
+                logger.warning(
+                    "chain reorganisation",
+                    extra={"fields": {"block": cursor.order_key}},
+                )
+                invalidate_after(storage, cursor)
+                with storage.create_storage_for_invalidate(cursor) as block_storage:
+                    info = Info(
+                        context=ctx,
+                        storage=block_storage,
+                        cursor=cursor,
+                        end_cursor=cursor,
+                    )
+                    await indexer.handle_invalidate(info, cursor)
+                accepted_cursor = cursor
+                pending_received = False
+
+    async def _commit_batch(self, indexer, ctx, batch):
+        cursor, end_cursor = batch[0][0], batch[-1][1]
+        with self._indexer_storage.create_storage_for_data(end_cursor) as storage:
+            info = Info(
+                context=ctx, storage=storage, cursor=cursor, end_cursor=end_cursor
+            )
+            await indexer.handle_batch(info, [block for _, _, block in batch])
+        batch.clear()
+
+    async def _follow_head(self, client, config, cursor):
+        logger.info(
+            "caught up with the chain head",
+            extra={"fields": {"block": cursor.order_key}},
+        )
+        # messages of the previous configuration are dropped by the stream
+        await client.configure(
+            filter=config.filter.encode(),
+            finality=config.finality,
+            cursor=cursor,
+            batch_size=1,
+        )
@@ -0,0 +1,360 @@
+from collections import defaultdict
+
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+
+
+# collections whose current versions also carry `current: True`, so queries
+# can select them from an index alone, which `_chain.valid_to: None` can not
+FLAGGED_COLLECTIONS = ("leaderboard",)
+
+
+class MongoChainStore:
+    """Chain-aware reads and bulk writes for the block being indexed.
+
+    Documents follow the apibara storage layout: every version carries a
+    `_chain` validity range and the current version has `_chain.valid_to`
+    set to `None`. Versions in `FLAGGED_COLLECTIONS` also carry a `current`
+    flag.
+    """
+
+    def __init__(self, db, block_number, session=None, metrics=None):
+        self.db = db
+        self.block_number = block_number
+        self.session = session
+        self.metrics = metrics
+
+    @classmethod
+    def from_storage(cls, storage, metrics=None):
+        # apibara's Storage has no bulk operations, reuse its database and session
+        return cls(
+            storage._db,
+            storage._cursor.order_key,
+            session=storage._session,
+            metrics=metrics,
+        )
+
+    async def find_one(self, collection, filter, exclude=None):
+        filter = {**filter, "_chain.valid_to": None}
+        if exclude:
+            filter["_id"] = {"$nin": exclude}
+        if self.metrics is None:
+            return self.db[collection].find_one(filter, session=self.session)
+        with self.metrics.storage_seconds.time("find_one", collection):
+            return self.db[collection].find_one(filter, session=self.session)
+
+    async def write(self, collection, closed, documents):
+        close = {"_chain.valid_to": self.block_number}
+        if collection in FLAGGED_COLLECTIONS:
+            close["current"] = False
+            documents = [{**doc, "current": True} for doc in documents]
+        requests = [UpdateOne({"_id": _id}, {"$set": close}) for _id in closed]
+        requests.extend(InsertOne(doc) for doc in documents)
+        if not requests:
+            return
+        if self.metrics is None:
+            self.db[collection].bulk_write(
+                requests, ordered=False, session=self.session
+            )
+            return
+        with self.metrics.storage_seconds.time("bulk_write", collection):
+            self.db[collection].bulk_write(
+                requests, ordered=False, session=self.session
+            )
+
+
+def invalidate_after(storage, cursor):
+    """Invalidate the data stored after `cursor` through apibara's `storage`.
+
+    apibara only resets `_chain.valid_to` of the versions that become current
+    again, their `current` flag is restored here.
+    """
+    storage.invalidate(cursor)
+    for collection in FLAGGED_COLLECTIONS:
+        storage.db[collection].update_many(
+            {"current": False, "_chain.valid_to": None}, {"$set": {"current": True}}
+        )
+
+
+def mark_pending(storage):
+    """Count the pending blocks written next to the stored cursor.
+
+    Pending writes do not move the cursor, readers watching it for new data
+    watch this count as well.
+    """
+    storage.db["_apibara"].update_one(
+        {"indexer_id": storage._indexer_id}, {"$inc": {"pending": 1}}
+    )
+
+
+class MemoryChainStore:
+    """In-memory stand-in for `MongoChainStore`, used to replay blocks offline.
+
+    Only current versions are kept. Lookups go through hash indexes built on
+    first use for each set of filter fields, so replays do not slow down as
+    the collections grow.
+    """
+
+    def __init__(self):
+        self.block_number = None
+        # collection -> _id -> document
+        self._documents = defaultdict(dict)
+        # collection -> filter fields -> values -> _ids, in insertion order
+        self._indexes = defaultdict(dict)
+
+    def at_block(self, block_number):
+        self.block_number = block_number
+        return self
+
+    async def find_one(self, collection, filter, exclude=None):
+        fields = tuple(sorted(filter))
+        index = self._indexes[collection].get(fields)
+        if index is None:
+            index = self._build_index(collection, fields)
+        documents = self._documents[collection]
+        for _id in index.get(tuple(filter[field] for field in fields), ()):
+            if exclude and _id in exclude:
+                continue
+            doc = documents[_id]
+            return {**doc, "_chain": dict(doc["_chain"])}
+        return None
+
+    async def write(self, collection, closed, documents):
+        stored = self._documents[collection]
+        indexes = self._indexes[collection]
+        for _id in closed:
+            doc = stored.pop(_id, None)
+            if doc is None:
+                continue
+            for fields, index in indexes.items():
+                key = _index_key(doc, fields)
+                ids = index[key]
+                del ids[_id]
+                if not ids:
+                    del index[key]
+        for doc in documents:
+            stored[doc["_id"]] = doc
+            for fields, index in indexes.items():
+                index.setdefault(_index_key(doc, fields), {})[doc["_id"]] = None
+
+    def _build_index(self, collection, fields):
+        index = self._indexes[collection][fields] = {}
+        for _id, doc in self._documents[collection].items():
+            index.setdefault(_index_key(doc, fields), {})[_id] = None
+        return index
+
+
+def _index_key(doc, fields):
+    return tuple(doc.get(field) for field in fields)
+
+
+class _Entry:
+    __slots__ = ("doc", "stored_id", "deleted", "dirty")
+
+    def __init__(self, doc, stored_id=None):
+        self.doc = doc
+        self.stored_id = stored_id
+        self.deleted = False
+        # documents created in this block are always written
+        self.dirty = stored_id is None
+
+
+_MISSING = object()
+
+
+def _apply_update(doc, update):
+    """Apply `update` to `doc` in place, return whether any field changed."""
+    changed = False
+    for operator, fields in update.items():
+        if operator == "$set":
+            for key, value in fields.items():
+                if doc.get(key, _MISSING) != value:
+                    doc[key] = value
+                    changed = True
+        elif operator == "$inc":
+            for key, value in fields.items():
+                if value:
+                    doc[key] = doc.get(key, 0) + value
+                    changed = True
+        elif operator != "$setOnInsert":
+            raise ValueError(f"unsupported update operator {operator}")
+    return changed
+
+
+class BlockWriteBuffer:
+    """Collect the writes of one block and flush them at the end of the block.
+
+    Reads are answered from the buffer first, so later events in the block
+    see the writes of earlier ones, then from the optional entity cache, and
+    only then from Mongo. Buffered documents are found through hash indexes
+    built on first use for each set of filter fields, like in
+    `MemoryChainStore`, so a buffer holding many blocks stays fast. `flush`
+    closes every changed version and inserts the new ones with one
+    `bulk_write` per collection.
+    """
+
+    def __init__(self, store, cache=None):
+        self._store = store
+        self._cache = cache
+        # collection -> entries, in insertion order
+        self._entries = defaultdict(list)
+        # collection -> filter fields -> values -> entries
+        self._indexes = defaultdict(dict)
+        # collection -> ids of the stored versions loaded in the buffer
+        self._loaded = defaultdict(set)
+
+    async def insert_one(self, collection, doc):
+        self._add(collection, _Entry(dict(doc)))
+
+    async def find_one(self, collection, filter):
+        entry = await self._find_entry(collection, filter)
+        if entry is None:
+            return None
+        return entry.doc
+
+    async def find_one_and_update(self, collection, filter, update):
+        entry = await self._find_entry(collection, filter)
+        if entry is None:
+            return None
+        self._update(collection, entry, update)
+        return entry.doc
+
+    async def upsert_one(self, collection, filter, update):
+        """Apply `update` to the document matching `filter`, creating it if missing.
+
+        On insert the new document is built from the equality fields of
+        `filter`, then `$setOnInsert`, then `$set`.
+        """
+        entry = await self._find_entry(collection, filter)
+        if entry is None:
+            entry = _Entry({**filter, **update.get("$setOnInsert", {})})
+            self._add(collection, entry)
+        self._update(collection, entry, update)
+        return entry.doc
+
+    async def delete_one(self, collection, filter):
+        entry = await self._find_entry(collection, filter)
+        if entry is not None:
+            self._unindex(collection, entry)
+            entry.deleted = True
+            entry.dirty = True
+
+    async def flush(self):
+        block_number = self._store.block_number
+        cache = self._cache
+        cached = []
+        for collection, entries in self._entries.items():
+            changed = [e for e in entries if e.dirty]
+            closed = [e.stored_id for e in changed if e.stored_id is not None]
+            documents = []
+            for entry in changed:
+                if entry.deleted:
+                    if cache is not None and entry.stored_id is not None:
+                        cache.discard(collection, entry.doc, entry.stored_id)
+                    continue
+                entry.doc["_id"] = ObjectId()
+                documents.append(
+                    {
+                        **entry.doc,
+                        "_chain": {"valid_from": block_number, "valid_to": None},
+                    }
+                )
+            await self._store.write(collection, closed, documents)
+            cached.extend((collection, e.doc) for e in changed if not e.deleted)
+        # cached once every collection is written, never for a partial flush
+        if cache is not None:
+            for collection, doc in cached:
+                cache.put(collection, doc, block_number)
+        self._entries.clear()
+        self._indexes.clear()
+        self._loaded.clear()
+
+    def _add(self, collection, entry):
+        self._entries[collection].append(entry)
+        if entry.stored_id is not None:
+            self._loaded[collection].add(entry.stored_id)
+        for fields, index in self._indexes[collection].items():
+            index.setdefault(_index_key(entry.doc, fields), {})[entry] = None
+
+    def _unindex(self, collection, entry):
+        for fields, index in self._indexes[collection].items():
+            key = _index_key(entry.doc, fields)
+            entries = index[key]
+            del entries[entry]
+            if not entries:
+                del index[key]
+
+    def _update(self, collection, entry, update):
+        # the update may change indexed fields
+        self._unindex(collection, entry)
+        if _apply_update(entry.doc, update):
+            entry.dirty = True
+        for fields, index in self._indexes[collection].items():
+            index.setdefault(_index_key(entry.doc, fields), {})[entry] = None
+
+    async def _find_entry(self, collection, filter):
+        fields = tuple(sorted(filter))
+        index = self._indexes[collection].get(fields)
+        if index is None:
+            index = self._indexes[collection][fields] = {}
+            for entry in self._entries[collection]:
+                if not entry.deleted:
+                    index.setdefault(_index_key(entry.doc, fields), {})[entry] = None
+        entries = index.get(tuple(filter[field] for field in fields))
+        if entries:
+            return next(iter(entries))
+
+        # documents already loaded in this block are authoritative, skip them
+        loaded = self._loaded[collection]
+
+        cache = self._cache
+        key = None if cache is None else cache.key_for(collection, filter)
+        if key is not None:
+            cached = cache.get(key)
+            if cached is not None and cached["_id"] not in loaded:
+                doc = dict(cached)
+                entry = _Entry(doc, doc.pop("_id"))
+                self._add(collection, entry)
+                return entry
+
+        stored = await self._store.find_one(collection, filter)
+        if stored is not None and stored["_id"] in loaded:
+            # its buffered version no longer matches, look for another one
+            stored = await self._store.find_one(
+                collection, filter, exclude=list(loaded)
+            )
+        if stored is None:
+            return None
+        valid_from = stored.pop("_chain")["valid_from"]
+        if key is not None:
+            cache.put(collection, dict(stored), valid_from)
+        entry = _Entry(stored, stored.pop("_id"))
+        self._add(collection, entry)
+        return entry
+
+
+class OpLog:
+    """Record the writes of one block, to apply them to a `BlockWriteBuffer` later.
+
+    Handlers only write, so the op log of a block can be built without the
+    state left by earlier blocks, for example in a backfill worker.
+    """
+
+    def __init__(self):
+        self.ops = []
+
+    async def insert_one(self, collection, doc):
+        self.ops.append(("insert_one", collection, (dict(doc),)))
+
+    async def find_one_and_update(self, collection, filter, update):
+        self.ops.append(("find_one_and_update", collection, (filter, update)))
+
+    async def upsert_one(self, collection, filter, update):
+        self.ops.append(("upsert_one", collection, (filter, update)))
+
+    async def delete_one(self, collection, filter):
+        self.ops.append(("delete_one", collection, (filter,)))
+
+    async def replay(self, writes):
+        for operation, collection, args in self.ops:
+            await getattr(writes, operation)(collection, *args)
@@ -0,0 +1,92 @@
+import asyncio
+from collections import defaultdict
+
+# collection -> field the updates of that collection are routed by
+FEEDS = {
+    "adventurers": "id",
+    "battles": "adventurerId",
+    "items": "marketId",
+}
+
+
+class Broadcast:
+    """Fan out the documents of one upstream watcher to many subscribers.
+
+    Subscribers listen to one key, or to every document with `key=None`.
+    Each has its own bounded queue, a subscriber falling behind loses its
+    oldest documents instead of holding up the others.
+    """
+
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self._queues = defaultdict(set)
+
+    def publish(self, key, doc):
+        for queues in (self._queues.get(key), self._queues.get(None)):
+            for queue in queues or ():
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(doc)
+
+    async def listen(self, key=None):
+        queue = asyncio.Queue(self.maxsize)
+        self._queues[key].add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._queues[key].discard(queue)
+            if not self._queues[key]:
+                del self._queues[key]
+
+
+def create_feeds():
+    return {collection: Broadcast() for collection in FEEDS}
+
+
+def _new_versions(db, collection, after, until):
+    # versions current at `until`, later blocks may have closed them already
+    return list(
+        db[collection].find(
+            {
+                "_chain.valid_from": {"$gt": after, "$lte": until},
+                "$or": [
+                    {"_chain.valid_to": None},
+                    {"_chain.valid_to": {"$gt": until}},
+                ],
+            }
+        )
+    )
+
+
+async def watch_changes(feeds, db, executor, interval=1.0):
+    """Publish the current versions written by each newly indexed block.
+
+    The cursor stored by the indexer after each block is polled, like
+    `watch_head` does, and the documents that became current since the
+    previous cursor are read once per collection, whatever the number of
+    subscribers. Only accepted blocks move the cursor: the writes of a
+    pending block are published once the block is accepted.
+    """
+    loop = asyncio.get_running_loop()
+    last = None
+    while True:
+        state = await loop.run_in_executor(
+            executor, lambda: db["_apibara"].find_one({}, {"cursor": 1})
+        )
+        head = None
+        if state is not None and state.get("cursor") is not None:
+            head = state["cursor"]["order_key"]
+        # after a reorganisation the head moves back, nothing new to publish
+        if last is not None and head is not None and head > last:
+            for collection, feed in feeds.items():
+                docs = await loop.run_in_executor(
+                    executor, _new_versions, db, collection, last, head
+                )
+                field = FEEDS[collection]
+                for doc in docs:
+                    if doc.get(field) is not None:
+                        feed.publish(doc[field], doc)
+        if head is not None:
+            last = head
+        await asyncio.sleep(interval)
@@ -1,4 +1,9 @@
+import struct
 from datetime import datetime
+from operator import attrgetter
+
+_pack_felt = struct.Struct(">4Q").pack
+_felt_limbs = attrgetter("lo_lo", "lo_hi", "hi_lo", "hi_hi")
 
 
 def str_to_felt(text):
@@ -34,3 +39,20 @@ def check_exists_timestamp(val):
         return None
     else:
         return datetime.fromtimestamp(val)
+
+
+def felts_to_ints(felts):
+    """Convert a repeated `FieldElement` field to a list of ints in one pass,
+    reading the four limbs of each felt once."""
+    return [
+        (lo_lo << 192) | (lo_hi << 128) | (hi_lo << 64) | hi_hi
+        for lo_lo, lo_hi, hi_lo, hi_hi in map(_felt_limbs, felts)
+    ]
+
+
+def felt_to_bytes(f):
+    """Return the 32-byte big-endian encoding of a `FieldElement`.
+
+    Equal to `bytes.fromhex(felt.to_hex(f)[2:])`, the encoding stored before.
+    """
+    return _pack_felt(*_felt_limbs(f))
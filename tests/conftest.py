@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from indexer.storage import MemoryChainStore
+
+
+class CountingStore(MemoryChainStore):
+    """`MemoryChainStore` counting its reads and writes, failing the writes
+    to the `fail_on` collection."""
+
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+        self.writes = []
+        self.fail_on = None
+
+    async def find_one(self, collection, filter, exclude=None):
+        self.reads += 1
+        return await super().find_one(collection, filter, exclude=exclude)
+
+    async def write(self, collection, closed, documents):
+        if collection == self.fail_on:
+            raise RuntimeError("write failed")
+        self.writes.append((self.block_number, collection, len(closed), len(documents)))
+        await super().write(collection, closed, documents)
+
+    def current(self, collection):
+        """Return the current documents of `collection`, without `_id` and `_chain`."""
+        return sorted(
+            (
+                {k: v for k, v in doc.items() if k not in ("_id", "_chain")}
+                for doc in self._documents[collection].values()
+            ),
+            key=repr,
+        )
+
+
+@pytest.fixture
+def store():
+    return CountingStore()
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine to completion."""
+    return asyncio.run
@@ -0,0 +1,94 @@
+import os
+
+import pytest
+from apibara.starknet.proto.starknet_pb2 import Block
+
+from indexer.archive import BlockArchive, BlockWriter, index_path
+
+
+def raw_block(number):
+    block = Block()
+    block.header.block_number = number
+    return block.SerializeToString()
+
+
+def write_blocks(path, numbers):
+    with BlockWriter(str(path)) as writer:
+        for number in numbers:
+            writer.write(raw_block(number), number)
+
+
+def read_blocks(path, **kwargs):
+    with BlockArchive(str(path)) as archive:
+        return [
+            (number, Block.FromString(raw).header.block_number)
+            for number, raw in archive.blocks(**kwargs)
+        ]
+
+
+def test_blocks_in_range(tmp_path):
+    path = tmp_path / "blocks.bin"
+    write_blocks(path, [10, 11, 13, 14])
+    assert read_blocks(path) == [(10, 10), (11, 11), (13, 13), (14, 14)]
+    assert read_blocks(path, after=10, until=13) == [(11, 11), (13, 13)]
+    assert read_blocks(path, after=12) == [(13, 13), (14, 14)]
+    assert read_blocks(path, until=9) == []
+    with BlockArchive(str(path)) as archive:
+        assert (archive.first_block, archive.last_block, len(archive)) == (10, 14, 4)
+
+
+def test_empty_archive(tmp_path):
+    path = tmp_path / "blocks.bin"
+    path.write_bytes(b"")
+    with BlockArchive(str(path)) as archive:
+        assert archive.last_block is None
+        assert list(archive.blocks()) == []
+
+
+@pytest.mark.parametrize("kept", [0, 1, 2, 5])
+def test_stale_index_is_rebuilt(tmp_path, kept):
+    path = tmp_path / "blocks.bin"
+    write_blocks(path, [10, 11, 12, 13, 14])
+    # an index behind the archive, cut in the middle of an entry
+    os.truncate(index_path(str(path)), kept * 16 + 3)
+    assert [number for number, _ in read_blocks(path)] == [10, 11, 12, 13, 14]
+
+
+def test_missing_index_is_rebuilt(tmp_path):
+    path = tmp_path / "blocks.bin"
+    write_blocks(path, [10, 11, 12])
+    os.remove(index_path(str(path)))
+    assert read_blocks(path, after=10) == [(11, 11), (12, 12)]
+
+
+def test_truncated_frame(tmp_path):
+    path = tmp_path / "blocks.bin"
+    write_blocks(path, [10, 11])
+    os.truncate(str(path), os.path.getsize(str(path)) - 1)
+    with pytest.raises(ValueError):
+        BlockArchive(str(path))
+
+
+def test_writer_rejects_blocks_already_archived(tmp_path):
+    path = tmp_path / "blocks.bin"
+    write_blocks(path, [10, 11])
+    with BlockWriter(str(path)) as writer:
+        assert writer.last_block == 11
+        for number in (10, 11):
+            with pytest.raises(ValueError):
+                writer.write(raw_block(number), number)
+    with BlockWriter(str(path)) as writer:
+        writer.write(raw_block(12), 12)
+        with pytest.raises(ValueError):
+            writer.write(raw_block(12), 12)
+    assert [number for number, _ in read_blocks(path)] == [10, 11, 12]
+
+
+def test_writer_completes_a_stale_index(tmp_path):
+    path = tmp_path / "blocks.bin"
+    write_blocks(path, [10, 11, 12])
+    os.truncate(index_path(str(path)), 16)
+    write_blocks(path, [13])
+    assert os.path.getsize(index_path(str(path))) == 4 * 16
+    with BlockArchive(str(path)) as archive:
+        assert list(archive.numbers) == [10, 11, 12, 13]
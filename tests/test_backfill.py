@@ -0,0 +1,158 @@
+import asyncio
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+from apibara.starknet import felt
+from apibara.starknet.proto.starknet_pb2 import Block
+from starknet_py.contract import ContractFunction
+
+import indexer.backfill
+from indexer.archive import BlockWriter
+from indexer.backfill import backfill_from_archive, build_blocks, built_blocks
+from indexer.config import Config
+from indexer.indexer import LootSurvivorIndexer
+
+CONFIG = Config("goerli", "0x1", "0x2", "0x3", 1)
+BEAST = "0x2"
+NOW = datetime(2023, 4, 1, 12, 5)
+
+
+def raw_block(number):
+    """Block `number`, in which adventurer `number` gets `10 * number` gold."""
+    block = Block()
+    block.header.block_number = number
+    block.header.block_hash.CopyFrom(felt.from_int(0xB000 + number))
+    block.header.timestamp.FromDatetime(NOW)
+    event = block.events.add()
+    event.transaction.meta.hash.CopyFrom(felt.from_int(number))
+    event.event.from_address.CopyFrom(felt.from_hex(BEAST))
+    selector = ContractFunction.get_selector("UpdateGoldBalance")
+    event.event.keys.append(felt.from_int(selector))
+    event.event.data.extend(felt.from_int(value) for value in (number, 0, 10 * number))
+    return block.SerializeToString()
+
+
+def gold_ops(number):
+    """The ops `update_gold` records for block `number`."""
+    adventurer_id = number.to_bytes(32, "big")
+    gold = (10 * number).to_bytes(32, "big")
+    return [
+        (
+            "upsert_one",
+            "adventurers",
+            (
+                {"id": adventurer_id},
+                {"$set": {"id": adventurer_id, "gold": gold, "lastUpdated": NOW}},
+            ),
+        ),
+        (
+            "upsert_one",
+            "leaderboard",
+            (
+                {"adventurerId": adventurer_id},
+                {
+                    "$set": {"gold": 10 * number, "lastUpdated": NOW},
+                    "$setOnInsert": {"xp": 0, "level": 0},
+                },
+            ),
+        ),
+    ]
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = str(tmp_path / "blocks.bin")
+    with BlockWriter(path) as writer:
+        for number in range(1, 6):
+            writer.write(raw_block(number), number)
+    return path
+
+
+@pytest.fixture
+def in_process(monkeypatch):
+    """Build the chunks on threads of this process instead of spawned workers."""
+    monkeypatch.setattr(
+        indexer.backfill,
+        "ProcessPoolExecutor",
+        lambda workers, mp_context: ThreadPoolExecutor(workers),
+    )
+
+
+class Storage:
+    """apibara's `IndexerStorage`, recording what the backfill does with it."""
+
+    def __init__(self, calls):
+        self.calls = calls
+        self.db = {"leaderboard": self}
+
+    def update_with_stored_configuration(self, configuration):
+        return True
+
+    def invalidate(self, cursor):
+        self.calls.append(("invalidate", cursor.order_key))
+
+    def update_many(self, filter, update):
+        pass
+
+    @contextlib.contextmanager
+    def create_storage_for_data(self, cursor):
+        yield
+        self.calls.append(("store-data", cursor.order_key))
+
+
+class RecordingIndexer(LootSurvivorIndexer):
+    """Record the op logs replayed in the parent instead of writing them."""
+
+    async def handle_ops(self, info, block_number, timestamp, ops):
+        self.calls.append(("ops", block_number, ops.ops))
+
+
+def test_build_blocks_records_the_ops_of_a_chunk(archive):
+    built = build_blocks(LootSurvivorIndexer, CONFIG, archive, 2, 4)
+    assert [
+        (number, block_hash, timestamp, ops.ops)
+        for number, block_hash, timestamp, ops in built
+    ] == [
+        (number, (0xB000 + number).to_bytes(32, "big"), 1680350700, gold_ops(number))
+        for number in (3, 4)
+    ]
+
+
+def test_built_blocks_are_yielded_in_block_order(archive, in_process):
+    async def main():
+        loot = LootSurvivorIndexer(CONFIG)
+        return [
+            (number, ops.ops)
+            async for number, _, _, ops in built_blocks(
+                loot, archive, 1, workers=2, chunk_size=2
+            )
+        ]
+
+    assert asyncio.run(main()) == [
+        (number, gold_ops(number)) for number in (2, 3, 4, 5)
+    ]
+
+
+def test_backfill_invalidates_before_replaying_the_ops(
+    archive, in_process, monkeypatch
+):
+    calls = []
+    monkeypatch.setattr(
+        indexer.backfill, "IndexerStorage", lambda url, indexer_id: Storage(calls)
+    )
+    loot = RecordingIndexer(CONFIG)
+    loot.calls = calls
+    monkeypatch.setattr(loot.cache, "clear", lambda: calls.append(("cache-clear",)))
+
+    asyncio.run(backfill_from_archive(loot, archive, "mongodb://", workers=2))
+    assert calls == [
+        ("invalidate", 1),
+        ("cache-clear",),
+        *(
+            call
+            for number in (2, 3, 4, 5)
+            for call in [("ops", number, gold_ops(number)), ("store-data", number)]
+        ),
+    ]
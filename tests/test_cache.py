@@ -0,0 +1,148 @@
+import pytest
+
+from indexer.cache import EntityCache
+from indexer.storage import BlockWriteBuffer
+
+
+def test_key_for_single_key_fields_only():
+    cache = EntityCache(10)
+    assert cache.key_for("items", {"marketId": 3}) == ("items", "marketId", 3)
+    assert cache.key_for("items", {"owner": 3}) is None
+    assert cache.key_for("items", {"id": None}) is None
+    assert cache.key_for("items", {"id": 1, "marketId": 3}) is None
+    assert cache.key_for("discoveries", {"id": 1}) is None
+
+
+def test_put_is_reachable_under_every_key_field():
+    cache = EntityCache(10)
+    doc = {"_id": "a", "id": 1, "marketId": 3}
+    cache.put("items", doc, 5)
+    assert cache.get(("items", "id", 1)) is doc
+    assert cache.get(("items", "marketId", 3)) is doc
+    assert cache.get(("items", "id", 2)) is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = EntityCache(2)
+    cache.put("adventurers", {"_id": "a", "id": 1}, 1)
+    cache.put("adventurers", {"_id": "b", "id": 2}, 1)
+    cache.get(("adventurers", "id", 1))
+    cache.put("adventurers", {"_id": "c", "id": 3}, 1)
+    assert cache.get(("adventurers", "id", 1)) is not None
+    assert cache.get(("adventurers", "id", 2)) is None
+    assert cache.get(("adventurers", "id", 3)) is not None
+
+
+def test_invalidate_drops_entries_after_the_block():
+    cache = EntityCache(10)
+    cache.put("adventurers", {"_id": "a", "id": 1}, 10)
+    cache.put("adventurers", {"_id": "b", "id": 2}, 11)
+    cache.put("adventurers", {"_id": "c", "id": 3}, 12)
+    cache.invalidate(11)
+    assert cache.get(("adventurers", "id", 1)) is not None
+    assert cache.get(("adventurers", "id", 2)) is not None
+    assert cache.get(("adventurers", "id", 3)) is None
+
+    cache.clear()
+    assert cache.get(("adventurers", "id", 1)) is None
+
+
+def test_discard_keeps_newer_versions():
+    cache = EntityCache(10)
+    cache.put("items", {"_id": "new", "id": 1, "marketId": 3}, 2)
+    cache.discard("items", {"id": 1, "marketId": 3}, "old")
+    assert cache.get(("items", "id", 1))["_id"] == "new"
+    cache.discard("items", {"id": 1, "marketId": 3}, "new")
+    assert cache.get(("items", "id", 1)) is None
+    assert cache.get(("items", "marketId", 3)) is None
+
+
+def test_flushed_documents_are_read_from_the_cache(store, run):
+    async def main():
+        cache = EntityCache(10)
+        writes = BlockWriteBuffer(store.at_block(1), cache)
+        await writes.insert_one("adventurers", {"id": 1, "gold": 0})
+        await writes.flush()
+
+        writes = BlockWriteBuffer(store.at_block(2), cache)
+        doc = await writes.find_one_and_update(
+            "adventurers", {"id": 1}, {"$inc": {"gold": 2}}
+        )
+        await writes.flush()
+        return cache, doc
+
+    cache, doc = run(main())
+    assert store.reads == 0
+    assert doc["gold"] == 2
+    block, cached = cache._entries[("adventurers", "id", 1)]
+    assert block == 2
+    assert cached["gold"] == 2
+    assert cached["_id"] in store._documents["adventurers"]
+
+
+def test_stored_documents_are_cached_when_loaded(store, run):
+    async def main():
+        writes = BlockWriteBuffer(store.at_block(1))
+        await writes.insert_one("beasts", {"id": 4, "health": 9})
+        await writes.flush()
+
+        cache = EntityCache(10)
+        for block in (2, 3):
+            writes = BlockWriteBuffer(store.at_block(block), cache)
+            await writes.find_one("beasts", {"id": 4})
+        return cache
+
+    cache = run(main())
+    assert store.reads == 1
+    # cached with the block of the stored version
+    assert cache._entries[("beasts", "id", 4)][0] == 1
+
+
+def test_failed_flush_does_not_cache_written_collections(store, run):
+    async def main():
+        cache = EntityCache(10)
+        writes = BlockWriteBuffer(store.at_block(1), cache)
+        await writes.insert_one("adventurers", {"id": 1})
+        await writes.insert_one("beasts", {"id": 2})
+        store.fail_on = "beasts"
+        with pytest.raises(RuntimeError):
+            await writes.flush()
+        return cache
+
+    cache = run(main())
+    # adventurers were written before the failure, but the block is not committed
+    assert cache.get(("adventurers", "id", 1)) is None
+    assert cache.get(("beasts", "id", 2)) is None
+
+
+def test_deleted_documents_leave_the_cache(store, run):
+    async def main():
+        cache = EntityCache(10)
+        writes = BlockWriteBuffer(store.at_block(1), cache)
+        await writes.insert_one("items", {"marketId": 3, "price": 5})
+        await writes.flush()
+
+        writes = BlockWriteBuffer(store.at_block(2), cache)
+        await writes.delete_one("items", {"marketId": 3})
+        await writes.flush()
+
+        return cache
+
+    cache = run(main())
+    assert cache.get(("items", "marketId", 3)) is None
+
+
+def test_cached_versions_already_loaded_are_skipped(store, run):
+    async def main():
+        cache = EntityCache(10)
+        writes = BlockWriteBuffer(store.at_block(1), cache)
+        await writes.insert_one("items", {"id": 7, "marketId": 3})
+        await writes.flush()
+
+        writes = BlockWriteBuffer(store.at_block(2), cache)
+        await writes.find_one_and_update("items", {"marketId": 3}, {"$set": {"id": 8}})
+        # still cached under its old id, but the buffered version is authoritative
+        return await writes.find_one("items", {"id": 7})
+
+    assert run(main()) is None
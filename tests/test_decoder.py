@@ -0,0 +1,78 @@
+import pytest
+from apibara.starknet import felt
+
+from indexer.decoder import (
+    decode_adventurer_ambushed_event,
+    decode_item_merchant_update_event,
+    decode_mint_adventurer_event,
+    decode_update_thief_state_event,
+    update_thief_state_decoder,
+)
+
+# expected values follow starknet_py's FunctionCallSerializer.to_python:
+# Uint256 is (high << 128) + low, other structs are dicts of their members
+
+
+def felts(*values):
+    return [felt.from_int(value) for value in values]
+
+
+def test_update_thief_state():
+    event = decode_update_thief_state_event(felts(5, 1, 1680000000, 250))
+    # 5 + 2**128
+    adventurer_id = 340282366920938463463374607431768211461
+    assert event == (
+        {"AdventurerId": adventurer_id, "StartTime": 1680000000, "Gold": 250},
+    )
+    assert event.thief_state["AdventurerId"] == adventurer_id
+
+
+def test_adventurer_ambushed():
+    event = decode_adventurer_ambushed_event(felts(7, 0, 12, 0, 3, 97))
+    assert event == (7, 12, 3, 97)
+    assert event.beast_token_id == 7
+    assert event.adventurer_token_id == 12
+    assert event.damage == 3
+    assert event.adventurer_health == 97
+
+
+def test_mint_adventurer_owner_uses_every_limb():
+    owner = 0x049D36570D4E46F48E99674BD3FCC84644DDD6B96F7C741B1562B82F9E004DC7
+    event = decode_mint_adventurer_event(felts(1, 0, owner))
+    assert event == (1, owner)
+
+
+def test_item_merchant_update_reads_members_after_a_struct():
+    item = list(range(100, 113))
+    bid = [20, 1680000600, 0xABC, 1, 42]
+    event = decode_item_merchant_update_event(felts(*item, 9, *bid))
+    assert event.item == {
+        "Id": 100,
+        "Slot": 101,
+        "Type": 102,
+        "Material": 103,
+        "Rank": 104,
+        "Prefix_1": 105,
+        "Prefix_2": 106,
+        "Suffix": 107,
+        "Greatness": 108,
+        "CreatedBlock": 109,
+        "XP": 110,
+        "Adventurer": 111,
+        "Bag": 112,
+    }
+    assert event.market_item_id == 9
+    assert event.bid == {
+        "price": 20,
+        "expiry": 1680000600,
+        "bidder": 0xABC,
+        "status": 1,
+        "item_id": 42,
+    }
+
+
+@pytest.mark.parametrize("size", [0, 3, 5])
+def test_wrong_length_payload(size):
+    assert update_thief_state_decoder.size == 4
+    with pytest.raises(ValueError):
+        decode_update_thief_state_event(felts(*range(size)))
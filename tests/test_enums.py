@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+import strawberry
+
+import indexer.graphql
+from indexer.config import Config
+from indexer.enums import EnumRegistry, EnumTable
+
+# enum scalars of the schema and the code table they read
+SCALARS = {
+    "OrderValue": "ORDERS",
+    "RaceValue": "RACES",
+    "BeastValue": "BEASTS",
+    "DiscoveryValue": "DISCOVERY_TYPES",
+    "SubDiscoveryValue": "SUB_DISCOVERY_TYPES",
+    "ObstacleValue": "OBSTACLES",
+    "AttackerValue": "ATTACKERS",
+    "ItemValue": "ITEMS",
+    "MaterialValue": "MATERIALS",
+    "TypeValue": "ITEM_TYPES",
+    "NamePrefixValue": "ITEM_NAME_PREFIXES",
+    "NameSuffixValue": "ITEM_NAME_SUFFIXES",
+    "SuffixValue": "ITEM_SUFFIXES",
+    "StatusValue": "STATUS",
+    "SlotValue": "SLOTS",
+}
+
+
+@pytest.mark.parametrize("scalar, table", SCALARS.items())
+def test_scalar_round_trip(scalar, table):
+    definition = getattr(indexer.graphql, scalar)._scalar_definition
+    names = getattr(Config(), table)
+    for code, name in names.items():
+        value = definition.parse_value(name)
+        assert names[int.from_bytes(value, "big")] == name
+        assert definition.serialize(value) == name
+        assert definition.serialize(code.to_bytes(32, "big")) == name
+
+
+def test_registry_builds_every_code_table():
+    registry = EnumRegistry(Config())
+    for table in set(SCALARS.values()):
+        assert isinstance(getattr(registry, table), EnumTable)
+
+
+def test_first_code_of_a_repeated_name_wins():
+    table = EnumTable({1: "Giant", 2: "Giant", 3: "Titan"})
+    assert table.parse("Giant") == (1).to_bytes(32, "big")
+    assert table.serialize((2).to_bytes(32, "big")) == "Giant"
+
+
+def test_unknown_name_is_a_value_error():
+    with pytest.raises(ValueError):
+        EnumTable({1: "Giant"}).parse("Titan")
+
+
+@pytest.mark.parametrize(
+    "query, variables",
+    [
+        (
+            "query ($order: OrderValue) "
+            "{ adventurers(where: {order: {eq: $order}}) { id } }",
+            {"order": "Not an order"},
+        ),
+        ('{ adventurers(where: {order: {eq: "Not an order"}}) { id } }', None),
+    ],
+)
+def test_invalid_enum_is_a_graphql_error(query, variables):
+    schema = strawberry.Schema(query=indexer.graphql.Query)
+    result = asyncio.run(schema.execute(query, variable_values=variables))
+    assert result.data is None
+    (error,) = result.errors
+    assert "Not an order" in error.message
+    assert not isinstance(error.original_error, KeyError)
@@ -0,0 +1,287 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+import indexer.graphql
+from indexer.graphql import (
+    decode_cursor,
+    encode_cursor,
+    find_page,
+    get_leaderboard,
+    keyset_filter,
+)
+from indexer.indexes import LEADERBOARD_INDEX
+
+
+def matches(doc, filter):
+    """Evaluate the subset of the Mongo query language `keyset_filter` uses."""
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches(doc, clause) for clause in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches(doc, clause) for clause in condition):
+                return False
+            continue
+        value = doc.get(key)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        ((operator, operand),) = condition.items()
+        if operator == "$ne":
+            if value == operand:
+                return False
+        # like Mongo, comparisons never match null
+        elif value is None or operand is None:
+            return False
+        elif operator == "$gt" and not value > operand:
+            return False
+        elif operator == "$lt" and not value < operand:
+            return False
+    return True
+
+
+def mongo_order(docs, sort):
+    """Sort `docs` like Mongo does, null before any other value."""
+    docs = list(docs)
+    for key, direction in reversed(sort):
+        docs.sort(
+            key=lambda doc: (doc[key] is not None, doc[key]), reverse=direction == -1
+        )
+    return docs
+
+
+def test_cursor_round_trip():
+    values = [datetime(2023, 4, 1, 12, 30), None, 12, ObjectId()]
+    assert decode_cursor(encode_cursor(values)) == values
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", encode_cursor([1])[:-4]])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize(
+    "sort",
+    [
+        [("xp", -1), ("_id", -1)],
+        [("xp", 1), ("_id", 1)],
+        [("level", -1), ("xp", 1), ("_id", 1)],
+        [("level", 1), ("xp", -1), ("_id", -1)],
+    ],
+)
+def test_keyset_filter_matches_the_documents_after_the_cursor(sort):
+    docs = [
+        {"_id": i, "level": level, "xp": xp}
+        for i, (level, xp) in enumerate(
+            [(None, None), (None, 3), (1, None), (1, 3), (1, 5), (2, 3), (2, None)] * 2
+        )
+    ]
+    ordered = mongo_order(docs, sort)
+    for i, doc in enumerate(ordered):
+        # a cursor comes back from a page as the bson encoded sort values
+        values = decode_cursor(encode_cursor([doc[key] for key, _ in sort]))
+        filter = keyset_filter(sort, values)
+        after = [other for other in ordered if matches(other, filter)]
+        assert after == ordered[i + 1 :], (doc, filter)
+
+
+DOCS = [
+    {"_id": i, "xp": xp}
+    for i, xp in enumerate([None, 4, 2, None, 4, 7, 2, 4, None, 1, 7])
+]
+
+
+def pages(monkeypatch, limit, **kwargs):
+    async def find(info, collection, filter, skip, limit, sort, projection=None):
+        docs = [doc for doc in mongo_order(DOCS, sort) if matches(doc, filter)]
+        return docs[skip : skip + limit]
+
+    monkeypatch.setattr(indexer.graphql, "find", find)
+    monkeypatch.setattr(indexer.graphql, "node_selections", lambda info: [])
+
+    def page(after=None, before=None):
+        return asyncio.run(
+            find_page(None, "leaderboard", {}, [("xp", -1)], limit, after, before, dict)
+        )
+
+    return page
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 11, 12])
+def test_pages_cover_the_collection_both_ways(monkeypatch, limit):
+    page = pages(monkeypatch, limit)
+    ordered = mongo_order(DOCS, [("xp", -1), ("_id", -1)])
+
+    seen = []
+    connection = page()
+    while True:
+        seen.extend(edge.node for edge in connection.edges)
+        if not connection.pageInfo.hasNextPage:
+            break
+        connection = page(after=connection.pageInfo.endCursor)
+    assert seen == ordered
+
+    # back from the last document
+    last = connection.edges[-1].cursor
+    seen = [ordered[-1]]
+    connection = page(before=last)
+    while True:
+        assert connection.pageInfo.hasNextPage
+        seen[:0] = [edge.node for edge in connection.edges]
+        if not connection.pageInfo.hasPreviousPage:
+            break
+        connection = page(before=connection.pageInfo.startCursor)
+    assert seen == ordered
+
+
+def test_backwards_from_a_vanished_document_has_a_next_page(monkeypatch):
+    page = pages(monkeypatch, 2)
+    ordered = mongo_order(DOCS, [("xp", -1), ("_id", -1)])
+    first = ordered[0]
+    cursor = encode_cursor([first["xp"], first["_id"]])
+    DOCS.remove(first)
+    try:
+        connection = page(before=cursor)
+    finally:
+        DOCS.append(first)
+    assert connection.edges == []
+    assert connection.pageInfo.hasNextPage
+    assert not connection.pageInfo.hasPreviousPage
+
+
+def test_backwards_from_past_the_end_has_no_next_page(monkeypatch):
+    page = pages(monkeypatch, 2)
+    ordered = mongo_order(DOCS, [("xp", -1), ("_id", -1)])
+    last = ordered[-1]
+    cursor = encode_cursor([last["xp"], last["_id"]])
+    DOCS.remove(last)
+    try:
+        connection = page(before=cursor)
+    finally:
+        DOCS.append(last)
+    assert [edge.node for edge in connection.edges] == ordered[-3:-1]
+    assert not connection.pageInfo.hasNextPage
+    assert connection.pageInfo.hasPreviousPage
+
+
+class Leaderboard:
+    """The `leaderboard` collection, recording the queries it answers."""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+
+    def find(self, filter, projection):
+        collection = self
+
+        class Cursor:
+            def sort(self, sort):
+                self.sort = sort
+                return self
+
+            def hint(self, hint):
+                self.hint = hint
+                return self
+
+            def limit(self, limit):
+                self.limit = limit
+                return self
+
+            def __iter__(self):
+                collection.queries.append(("find", filter, self.sort, self.hint))
+                docs = mongo_order(collection.docs, self.sort)
+                docs = [doc for doc in docs if matches(doc, filter)][: self.limit]
+                return iter(
+                    [
+                        {key: doc[key] for key in projection if key in doc}
+                        for doc in docs
+                    ]
+                )
+
+        return Cursor()
+
+    def count_documents(self, filter, hint):
+        self.queries.append(("count", filter, None, hint))
+        return sum(matches(doc, filter) for doc in self.docs)
+
+
+def b(value):
+    return value.to_bytes(32, "big")
+
+
+def leaderboard(xps):
+    # an older version of every entry, left behind by its update
+    return Leaderboard(
+        [
+            {
+                "current": current,
+                "adventurerId": b(i + 1),
+                "xp": xp - (not current),
+                "level": 1,
+                "gold": 0,
+            }
+            for i, xp in enumerate(xps)
+            for current in (True, False)
+        ]
+    )
+
+
+def read_leaderboard(collection, limit):
+    info = SimpleNamespace(
+        context={"db": {"leaderboard": collection}, "executor": None}
+    )
+    entries = []
+    after = None
+    while True:
+        connection = asyncio.run(get_leaderboard(info, limit, after))
+        entries.extend(
+            (edge.node.rank, edge.node.xp, edge.node.adventurerId)
+            for edge in connection.edges
+        )
+        if not connection.pageInfo.hasNextPage:
+            return entries
+        after = connection.pageInfo.endCursor
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 6])
+def test_leaderboard_ranks_equal_xp_across_pages(limit):
+    entries = read_leaderboard(leaderboard([7, 10, 7, 3, 7, 10]), limit)
+    # equal xp are ranked by descending adventurer id, whatever the page size;
+    # xp is served as a felt
+    assert entries == [
+        (1, b(10), b(6)),
+        (2, b(10), b(2)),
+        (3, b(7), b(5)),
+        (4, b(7), b(3)),
+        (5, b(7), b(1)),
+        (6, b(3), b(4)),
+    ]
+
+
+def test_leaderboard_queries_follow_the_leaderboard_index():
+    collection = leaderboard([7, 10, 7, 3, 7, 10])
+    read_leaderboard(collection, 2)
+    index_keys = [key for key, _ in LEADERBOARD_INDEX]
+    for kind, filter, sort, hint in collection.queries:
+        assert hint == LEADERBOARD_INDEX
+        # an equality on `current` then the sort keys, the index prefix
+        assert filter["current"] is True
+        assert set(filter) <= {"current", "$or"}
+        for clause in filter.get("$or", []):
+            assert set(clause) <= set(index_keys[1:3])
+        if kind == "find":
+            assert sort == LEADERBOARD_INDEX[1:3]
+    assert [kind for kind, *_ in collection.queries] == [
+        "find",
+        "find",
+        "count",
+        "find",
+        "count",
+    ]
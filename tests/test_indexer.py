@@ -0,0 +1,516 @@
+import contextlib
+from datetime import datetime
+
+import pytest
+from apibara.indexer.storage import IndexerStorage
+from apibara.protocol.proto.stream_pb2 import Cursor
+from apibara.starknet import felt
+from apibara.starknet.proto.starknet_pb2 import Block
+from starknet_py.contract import ContractFunction
+
+from indexer.config import Config
+from indexer.decoder import (
+    adventurer_ambushed_decoder,
+    adventurer_attacked_decoder,
+    beast_attacked_decoder,
+    fled_beast_decoder,
+    item_merchant_update_decoder,
+    item_update_state_decoder,
+    mint_item_decoder,
+    update_gold_balance_decoder,
+)
+from indexer.indexer import LootSurvivorIndexer
+from indexer.indexes import ADVENTURER_STATS_FIELDS
+from indexer.storage import BlockWriteBuffer, MongoChainStore, invalidate_after
+
+BEFORE = datetime(2023, 4, 1, 12, 0)
+NOW = datetime(2023, 4, 1, 12, 5)
+TX_HASH = bytes(31) + b"\x01"
+
+ITEM = {
+    "Id": 10,
+    "Slot": 2,
+    "Type": 3,
+    "Material": 4,
+    "Rank": 1,
+    "Prefix_1": 5,
+    "Prefix_2": 6,
+    "Suffix": 7,
+    "Greatness": 8,
+    "CreatedBlock": 100,
+    "XP": 9,
+    "Adventurer": 0,
+    "Bag": 0,
+}
+BID = {"price": 20, "expiry": 1680000600, "bidder": 0xABC, "status": 1, "item_id": 42}
+
+
+def b(value):
+    return value.to_bytes(32, "big")
+
+
+# the fields the item events set, as stored
+ITEM_FIELDS = {
+    "item": b(10),
+    "slot": b(2),
+    "type": b(3),
+    "material": b(4),
+    "rank": b(1),
+    "prefix1": b(5),
+    "prefix2": b(6),
+    "suffix": b(7),
+    "greatness": b(8),
+    "createdBlock": b(100),
+    "xp": b(9),
+    "equippedAdventurerId": None,
+    "bag": None,
+}
+BID_FIELDS = {
+    "price": b(20),
+    "expiry": datetime.fromtimestamp(1680000600),
+    "bidder": b(0xABC),
+    "status": b(1),
+}
+
+
+@pytest.fixture
+def indexer():
+    return LootSurvivorIndexer(Config("goerli", "0x1", "0x2", "0x3", 1))
+
+
+@pytest.fixture
+def handle(store, run):
+    """Run `handler` on `record` in block `block`, return the stored documents."""
+
+    def handle(block, handler, record, collection, time=NOW):
+        async def main():
+            writes = BlockWriteBuffer(store.at_block(block))
+            await handler(writes, time, None, TX_HASH, record)
+            await writes.flush()
+
+        run(main())
+        return store.current(collection)
+
+    return handle
+
+
+def test_update_gold_inserts_a_missing_adventurer(indexer, handle):
+    record = update_gold_balance_decoder.record(adventurer_token_id=1, balance=40)
+    assert handle(1, indexer.update_gold, record, "adventurers") == [
+        {"id": b(1), "gold": b(40), "lastUpdated": NOW}
+    ]
+
+
+def test_update_gold_updates_an_existing_adventurer(indexer, handle, store, run):
+    async def mint():
+        writes = BlockWriteBuffer(store.at_block(1))
+        await writes.insert_one(
+            "adventurers",
+            {"id": b(1), "owner": b(5), "gold": b(20), "lastUpdated": BEFORE},
+        )
+        await writes.flush()
+
+    run(mint())
+    record = update_gold_balance_decoder.record(adventurer_token_id=1, balance=40)
+    assert handle(2, indexer.update_gold, record, "adventurers") == [
+        {"id": b(1), "owner": b(5), "gold": b(40), "lastUpdated": NOW}
+    ]
+
+
+def test_mint_item_inserts_a_missing_item(indexer, handle):
+    record = mint_item_decoder.record(item_token_id=3, to=0x77, adventurer_token_id=1)
+    assert handle(1, indexer.mint_item, record, "items") == [
+        {
+            "marketId": None,
+            "id": b(3),
+            "owner": b(0x77),
+            "ownerAdventurerId": b(1),
+            **dict.fromkeys(ITEM_FIELDS),
+            **dict.fromkeys(BID_FIELDS),
+            "claimedTime": None,
+            "lastUpdated": NOW,
+        }
+    ]
+
+
+def test_mint_item_updates_an_existing_item(indexer, handle):
+    state = item_update_state_decoder.record(item_token_id=3, item=ITEM)
+    handle(1, indexer.update_item_state, state, "items", time=BEFORE)
+    record = mint_item_decoder.record(item_token_id=3, to=0x77, adventurer_token_id=1)
+    # only the owner changes, like the update of the find-then-write handler
+    assert handle(2, indexer.mint_item, record, "items") == [
+        {
+            "marketId": None,
+            "id": b(3),
+            "owner": b(0x77),
+            "ownerAdventurerId": b(1),
+            **ITEM_FIELDS,
+            **dict.fromkeys(BID_FIELDS),
+            "claimedTime": None,
+            "lastUpdated": BEFORE,
+        }
+    ]
+
+
+def test_update_item_state_inserts_a_missing_item(indexer, handle):
+    record = item_update_state_decoder.record(item_token_id=3, item=ITEM)
+    assert handle(1, indexer.update_item_state, record, "items") == [
+        {
+            "marketId": None,
+            "id": b(3),
+            "owner": None,
+            "ownerAdventurerId": None,
+            **ITEM_FIELDS,
+            **dict.fromkeys(BID_FIELDS),
+            "claimedTime": None,
+            "lastUpdated": NOW,
+        }
+    ]
+
+
+def test_update_item_state_updates_an_existing_item(indexer, handle):
+    mint = mint_item_decoder.record(item_token_id=3, to=0x77, adventurer_token_id=1)
+    handle(1, indexer.mint_item, mint, "items", time=BEFORE)
+    record = item_update_state_decoder.record(item_token_id=3, item=ITEM)
+    assert handle(2, indexer.update_item_state, record, "items") == [
+        {
+            "marketId": None,
+            "id": b(3),
+            "owner": b(0x77),
+            "ownerAdventurerId": b(1),
+            **ITEM_FIELDS,
+            **dict.fromkeys(BID_FIELDS),
+            "claimedTime": None,
+            "lastUpdated": NOW,
+        }
+    ]
+
+
+def test_update_merchant_item_inserts_a_missing_item(indexer, handle):
+    record = item_merchant_update_decoder.record(item=ITEM, market_item_id=9, bid=BID)
+    assert handle(1, indexer.update_merchant_item, record, "items") == [
+        {
+            "marketId": b(9),
+            "id": None,
+            "owner": None,
+            "ownerAdventurerId": None,
+            **ITEM_FIELDS,
+            **BID_FIELDS,
+            "claimedTime": None,
+            "lastUpdated": NOW,
+        }
+    ]
+
+
+def test_update_merchant_item_updates_an_existing_item(indexer, handle, store, run):
+    async def claimed():
+        writes = BlockWriteBuffer(store.at_block(1))
+        await writes.insert_one(
+            "items",
+            {
+                "marketId": b(9),
+                "id": b(3),
+                "owner": b(0x77),
+                "ownerAdventurerId": b(1),
+                **dict.fromkeys(ITEM_FIELDS),
+                **dict.fromkeys(BID_FIELDS),
+                "claimedTime": BEFORE,
+                "lastUpdated": BEFORE,
+            },
+        )
+        await writes.flush()
+
+    run(claimed())
+    record = item_merchant_update_decoder.record(item=ITEM, market_item_id=9, bid=BID)
+    # the claim is kept, the item and bid fields are replaced
+    assert handle(2, indexer.update_merchant_item, record, "items") == [
+        {
+            "marketId": b(9),
+            "id": b(3),
+            "owner": b(0x77),
+            "ownerAdventurerId": b(1),
+            **ITEM_FIELDS,
+            **BID_FIELDS,
+            "claimedTime": BEFORE,
+            "lastUpdated": NOW,
+        }
+    ]
+
+
+def block_with(*events):
+    """A block at `NOW` with the `(address, event name, data)` events."""
+    block = Block()
+    block.header.timestamp.FromDatetime(NOW)
+    for address, name, data in events:
+        event = block.events.add()
+        event.transaction.meta.hash.CopyFrom(felt.from_int(1))
+        event.event.from_address.CopyFrom(felt.from_hex(address))
+        event.event.keys.append(felt.from_int(ContractFunction.get_selector(name)))
+        event.event.data.extend(felt.from_int(value) for value in data)
+    return block
+
+
+@pytest.fixture
+def dispatch(indexer, store, run):
+    """Run `handle_events` on a block with `events`, return the adventurers."""
+    indexer.initial_configuration()
+
+    def dispatch(*events):
+        async def main():
+            writes = BlockWriteBuffer(store.at_block(1))
+            await indexer.handle_events(writes, block_with(*events))
+            await writes.flush()
+
+        run(main())
+        return store.current("adventurers")
+
+    return dispatch
+
+
+def test_known_event_is_dispatched_to_its_handler(indexer, dispatch):
+    # UpdateGoldBalance of the beast contract, adventurer 1 has 40 gold
+    assert dispatch(("0x2", "UpdateGoldBalance", [1, 0, 40])) == [
+        {"id": b(1), "gold": b(40), "lastUpdated": NOW}
+    ]
+    assert dict(indexer.metrics.events.samples()) == {
+        'indexer_events_total{event="update_gold"}': 1
+    }
+    assert not indexer.unknown_events
+
+
+def test_unknown_events_are_counted_and_not_dispatched(indexer, dispatch):
+    unknown = [
+        # a known event of another contract
+        ("0x9", "UpdateGoldBalance", [1, 0, 40]),
+        # an event the beast contract has no handler for
+        ("0x2", "MintItem", [3, 0, 0x77, 1, 0]),
+        ("0x2", "MintItem", [3, 0, 0x77, 1, 0]),
+    ]
+    assert dispatch(*unknown) == []
+    assert indexer.unknown_events == {
+        (b(0x9), b(ContractFunction.get_selector("UpdateGoldBalance"))): 1,
+        (b(0x2), b(ContractFunction.get_selector("MintItem"))): 2,
+    }
+    assert dict(indexer.metrics.unknown_events.samples()) == {
+        "indexer_unknown_events_total": 3
+    }
+    assert not dict(indexer.metrics.events.samples())
+
+
+def beast_attacked(damage, beast_health, xp=0, gold=0):
+    return beast_attacked_decoder.record(
+        beast_token_id=2,
+        adventurer_token_id=1,
+        damage=damage,
+        beast_health=beast_health,
+        xp_gained=xp,
+        gold_reward=gold,
+    )
+
+
+def adventurer_attacked(damage, adventurer_health):
+    return adventurer_attacked_decoder.record(
+        beast_token_id=2,
+        adventurer_token_id=1,
+        damage=damage,
+        adventurer_health=adventurer_health,
+        xp_gained=0,
+        gold_reward=0,
+    )
+
+
+def adventurer_ambushed(damage, adventurer_health):
+    return adventurer_ambushed_decoder.record(
+        beast_token_id=2,
+        adventurer_token_id=1,
+        damage=damage,
+        adventurer_health=adventurer_health,
+    )
+
+
+FLED = fled_beast_decoder.record(beast_token_id=2, adventurer_token_id=1)
+
+
+def stats(**counters):
+    return {
+        "adventurerId": b(1),
+        **dict.fromkeys(ADVENTURER_STATS_FIELDS, 0),
+        **counters,
+        "lastUpdated": NOW,
+    }
+
+
+@pytest.mark.parametrize(
+    "handler, record, counters",
+    [
+        ("beast_attacked", beast_attacked(4, 6), {"damageDealt": 4}),
+        (
+            "beast_attacked",
+            beast_attacked(6, 0, xp=10, gold=3),
+            {
+                "battles": 1,
+                "damageDealt": 6,
+                "beastsSlain": 1,
+                "xpEarned": 10,
+                "goldEarned": 3,
+            },
+        ),
+        ("adventurer_attacked", adventurer_attacked(3, 97), {"damageTaken": 3}),
+        (
+            "adventurer_attacked",
+            adventurer_attacked(3, 0),
+            {"battles": 1, "damageTaken": 3},
+        ),
+        ("fled_beast", FLED, {"battles": 1, "timesFled": 1}),
+        (
+            "adventurer_ambushed",
+            adventurer_ambushed(3, 97),
+            {"damageTaken": 3, "timesAmbushed": 1},
+        ),
+        (
+            "adventurer_ambushed",
+            adventurer_ambushed(3, 0),
+            {"battles": 1, "damageTaken": 3, "timesAmbushed": 1},
+        ),
+    ],
+)
+def test_battles_count_only_finished_battles(
+    indexer, handle, handler, record, counters
+):
+    handler = getattr(indexer, handler)
+    assert handle(1, handler, record, "adventurerStats") == [stats(**counters)]
+
+
+def test_stats_are_incremented_within_and_across_blocks(indexer, handle):
+    handle(1, indexer.beast_attacked, beast_attacked(4, 6), "adventurerStats")
+    handle(
+        1, indexer.adventurer_attacked, adventurer_attacked(3, 97), "adventurerStats"
+    )
+    handle(2, indexer.beast_attacked, beast_attacked(6, 0, 10, 3), "adventurerStats")
+    handle(
+        3, indexer.adventurer_ambushed, adventurer_ambushed(2, 95), "adventurerStats"
+    )
+    handle(3, indexer.fled_beast, FLED, "adventurerStats")
+    assert handle(
+        4, indexer.adventurer_attacked, adventurer_attacked(95, 0), "adventurerStats"
+    ) == [
+        stats(
+            battles=3,
+            damageDealt=10,
+            damageTaken=100,
+            beastsSlain=1,
+            timesFled=1,
+            timesAmbushed=1,
+            goldEarned=3,
+            xpEarned=10,
+        )
+    ]
+
+
+def lookup(doc, key):
+    for part in key.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def matches(doc, filter):
+    """Evaluate the queries of `MongoChainStore` and apibara's invalidation."""
+    for key, condition in filter.items():
+        value = lookup(doc, key)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+        elif "$nin" in condition:
+            if value in condition["$nin"]:
+                return False
+        elif value is None or value <= condition["$gt"]:
+            return False
+    return True
+
+
+def set_fields(doc, fields):
+    for key, value in fields.items():
+        *parents, last = key.split(".")
+        target = doc
+        for part in parents:
+            target = target[part]
+        target[last] = value
+
+
+class VersionedCollection:
+    """A Mongo collection keeping every version, enough for the chain stores."""
+
+    def __init__(self):
+        self.docs = []
+
+    def find_one(self, filter, session=None):
+        return next((dict(doc) for doc in self.docs if matches(doc, filter)), None)
+
+    def bulk_write(self, requests, ordered, session=None):
+        for request in requests:
+            if request._doc.keys() == {"$set"}:
+                for doc in self.docs:
+                    if matches(doc, request._filter):
+                        set_fields(doc, request._doc["$set"])
+            else:
+                self.docs.append(request._doc)
+
+    def delete_many(self, filter, session=None):
+        self.docs = [doc for doc in self.docs if not matches(doc, filter)]
+
+    def update_many(self, filter, update, session=None):
+        for doc in self.docs:
+            if matches(doc, filter):
+                set_fields(doc, update["$set"])
+
+
+class VersionedDatabase(dict):
+    def __missing__(self, name):
+        return self.setdefault(name, VersionedCollection())
+
+    def list_collections(self, session=None):
+        return [{"name": name} for name in self]
+
+
+class VersionedStorage:
+    """apibara's storage, invalidating the in-memory `db` with its own code."""
+
+    invalidate = IndexerStorage.invalidate
+
+    def __init__(self):
+        self.db = VersionedDatabase()
+        self._mongo = self
+
+    @contextlib.contextmanager
+    def start_session(self):
+        yield None
+
+
+def test_invalidate_after_rolls_the_stats_back(indexer, run):
+    storage = VersionedStorage()
+
+    def handle(block, handler, record):
+        async def main():
+            writes = BlockWriteBuffer(MongoChainStore(storage.db, block))
+            await handler(writes, NOW, None, TX_HASH, record)
+            await writes.flush()
+
+        run(main())
+        return [
+            {key: doc[key] for key in ("battles", "damageDealt", "beastsSlain")}
+            for doc in storage.db["adventurerStats"].docs
+            if doc["_chain"]["valid_to"] is None
+        ]
+
+    handle(1, indexer.beast_attacked, beast_attacked(4, 6))
+    assert handle(2, indexer.beast_attacked, beast_attacked(6, 0)) == [
+        {"battles": 1, "damageDealt": 10, "beastsSlain": 1}
+    ]
+    invalidate_after(storage, Cursor(order_key=1))
+    # the battle of block 2 is gone with its increments
+    assert handle(2, indexer.fled_beast, FLED) == [
+        {"battles": 1, "damageDealt": 4, "beastsSlain": 0}
+    ]
+    assert len(storage.db["battles"].docs) == 2
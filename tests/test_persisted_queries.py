@@ -0,0 +1,71 @@
+import asyncio
+import hashlib
+import json
+
+from aiohttp import web
+
+from indexer.persisted_queries import PersistedQueries, PersistedQueryHTTPHandler
+
+QUERY = "{ adventurers { id } }"
+QUERY_HASH = hashlib.sha256(QUERY.encode()).hexdigest()
+
+
+class Handler(PersistedQueryHTTPHandler):
+    """Handler posting `body`, recording the queries it executes."""
+
+    def __init__(self, persisted_queries, body):
+        self.persisted_queries = persisted_queries
+        self.body = body
+        self.executed = []
+
+    async def parse_body(self, request):
+        return self.body
+
+    async def execute_request(self, request, request_data, method):
+        self.executed.append(request_data.query)
+        return web.json_response({"data": {}})
+
+
+def post(persisted_queries, sha256_hash, query=None):
+    body = {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": sha256_hash}}}
+    if query is not None:
+        body["query"] = query
+    handler = Handler(persisted_queries, body)
+    response = asyncio.run(handler.post(None))
+    return response.status, json.loads(response.text), handler.executed
+
+
+def test_unknown_hash_is_not_found():
+    status, body, executed = post(PersistedQueries(10), QUERY_HASH)
+    assert status == 200
+    assert body["errors"][0]["message"] == "PersistedQueryNotFound"
+    assert executed == []
+
+
+def test_hash_mismatch_is_rejected():
+    queries = PersistedQueries(10)
+    status, body, executed = post(queries, "0" * 64, QUERY)
+    assert status == 400
+    assert body["errors"][0]["extensions"]["code"] == "PERSISTED_QUERY_HASH_MISMATCH"
+    assert executed == []
+    assert queries.get("0" * 64) is None
+
+
+def test_registered_hash_is_served():
+    queries = PersistedQueries(10)
+    assert post(queries, QUERY_HASH, QUERY) == (200, {"data": {}}, [QUERY])
+    assert post(queries, QUERY_HASH) == (200, {"data": {}}, [QUERY])
+
+
+def test_least_recently_used_queries_are_evicted():
+    queries = PersistedQueries(2)
+    hashes = {}
+    for query in ("{ a }", "{ b }", "{ c }"):
+        hashes[query] = hashlib.sha256(query.encode()).hexdigest()
+    assert queries.register(hashes["{ a }"], "{ a }")
+    assert queries.register(hashes["{ b }"], "{ b }")
+    queries.get(hashes["{ a }"])
+    assert queries.register(hashes["{ c }"], "{ c }")
+    assert queries.get(hashes["{ b }"]) is None
+    assert queries.get(hashes["{ a }"]) == "{ a }"
+    assert queries.get(hashes["{ c }"]) == "{ c }"
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+from apibara.protocol.proto.stream_pb2 import Cursor, StreamDataResponse
+from apibara.starknet.proto.starknet_pb2 import Block
+
+import indexer.replay
+from indexer.archive import BlockArchive, BlockWriter
+from indexer.replay import record_blocks
+
+
+def raw_block(number):
+    block = Block()
+    block.header.block_number = number
+    return block.SerializeToString()
+
+
+def data_message(number):
+    message = StreamDataResponse()
+    message.data.end_cursor.order_key = number
+    message.data.data.append(raw_block(number))
+    return message
+
+
+def heartbeat():
+    message = StreamDataResponse()
+    message.heartbeat.SetInParent()
+    return message
+
+
+class Configuration:
+    class filter:
+        @staticmethod
+        def encode():
+            return b""
+
+    starting_cursor = Cursor(order_key=9)
+
+
+class Indexer:
+    def initial_configuration(self):
+        return Configuration()
+
+
+class Channel:
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    """Serve the messages appended to the returned list, record the cursors."""
+    messages = []
+    cursors = []
+
+    class Client:
+        async def configure(self, **kwargs):
+            cursors.append(kwargs["cursor"].order_key)
+
+    class Stream:
+        async def __aiter__(self):
+            for message in messages:
+                yield message
+
+    class Service:
+        def __init__(self, channel):
+            pass
+
+        def stream_data(self):
+            return Client(), Stream()
+
+    monkeypatch.setattr(indexer.replay, "StreamService", Service)
+    return messages, cursors
+
+
+def record(path, end_block=None):
+    return asyncio.run(record_blocks(str(path), Indexer(), Channel(), end_block))
+
+
+def archived(path):
+    with BlockArchive(str(path)) as archive:
+        return list(archive.numbers)
+
+
+def test_record_stops_at_the_head(tmp_path, stream):
+    messages, cursors = stream
+    messages.extend([data_message(10), data_message(11), heartbeat(), data_message(12)])
+    assert record(tmp_path / "blocks.bin") == 2
+    assert cursors == [9]
+    assert archived(tmp_path / "blocks.bin") == [10, 11]
+
+
+def test_record_stops_at_the_end_block(tmp_path, stream):
+    messages, _ = stream
+    messages.extend([data_message(10), data_message(11), data_message(12)])
+    assert record(tmp_path / "blocks.bin", end_block=11) == 2
+    assert archived(tmp_path / "blocks.bin") == [10, 11]
+
+
+def test_record_stops_when_past_the_end_block(tmp_path, stream):
+    messages, _ = stream
+    messages.extend([data_message(10), data_message(13), data_message(14)])
+    assert record(tmp_path / "blocks.bin", end_block=12) == 1
+    assert archived(tmp_path / "blocks.bin") == [10]
+
+
+def test_record_resumes_after_the_last_archived_block(tmp_path, stream):
+    path = tmp_path / "blocks.bin"
+    with BlockWriter(str(path)) as writer:
+        for number in (10, 11, 12):
+            writer.write(raw_block(number), number)
+    messages, cursors = stream
+    messages.extend([data_message(13), data_message(14), heartbeat()])
+    assert record(path) == 2
+    assert cursors == [12]
+    assert archived(path) == [10, 11, 12, 13, 14]
@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+from strawberry.http import GraphQLRequestData
+
+from indexer.response_cache import ResponseCache, watch_head
+
+QUERY = "query Gold($id: FeltValue) { adventurers(where: {id: {eq: $id}}) { gold } }"
+# the same query, formatted differently
+REFORMATTED = """
+query Gold($id: FeltValue) {
+  adventurers(where: { id: { eq: $id } }) {
+    gold
+  }
+}
+"""
+HEAD = (10, 0, 0)
+
+
+def request(query=QUERY, variables=None, operation_name="Gold"):
+    if variables is None:
+        variables = {"id": 1}
+    return GraphQLRequestData(query, variables, operation_name)
+
+
+def cached(max_bytes=1000):
+    cache = ResponseCache(max_bytes)
+    cache.set_head("goerli", HEAD)
+    cache.put(cache.key_for("goerli", request()), "response")
+    return cache
+
+
+def test_hit_for_the_same_head_query_variables_and_operation():
+    cache = cached()
+    assert cache.get(cache.key_for("goerli", request())) == "response"
+    assert cache.get(cache.key_for("goerli", request(REFORMATTED))) == "response"
+    assert cache.hits == 2
+
+
+def test_miss_for_other_variables_operation_or_network():
+    cache = cached()
+    cache.set_head("mainnet", HEAD)
+    for network, data in [
+        ("goerli", request(variables={"id": 2})),
+        ("goerli", request(operation_name=None)),
+        ("mainnet", request()),
+    ]:
+        assert cache.get(cache.key_for(network, data)) is None
+    assert cache.misses == 3
+
+
+def test_no_key_without_a_head_or_for_an_invalid_query():
+    cache = ResponseCache(1000)
+    assert cache.key_for("goerli", request()) is None
+    cache.set_head("goerli", HEAD)
+    assert cache.key_for("goerli", request("query {")) is None
+
+
+def test_put_is_dropped_when_the_head_moved_during_the_query():
+    cache = ResponseCache(1000)
+    cache.set_head("goerli", HEAD)
+    key = cache.key_for("goerli", request())
+    cache.set_head("goerli", (11, 0, 0))
+    cache.put(key, "stale")
+    assert cache.size == 0
+    assert cache.get(cache.key_for("goerli", request())) is None
+
+
+def test_new_head_or_pending_count_invalidates_entries():
+    # a new block, then a pending block written at the same cursor
+    for head in [(11, 0, 0), (10, 0, 1)]:
+        cache = cached()
+        cache.set_head("goerli", head)
+        assert cache.size == 0
+        assert cache.get(cache.key_for("goerli", request())) is None
+
+
+class Stopped(Exception):
+    pass
+
+
+class Apibara:
+    """The `_apibara` collection, returning `states` then stopping the watch."""
+
+    def __init__(self, states, cache):
+        self.states = list(states)
+        self.cache = cache
+        self.heads = []
+
+    def find_one(self, filter, projection):
+        self.heads.append(self.cache._heads.get("goerli"))
+        if not self.states:
+            raise Stopped
+        return self.states.pop(0)
+
+
+def test_watch_head_includes_the_pending_count():
+    cache = ResponseCache(1000)
+    cursor = {"order_key": 10, "unique_key": b"a"}
+    apibara = Apibara(
+        [{"cursor": cursor, "pending": 0}, {"cursor": cursor, "pending": 1}], cache
+    )
+    with pytest.raises(Stopped):
+        asyncio.run(watch_head(cache, "goerli", {"_apibara": apibara}, None, 0))
+    assert apibara.heads == [None, (10, b"a", 0), (10, b"a", 1)]
+
+
+def test_same_head_keeps_entries():
+    cache = cached()
+    cache.set_head("goerli", HEAD)
+    assert cache.get(cache.key_for("goerli", request())) == "response"
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ResponseCache(max_bytes=10)
+    cache.set_head("goerli", HEAD)
+    first, second, third = (
+        cache.key_for("goerli", request(variables={"id": n})) for n in (1, 2, 3)
+    )
+    cache.put(first, "aaaa")
+    cache.put(second, "bbbb")
+    cache.get(first)
+    cache.put(third, "cccc")
+    assert cache.size == 8
+    assert cache.get(second) is None
+    assert cache.get(first) == "aaaa"
+    assert cache.get(third) == "cccc"
@@ -0,0 +1,314 @@
+import asyncio
+import contextlib
+import time
+
+import pytest
+from apibara.protocol.proto.stream_pb2 import Cursor, DataFinality, StreamDataResponse
+from apibara.starknet.proto.starknet_pb2 import Block
+
+import indexer.runner
+from indexer.runner import ChainIndexerRunner
+from indexer.storage import invalidate_after, mark_pending
+
+ACCEPTED = DataFinality.DATA_STATUS_ACCEPTED
+PENDING = DataFinality.DATA_STATUS_PENDING
+# the update made by `mark_pending`
+MARK_PENDING = (
+    "update_one",
+    "_apibara",
+    {"indexer_id": "loot"},
+    {"$inc": {"pending": 1}},
+)
+
+
+class Collection:
+    def __init__(self, name, calls):
+        self.name = name
+        self.calls = calls
+
+    def update_one(self, filter, update):
+        self.calls.append(("update_one", self.name, filter, update))
+
+    def update_many(self, filter, update):
+        self.calls.append(("update_many", self.name, filter, update))
+
+
+class Storage:
+    """apibara's `IndexerStorage`, recording what the runner does with it."""
+
+    def __init__(self, calls, stored_configuration=False):
+        self.calls = calls
+        self.stored_configuration = stored_configuration
+        self._indexer_id = "loot"
+        self.db = {
+            name: Collection(name, calls) for name in ("_apibara", "leaderboard")
+        }
+
+    def update_with_stored_configuration(self, config):
+        return self.stored_configuration
+
+    def invalidate(self, cursor):
+        self.calls.append(("invalidate", cursor.order_key))
+
+    @contextlib.contextmanager
+    def _block(self, kind, cursor):
+        yield kind
+        self.calls.append(("store-" + kind, cursor.order_key))
+
+    def create_storage_for_data(self, cursor):
+        return self._block("data", cursor)
+
+    def create_storage_for_pending(self, cursor):
+        return self._block("pending", cursor)
+
+    def create_storage_for_invalidate(self, cursor):
+        return self._block("invalidate", cursor)
+
+
+class Configuration:
+    class filter:
+        @staticmethod
+        def encode():
+            return b""
+
+    finality = PENDING
+    starting_cursor = Cursor(order_key=0)
+
+
+class Cache:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def clear(self):
+        self.calls.append(("cache-clear",))
+
+
+class Indexer:
+    def __init__(self, calls):
+        self.calls = calls
+        self.cache = Cache(calls)
+
+    def initial_configuration(self):
+        return Configuration()
+
+    def decode_data(self, raw):
+        return Block.FromString(raw)
+
+    async def handle_data(self, info, block):
+        self.calls.append(("data", info.storage, block.header.block_number))
+
+    async def handle_pending_data(self, info, block):
+        self.calls.append(("pending", info.storage, block.header.block_number))
+
+    async def handle_batch(self, info, blocks):
+        numbers = [block.header.block_number for block in blocks]
+        self.calls.append(("batch", info.end_cursor.order_key, numbers))
+
+    async def handle_invalidate(self, info, cursor):
+        self.calls.append(("handle-invalidate", cursor.order_key))
+
+
+def data_message(number, finality=ACCEPTED, age=3600):
+    block = Block()
+    block.header.block_number = number
+    block.header.timestamp.seconds = int(time.time()) - age
+    message = StreamDataResponse()
+    message.data.end_cursor.order_key = number
+    message.data.finality = finality
+    message.data.data.append(block.SerializeToString())
+    return message
+
+
+def invalidate_message(number):
+    message = StreamDataResponse()
+    message.invalidate.cursor.order_key = number
+    return message
+
+
+def heartbeat():
+    message = StreamDataResponse()
+    message.heartbeat.SetInParent()
+    return message
+
+
+@pytest.fixture
+def run(monkeypatch):
+    """Stream `messages` through a runner, return the calls it made."""
+
+    def run(messages, catch_up_batch=1, stored_configuration=False):
+        calls = []
+
+        class Client:
+            async def configure(self, **kwargs):
+                calls.append(
+                    ("configure", kwargs["finality"], kwargs["cursor"].order_key)
+                )
+
+        class Stream:
+            async def __aiter__(self):
+                for message in messages:
+                    yield message
+
+        class Service:
+            def __init__(self, channel):
+                pass
+
+            def stream_data(self):
+                return Client(), Stream()
+
+        monkeypatch.setattr(indexer.runner, "StreamService", Service)
+        runner = ChainIndexerRunner(catch_up_batch=catch_up_batch)
+        runner._indexer_storage = Storage(calls, stored_configuration)
+        runner._channel = lambda: None
+        asyncio.run(runner._connect_and_stream(Indexer(calls), None))
+        return [call for call in calls if call[0] != "update_many"]
+
+    return run
+
+
+def test_accepted_blocks_store_their_cursor(run):
+    calls = run([data_message(1), data_message(2)])
+    assert calls == [
+        ("cache-clear",),
+        ("configure", PENDING, 0),
+        ("data", "data", 1),
+        ("store-data", 1),
+        ("data", "data", 2),
+        ("store-data", 2),
+    ]
+
+
+def test_pending_blocks_are_replaced_by_the_next_block(run):
+    calls = run(
+        [
+            data_message(1),
+            data_message(2, PENDING),
+            data_message(2, PENDING),
+            data_message(2),
+        ]
+    )
+    assert calls[2:] == [
+        ("data", "data", 1),
+        ("store-data", 1),
+        ("pending", "pending", 2),
+        ("store-pending", 2),
+        MARK_PENDING,
+        # the previous pending block is dropped before the next one is written
+        ("invalidate", 1),
+        ("pending", "pending", 2),
+        ("store-pending", 2),
+        MARK_PENDING,
+        ("invalidate", 1),
+        ("data", "data", 2),
+        ("store-data", 2),
+    ]
+
+
+def test_invalidate_rolls_back_before_the_indexer(run):
+    calls = run(
+        [
+            data_message(5),
+            data_message(6, PENDING),
+            invalidate_message(4),
+            data_message(5),
+        ]
+    )
+    assert calls[4:] == [
+        ("pending", "pending", 6),
+        ("store-pending", 6),
+        MARK_PENDING,
+        ("invalidate", 4),
+        ("handle-invalidate", 4),
+        ("store-invalidate", 4),
+        # the pending block is gone with the invalidation
+        ("data", "data", 5),
+        ("store-data", 5),
+    ]
+
+
+def test_stored_configuration_drops_pending_data_on_connect(run):
+    calls = run([], stored_configuration=True)
+    assert calls == [("invalidate", 0), ("cache-clear",), ("configure", PENDING, 0)]
+
+
+def test_catch_up_commits_batches_until_the_head(run):
+    calls = run(
+        [data_message(n) for n in range(1, 6)]
+        + [data_message(6, age=0), data_message(7, PENDING, age=0)],
+        catch_up_batch=2,
+    )
+    assert calls == [
+        ("cache-clear",),
+        ("configure", ACCEPTED, 0),
+        ("batch", 2, [1, 2]),
+        ("store-data", 2),
+        ("batch", 4, [3, 4]),
+        ("store-data", 4),
+        # a recent block ends the catch up
+        ("batch", 6, [5, 6]),
+        ("store-data", 6),
+        ("configure", PENDING, 6),
+        ("pending", "pending", 7),
+        ("store-pending", 7),
+        MARK_PENDING,
+    ]
+
+
+def test_catch_up_ends_on_heartbeat(run):
+    calls = run(
+        [data_message(1), data_message(2), data_message(3), heartbeat()],
+        catch_up_batch=2,
+    )
+    assert calls[2:] == [
+        ("batch", 2, [1, 2]),
+        ("store-data", 2),
+        ("batch", 3, [3]),
+        ("store-data", 3),
+        ("configure", PENDING, 3),
+    ]
+
+
+def test_invalidate_commits_the_open_catch_up_batch_first(run):
+    calls = run(
+        [
+            data_message(1),
+            data_message(2),
+            invalidate_message(1),
+            data_message(2),
+            heartbeat(),
+        ],
+        catch_up_batch=3,
+    )
+    assert calls == [
+        ("cache-clear",),
+        ("configure", ACCEPTED, 0),
+        # blocks 1 and 2 are stored before the rollback to block 1
+        ("batch", 2, [1, 2]),
+        ("store-data", 2),
+        ("invalidate", 1),
+        ("handle-invalidate", 1),
+        ("store-invalidate", 1),
+        ("batch", 2, [2]),
+        ("store-data", 2),
+        ("configure", PENDING, 2),
+    ]
+
+
+def test_invalidate_after_restores_the_current_flag():
+    calls = []
+    invalidate_after(Storage(calls), Cursor(order_key=7))
+    assert calls == [
+        ("invalidate", 7),
+        (
+            "update_many",
+            "leaderboard",
+            {"current": False, "_chain.valid_to": None},
+            {"$set": {"current": True}},
+        ),
+    ]
+
+
+def test_mark_pending_counts_pending_blocks():
+    calls = []
+    mark_pending(Storage(calls))
+    assert calls == [MARK_PENDING]
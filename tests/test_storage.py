@@ -0,0 +1,127 @@
+from indexer.storage import BlockWriteBuffer
+
+
+def test_flush_writes_each_collection_once(store, run):
+    async def main():
+        writes = BlockWriteBuffer(store.at_block(1))
+        await writes.insert_one("adventurers", {"id": 1, "gold": 0})
+        await writes.find_one_and_update(
+            "adventurers", {"id": 1}, {"$inc": {"gold": 5}}
+        )
+        await writes.upsert_one("beasts", {"id": 2}, {"$set": {"health": 10}})
+        await writes.flush()
+
+    run(main())
+    assert store.writes == [(1, "adventurers", 0, 1), (1, "beasts", 0, 1)]
+    assert store.current("adventurers") == [{"id": 1, "gold": 5}]
+    assert store.current("beasts") == [{"id": 2, "health": 10}]
+
+
+def test_reads_see_earlier_writes_of_the_block(store, run):
+    async def main():
+        writes = BlockWriteBuffer(store.at_block(1))
+        await writes.insert_one("adventurers", {"id": 1, "gold": 0})
+        await writes.flush()
+
+        writes = BlockWriteBuffer(store.at_block(2))
+        await writes.find_one_and_update(
+            "adventurers", {"id": 1}, {"$inc": {"gold": 3}}
+        )
+        await writes.find_one_and_update(
+            "adventurers", {"id": 1}, {"$inc": {"gold": 4}}
+        )
+        doc = await writes.find_one("adventurers", {"id": 1})
+        return doc
+
+    doc = run(main())
+    assert doc["gold"] == 7
+    # loaded once, then answered from the buffer
+    assert store.reads == 1
+    assert store.writes == [(1, "adventurers", 0, 1)]
+
+
+def test_flush_closes_changed_versions_only(store, run):
+    async def main():
+        writes = BlockWriteBuffer(store.at_block(1))
+        await writes.insert_one("items", {"id": 1, "owner": 0})
+        await writes.insert_one("items", {"id": 2, "owner": 0})
+        await writes.flush()
+
+        writes = BlockWriteBuffer(store.at_block(2))
+        await writes.find_one_and_update("items", {"id": 1}, {"$set": {"owner": 0}})
+        await writes.find_one_and_update("items", {"id": 2}, {"$set": {"owner": 9}})
+        await writes.flush()
+
+    run(main())
+    assert store.writes[-1] == (2, "items", 1, 1)
+    assert store.current("items") == [{"id": 1, "owner": 0}, {"id": 2, "owner": 9}]
+    versions = {doc["id"]: doc["_chain"] for doc in store._documents["items"].values()}
+    assert versions == {
+        1: {"valid_from": 1, "valid_to": None},
+        2: {"valid_from": 2, "valid_to": None},
+    }
+
+
+def test_deleted_documents_are_closed_without_a_new_version(store, run):
+    async def main():
+        writes = BlockWriteBuffer(store.at_block(1))
+        await writes.insert_one("items", {"marketId": 1, "price": 5})
+        await writes.flush()
+
+        writes = BlockWriteBuffer(store.at_block(2))
+        await writes.delete_one("items", {"marketId": 1})
+        missing = await writes.find_one("items", {"marketId": 1})
+        await writes.flush()
+        return missing
+
+    missing = run(main())
+    assert missing is None
+    assert store.writes[-1] == (2, "items", 1, 0)
+    assert store.current("items") == []
+
+
+def test_lookup_follows_changed_fields(store, run):
+    async def main():
+        writes = BlockWriteBuffer(store.at_block(1))
+        await writes.insert_one("items", {"marketId": 1, "price": 5})
+        await writes.insert_one("items", {"id": 9, "marketId": None})
+        await writes.flush()
+
+        writes = BlockWriteBuffer(store.at_block(2))
+        # the item bought from the market takes the id of another one
+        await writes.find_one_and_update(
+            "items", {"marketId": 1}, {"$set": {"id": 9, "owner": 3}}
+        )
+        await writes.delete_one("items", {"id": 9, "marketId": None})
+        claimed = await writes.find_one("items", {"id": 9})
+        await writes.flush()
+
+        writes = BlockWriteBuffer(store.at_block(3))
+        await writes.find_one_and_update("items", {"id": 9}, {"$set": {"id": 10}})
+        # the stored version of the buffered document is not matched again
+        stale = await writes.find_one("items", {"id": 9})
+        return claimed, stale
+
+    claimed, stale = run(main())
+    assert claimed["marketId"] == 1
+    assert claimed["owner"] == 3
+    assert stale is None
+
+
+def test_upsert_builds_new_documents_from_the_filter(store, run):
+    async def main():
+        writes = BlockWriteBuffer(store.at_block(1))
+        await writes.upsert_one(
+            "adventurerStats",
+            {"adventurerId": 1},
+            {"$setOnInsert": {"kills": 0}, "$inc": {"kills": 1}},
+        )
+        await writes.upsert_one(
+            "adventurerStats",
+            {"adventurerId": 1},
+            {"$setOnInsert": {"kills": 0}, "$inc": {"kills": 1}},
+        )
+        await writes.flush()
+
+    run(main())
+    assert store.current("adventurerStats") == [{"adventurerId": 1, "kills": 2}]
@@ -0,0 +1,31 @@
+import pytest
+from apibara.starknet import felt
+from apibara.starknet.proto.starknet_pb2 import Event
+
+from indexer.utils import felt_to_bytes, felts_to_ints
+
+VALUES = [
+    0,
+    1,
+    2**64 - 1,
+    2**64,
+    2**128 + 5,
+    2**192,
+    0x049D36570D4E46F48E99674BD3FCC84644DDD6B96F7C741B1562B82F9E004DC7,
+    2**251 + 17 * 2**192,
+]
+
+
+def test_felts_to_ints():
+    event = Event()
+    event.data.extend(felt.from_int(value) for value in VALUES)
+    assert felts_to_ints(event.data) == VALUES
+    assert felts_to_ints(event.data) == [felt.to_int(f) for f in event.data]
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_felt_to_bytes_matches_the_stored_hex_encoding(value):
+    f = felt.from_int(value)
+    # tx hashes were stored as `bytes.fromhex(felt.to_hex(hash)[2:])`
+    assert felt_to_bytes(f) == bytes.fromhex(felt.to_hex(f)[2:])
+    assert felt_to_bytes(f) == value.to_bytes(32, "big")